@@ -1,77 +1,120 @@
+import functools
+import os
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from sqlalchemy import text
+
+from bitmaps import select_rows
+from charts import line_trace, payload, week_starts
+from cube import cube_aggregate, cube_covers
+from dashboard_data import (
+    aggregate_frame, aggregate_query, apply_schema, distinct_query, filter_options, finish_aggregate,
+    frame_options, frame_page, page_query, PAGE_SIZES, selection_key, version_query, where_clause
+)
+from dataset import new_dataset, refresh_dataset, refresh_due
+from rollup import has_rollup
+from section_cache import cache_stats, cached, new_cache
 
 # Configuration de la page
 st.set_page_config(page_title="Dashboard EDA Vérifications Chargement", layout="wide")
 
-# Chargement des données
+TABLE = "db_verifications_chargement"
+# "sql" : sections calculées par Postgres ; "memoire" : table chargée une fois, sections lues dans un cube de comptes
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "sql")
+# "standard" : courbes SVG complètes ; "leger" : courbes WebGL (Scattergl), réduites par LTTB au-delà de
+# POINTS_MAX points, semaines en abscisses numériques sur un axe de dates
+RENDU = os.environ.get("DASHBOARD_RENDU", "standard")
+LEGER = RENDU == "leger"
+# "1" : poids du JSON et temps de sérialisation sous chaque graphique (une sérialisation de plus par figure)
+DEBUG = os.environ.get("DASHBOARD_DEBUG") == "1"
+
+# Options des filtres : valeurs distinctes de chaque dimension, lues en base
+@st.cache_data
+def load_options(columns):
+    conn = st.connection("postgresql", type="sql")
+    return {col: filter_options(col, conn.query(distinct_query(TABLE, col), ttl="10m")[col]) for col in columns}
+
+# Colonnes de la table, proposées par la vue des données brutes
 @st.cache_data
-def load_data(query="SELECT * FROM db_verifications_chargement;"):
+def load_columns():
+    conn = st.connection("postgresql", type="sql")
+    return conn.query(f"SELECT * FROM {TABLE} LIMIT 0;", ttl="10m").columns.tolist()
+
+# Une page de lignes brutes (ORDER BY ... LIMIT / OFFSET) : seules les lignes affichées quittent Postgres
+@st.cache_data(max_entries=64)
+def load_page(columns, sort, descending, offset, limit, where="", params=None, version=None):
+    conn = st.connection("postgresql", type="sql")
+    query = text(page_query(TABLE, columns, sort, descending, where))
+    with conn.session as session:
+        df = pd.read_sql(query, session.connection(), params={**(params or {}), "page_limit": limit, "page_offset": offset})
+    return apply_schema(df)
+
+# Version des données (écrite par chaque chargement, migrations/004) : relue hors cache à chaque interaction,
+# elle renouvelle les comptes et les sections en cache dès qu'un chargement a modifié la table
+def load_version():
     conn = st.connection("postgresql", type="sql")
-    df = conn.query(query, ttl="10m")
-    # Normalisations utiles
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    if "heure_de_debut" in df.columns:
-        df["heure_de_debut"] = pd.to_datetime(df["heure_de_debut"], errors="coerce")
-    if "heure_de_fin" in df.columns:
-        df["heure_de_fin"] = pd.to_datetime(df["heure_de_fin"], errors="coerce")
-    if "lieu_de_la_verification" in df.columns:
-        df["lieu_de_la_verification"] = df["lieu_de_la_verification"].astype(str, errors="ignore")
-    if "appartenance_du_conducteur" in df.columns:
-        df["appartenance_du_conducteur"] = df["appartenance_du_conducteur"].astype(str, errors="ignore")
-    if "tournee_pda_nom_societe" in df.columns:
-        df["tournee_pda_nom_societe"] = df["tournee_pda_nom_societe"].astype(str, errors="ignore")
-    if "type_de_verification" in df.columns:
-        df["type_de_verification"] = df["type_de_verification"].astype(str, errors="ignore")
-    if "region" in df.columns:
-        df["region"] = df["region"].astype(str, errors="ignore")
-    if "presence_licence_transport" in df.columns:
-        df["presence_licence_transport"] = df["presence_licence_transport"].astype(str, errors="ignore")
-    if "numero_licence" in df.columns:
-        df["numero_licence"] = df["numero_licence"].astype(str, errors="ignore")
-    if "presentation_permis_conduire" in df.columns:
-        df["presentation_permis_conduire"] = df["presentation_permis_conduire"].astype(str, errors="ignore")
-    if "verification_liste_nominative" in df.columns:
-        df["verification_liste_nominative"] = df["verification_liste_nominative"].astype(str, errors="ignore")
-    if "anomalie" in df.columns:
-        df["anomalie"] = df["anomalie"].astype(str, errors="ignore")
-    if "anomalie_de_chargement" in df.columns:
-        df["anomalie_de_chargement"] = df["anomalie_de_chargement"].astype(str, errors="ignore")
-    if "anomalie_de_vehicule" in df.columns:
-        df["anomalie_de_vehicule"] = df["anomalie_de_vehicule"].astype(str, errors="ignore")
-    if "anomalie_suivi_de_tournee" in df.columns:
-        df["anomalie_suivi_de_tournee"] = df["anomalie_suivi_de_tournee"].astype(str, errors="ignore")
-    if "agences_antennes" in df.columns:
-        df["agences_antennes"] = df["agences_antennes"].astype(str, errors="ignore")
-    if "tournee" in df.columns:
-        df["tournee"] = df["tournee"].astype(str, errors="ignore")
-    if "pda" in df.columns:
-        df["pda"] = df["pda"].astype(str, errors="ignore")
-    if "nom_de_la_societe" in df.columns:
-        df["nom_de_la_societe"] = df["nom_de_la_societe"].astype(str, errors="ignore")
-    if "jour" in df.columns:
-        df["jour"] = df["jour"].astype(str, errors="ignore")
-    if "heure_arrondie" in df.columns:
-        df["heure_arrondie"] = df["heure_arrondie"].astype(str, errors="ignore")
-    if "is_surete" in df.columns:
-        df["is_surete"] = df["is_surete"].astype(bool, errors="ignore")
-    return df
-
-df = load_data()
+    with conn.session as session:
+        return tuple(session.execute(text(version_query(TABLE))).one())
+
+# Présence de la table pré-agrégée (migrations/002) : sans elle, les comptes sont calculés sur la table des contrôles
+@st.cache_resource(ttl="10m")
+def load_has_rollup():
+    conn = st.connection("postgresql", type="sql")
+    with conn.session as session:
+        with session.connection().connection.cursor() as cursor:
+            return has_rollup(cursor, TABLE)
+
+# Comptes par combinaison de dimensions (GROUP BY) : seuls les agrégats quittent Postgres
+@st.cache_data(max_entries=512)
+def load_aggregate(dims, where="", params=None, version=None):
+    conn = st.connection("postgresql", type="sql")
+    query = text(aggregate_query(TABLE, dims, where, rollup=load_has_rollup()))
+    with conn.session as session:
+        df = pd.read_sql(query, session.connection(), params=params)
+    return finish_aggregate(df, dims)
+
+FILTRES = ("agences_antennes", "jour", "type_de_verification", "appartenance_du_conducteur", "is_surete")
+
+# Mode mémoire : toutes les lignes, leur cube de comptes et l'index bitmap des filtres, partagés entre les
+# sessions. La table est lue entièrement une fois, puis toutes les 10 minutes seules les lignes insérées ou
+# modifiées depuis sont relues et fusionnées (dataset.refresh_dataset)
+@st.cache_resource
+def load_dataset_state():
+    return new_dataset(TABLE, FILTRES)
+
+def load_data():
+    state = load_dataset_state()
+    if refresh_due(state):
+        conn = st.connection("postgresql", type="sql")
+        with conn.session as session:
+            return refresh_dataset(state, session.connection())
+    return state["dataset"]
+
+if BACKEND == "memoire":
+    data, cube, bitmaps, version = load_data()
+    options = {col: frame_options(data, col) for col in FILTRES}
+else:
+    version = load_version()
+    options = load_options(FILTRES)
+
+# Comptes et figures des sections déjà calculés (LRU borné en mémoire), partagés entre les sessions
+@st.cache_resource
+def load_sections_cache():
+    return new_cache()
 
 # Sidebar pour filtres
 st.sidebar.title("Filtres")
 
 # Préparer les valeurs par défaut
-default_agences = sorted(df['agences_antennes'].unique()) if 'agences_antennes' in df.columns else []
-default_jours = sorted(df['jour'].unique()) if 'jour' in df.columns else []
-default_type_verif = list(df['type_de_verification'].unique()) if 'type_de_verification' in df.columns else []
-default_appartenance = list(df['appartenance_du_conducteur'].unique()) if 'appartenance_du_conducteur' in df.columns else []
-default_is_surete = list(df['is_surete'].unique()) if 'is_surete' in df.columns else [True, False]
+default_agences = options['agences_antennes']
+default_jours = options['jour']
+default_type_verif = options['type_de_verification']
+default_appartenance = options['appartenance_du_conducteur']
+default_is_surete = options['is_surete']
 
 # Initialiser session_state pour les filtres si non présents
 if 'selected_agences' not in st.session_state:
@@ -133,46 +176,90 @@ selected_is_surete = st.sidebar.multiselect(
     key='selected_is_surete'
 )
 
-# Filtrer les données
-filtered_df = df[
-    (df['agences_antennes'].isin(selected_agences)) &
-    (df['jour'].isin(selected_jours)) &
-    (df['type_de_verification'].isin(selected_type_verif)) &
-    (df['appartenance_du_conducteur'].isin(selected_appartenance)) &
-    (df['is_surete'].isin(selected_is_surete))
-]
+# Sélections de la barre latérale, appliquées côté Postgres (clause WHERE) ou au cube en mémoire
+selections = {
+    'agences_antennes': selected_agences,
+    'jour': selected_jours,
+    'type_de_verification': selected_type_verif,
+    'appartenance_du_conducteur': selected_appartenance,
+    'is_surete': selected_is_surete,
+}
+where, params = where_clause(selections, options)
+# Lignes retenues (mode mémoire), pour les sections hors du cube (heures, semaines, tournées, catégories
+# d'anomalies) : extraites à la première section qui en a besoin, une fois par exécution
+@functools.cache
+def filtered_rows():
+    return data[select_rows(bitmaps, selections)]
+
+def aggregate(dims):
+    """Nombre de contrôles et d'anomalies des lignes filtrées, par combinaison de `dims`."""
+    if BACKEND == "memoire":
+        if cube_covers(cube, dims, selections):
+            return cube_aggregate(cube, list(dims), selections)
+        return aggregate_frame(filtered_rows(), list(dims))
+    return load_aggregate(tuple(dims), where, params, version)
+
+sections_cache = load_sections_cache()
+filtres = selection_key(selections, options)
+
+def section(name, build):
+    """Comptes et figures de la section `name` : calculés par `build()` une fois par combinaison de filtres et version des données."""
+    return cached(sections_cache, (TABLE, BACKEND, RENDU, name, version, filtres), build)
+
+def plot(fig):
+    """Affiche une figure ; en mode DEBUG, avec le poids de son JSON et son temps de sérialisation."""
+    st.plotly_chart(fig, use_container_width=True)
+    if DEBUG:
+        taille, duree = payload(fig)
+        st.caption(f"Graphique : {taille / 1024:.1f} Ko, sérialisé en {duree * 1000:.1f} ms")
+
+# Sections à la demande : seules les sections ouvertes sont calculées, et ouvrir ou fermer une section
+# ne réexécute qu'elle (fragment) ; les filtres de la barre latérale réexécutent toute la page
+@st.fragment
+def lazy_section(title, name, render, ouverte=False):
+    st.header(title)
+    if st.toggle("Afficher la section", value=ouverte, key=f"section_{name}"):
+        render()
 
 # Titre principal
 st.title("Dashboard EDA - Vérifications de Chargement")
 
 # Section 1: Métriques Globales
-st.header("Métriques Globales")
-col1, col2, col3, col4 = st.columns(4)
-total_controles = len(filtered_df)
-total_anomalies = len(filtered_df[filtered_df['anomalie'] == 'Oui'])
-pourcent_anomalies = (total_anomalies / total_controles * 100) if total_controles > 0 else 0
-nb_cp = len(filtered_df[(filtered_df['appartenance_du_conducteur'] == 'COLIS PRIVE') | (filtered_df['appartenance_du_conducteur'] == 'COLIS PRIVE')])
-nb_dsp = len(filtered_df[filtered_df['appartenance_du_conducteur'] == 'DSP'])
-
-col1.metric("Total Contrôles", total_controles)
-col2.metric("Total Anomalies", total_anomalies)
-col3.metric("% Anomalies", f"{pourcent_anomalies:.2f}%")
-col4.metric("CP vs DSP", f"{nb_cp} CP / {nb_dsp} DSP")
+def build_metriques():
+    total = aggregate([]).iloc[0]
+    par_appartenance = aggregate(['appartenance_du_conducteur'])
+    nb_cp = int(par_appartenance.loc[par_appartenance['appartenance_du_conducteur'] == 'COLIS PRIVE', 'nb_controles'].sum())
+    nb_dsp = int(par_appartenance.loc[par_appartenance['appartenance_du_conducteur'] == 'DSP', 'nb_controles'].sum())
+    return int(total['nb_controles']), int(total['nb_anomalies']), total['taux_anomalies'], nb_cp, nb_dsp
+
+def render_metriques():
+    col1, col2, col3, col4 = st.columns(4)
+    total_controles, total_anomalies, pourcent_anomalies, nb_cp, nb_dsp = section('metriques', build_metriques)
+    col1.metric("Total Contrôles", total_controles)
+    col2.metric("Total Anomalies", total_anomalies)
+    col3.metric("% Anomalies", f"{pourcent_anomalies:.2f}%")
+    col4.metric("CP vs DSP", f"{nb_cp} CP / {nb_dsp} DSP")
+
+lazy_section("Métriques Globales", 'metriques', render_metriques, ouverte=True)
 
 # Section 2: Nombre de Contrôles par Site
-st.header("Nombre de Contrôles par Site")
-controles_par_site = filtered_df['agences_antennes'].value_counts().reset_index()
-controles_par_site.columns = ['Site', 'Nombre de Contrôles']
-fig_controles_site = px.bar(controles_par_site, x='Site', y='Nombre de Contrôles', title="Contrôles par Site")
-st.plotly_chart(fig_controles_site, use_container_width=True)
+def build_sites():
+    par_site = aggregate(['agences_antennes'])
+    controles_par_site = par_site.sort_values('nb_controles', ascending=False, kind='stable')[['agences_antennes', 'nb_controles']]
+    controles_par_site.columns = ['Site', 'Nombre de Contrôles']
+    return px.bar(controles_par_site, x='Site', y='Nombre de Contrôles', title="Contrôles par Site")
 
-# Section 3: Jours et Heures de Contrôles par Site
-st.header("Jours et Heures de Contrôles par Site")
-col_jour, col_heure = st.columns(2)
+def render_sites():
+    plot(section('sites', build_sites))
+
+lazy_section("Nombre de Contrôles par Site", 'sites', render_sites)
 
-# Par Jour
-with col_jour:
-    controles_par_jour_site = filtered_df.groupby(['agences_antennes', 'jour']).size().unstack().fillna(0)
+# Section 3: Jours et Heures de Contrôles par Site
+def build_heatmaps():
+    # Par Jour
+    controles_par_jour_site = aggregate(['agences_antennes', 'jour']).pivot(
+        index='agences_antennes', columns='jour', values='nb_controles'
+    ).fillna(0).astype(int)
     fig_jour = go.Figure(data=go.Heatmap(
         z=controles_par_jour_site.values,
         x=controles_par_jour_site.columns,
@@ -180,11 +267,11 @@ with col_jour:
         colorscale='Viridis'
     ))
     fig_jour.update_layout(title="Heatmap Contrôles par Jour et Site")
-    st.plotly_chart(fig_jour, use_container_width=True)
 
-# Par Heure
-with col_heure:
-    controles_par_heure_site = filtered_df.groupby(['agences_antennes', 'heure_arrondie']).size().unstack().fillna(0)
+    # Par Heure
+    controles_par_heure_site = aggregate(['agences_antennes', 'heure_arrondie']).pivot(
+        index='agences_antennes', columns='heure_arrondie', values='nb_controles'
+    ).fillna(0).astype(int)
     fig_heure = go.Figure(data=go.Heatmap(
         z=controles_par_heure_site.values,
         x=controles_par_heure_site.columns,
@@ -192,57 +279,37 @@ with col_heure:
         colorscale='Viridis'
     ))
     fig_heure.update_layout(title="Heatmap Contrôles par Heure et Site")
-    st.plotly_chart(fig_heure, use_container_width=True)
+    return fig_jour, fig_heure
 
-# Section 4: Anomalies
-st.header("Analyse des Anomalies")
-
-# Classement Sites par Anomalies
-anomalies_par_site = filtered_df[filtered_df['anomalie'] == 'Oui']['agences_antennes'].value_counts().reset_index()
-anomalies_par_site.columns = ['Site', 'Nombre d\'Anomalies']
-fig_anomalies_site = px.bar(anomalies_par_site, x='Site', y='Nombre d\'Anomalies', title="Classement Sites par Anomalies")
-st.plotly_chart(fig_anomalies_site, use_container_width=True)
-
-# % Anomalies vs Nb Contrôles
-pourcent_anomalies_site = filtered_df.groupby('agences_antennes').apply(
-    lambda x: (len(x[x['anomalie'] == 'Oui']) / len(x) * 100) if len(x) > 0 else 0
-).reset_index()
-pourcent_anomalies_site.columns = ['Site', '% Anomalies']
-pourcent_anomalies_site = pourcent_anomalies_site.sort_values('% Anomalies', ascending=False).reset_index(drop=True)
-fig_pourcent = px.bar(pourcent_anomalies_site, x='Site', y='% Anomalies', title="% Anomalies par Site")
-st.plotly_chart(fig_pourcent, use_container_width=True)
-
-# % d'Anomalies par Jour de la semaine
-if 'jour' in filtered_df.columns:
-    anomalies_par_jour = filtered_df.groupby('jour').apply(
-        lambda x: (len(x[x['anomalie'] == 'Oui']) / len(x) * 100) if len(x) > 0 else 0
-    ).reset_index(name="% Anomalies")
-    jours_fr = ['LUNDI', 'MARDI', 'MERCREDI', 'JEUDI', 'VENDREDI', 'SAMEDI', 'DIMANCHE']
-    jours_en = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    anomalies_par_jour['jour'] = anomalies_par_jour['jour'].astype(str)
-
-    def compute_sort_key(val):
-        v = val.strip().upper()
-        if v in jours_fr:
-            return jours_fr.index(v)
-        if v in jours_en:
-            return jours_en.index(v)
-        v_cap = v.capitalize()
-        if v_cap in jours_fr:
-            return jours_fr.index(v_cap)
-        try:
-            dt = pd.to_datetime(v, dayfirst=True, errors='coerce')
-            if not pd.isna(dt):
-                return dt.weekday()
-        except Exception:
-            pass
-        return 999
-
-    anomalies_par_jour['jour_sort'] = anomalies_par_jour['jour'].apply(compute_sort_key)
-    anomalies_par_jour = anomalies_par_jour.sort_values(['jour_sort', 'jour'])
-    anomalies_par_jour = anomalies_par_jour.drop(columns=['jour_sort']).reset_index(drop=True)
+def render_heatmaps():
+    col_jour, col_heure = st.columns(2)
+    fig_jour, fig_heure = section('heatmaps', build_heatmaps)
+    with col_jour:
+        plot(fig_jour)
+    with col_heure:
+        plot(fig_heure)
 
-    st.subheader("% d'Anomalies par Jour")
+lazy_section("Jours et Heures de Contrôles par Site", 'heatmaps', render_heatmaps)
+
+# Section 4: Anomalies
+def build_anomalies():
+    par_site = aggregate(['agences_antennes'])
+
+    # Classement Sites par Anomalies
+    anomalies_par_site = par_site[par_site['nb_anomalies'] > 0].sort_values('nb_anomalies', ascending=False, kind='stable')
+    anomalies_par_site = anomalies_par_site[['agences_antennes', 'nb_anomalies']]
+    anomalies_par_site.columns = ['Site', 'Nombre d\'Anomalies']
+    fig_anomalies_site = px.bar(anomalies_par_site, x='Site', y='Nombre d\'Anomalies', title="Classement Sites par Anomalies")
+
+    # % Anomalies vs Nb Contrôles
+    pourcent_anomalies_site = pd.DataFrame({'Site': par_site['agences_antennes'], '% Anomalies': par_site['taux_anomalies']})
+    pourcent_anomalies_site = pourcent_anomalies_site.sort_values('% Anomalies', ascending=False).reset_index(drop=True)
+    fig_pourcent = px.bar(pourcent_anomalies_site, x='Site', y='% Anomalies', title="% Anomalies par Site")
+
+    # % d'Anomalies par Jour de la semaine
+    # 'jour' est une catégorie ordonnée : les groupes sortent dans l'ordre lundi -> dimanche
+    par_jour = aggregate(['jour'])
+    anomalies_par_jour = pd.DataFrame({'jour': par_jour['jour'].astype(str), '% Anomalies': par_jour['taux_anomalies']})
     fig_anom_jour = px.bar(
         anomalies_par_jour,
         x='jour',
@@ -252,233 +319,297 @@ if 'jour' in filtered_df.columns:
         text='% Anomalies'
     )
     fig_anom_jour.update_traces(texttemplate='%{text:.2f}%', textposition='auto')
-    st.plotly_chart(fig_anom_jour, use_container_width=True)
+    return fig_anomalies_site, fig_pourcent, anomalies_par_jour, fig_anom_jour
+
+def render_anomalies():
+    fig_anomalies_site, fig_pourcent, anomalies_par_jour, fig_anom_jour = section('anomalies', build_anomalies)
+    plot(fig_anomalies_site)
+    plot(fig_pourcent)
+    st.subheader("% d'Anomalies par Jour")
+    plot(fig_anom_jour)
     st.dataframe(anomalies_par_jour)
 
+lazy_section("Analyse des Anomalies", 'anomalies', render_anomalies)
+
 # Nouvelle Section: Visualisation Temporelle des Anomalies
-st.header("Visualisation Temporelle des Anomalies")
-
-# Préparer les données pour la visualisation temporelle
-# Par heure
-filtered_df['heure'] = filtered_df['heure_de_debut'].dt.hour
-anomalies_par_heure = filtered_df[filtered_df['anomalie'] == 'Oui'].groupby('heure').size().reset_index(name='Nb Anomalies')
-controles_par_heure = filtered_df.groupby('heure').size().reset_index(name='Nb Contrôles')
-df_heure = pd.merge(controles_par_heure, anomalies_par_heure, on='heure', how='left').fillna(0)
-df_heure['% Anomalies'] = (df_heure['Nb Anomalies'] / df_heure['Nb Contrôles'] * 100).round(2)
-
-# Par semaine
-filtered_df['date'] = pd.to_datetime(filtered_df['date'])
-filtered_df['annee_semaine'] = filtered_df['date'].dt.strftime('%Y-W%W')
-anomalies_par_semaine = filtered_df[filtered_df['anomalie'] == 'Oui'].groupby('annee_semaine').size().reset_index(name='Nb Anomalies')
-controles_par_semaine = filtered_df.groupby('annee_semaine').size().reset_index(name='Nb Contrôles')
-df_semaine = pd.merge(controles_par_semaine, anomalies_par_semaine, on='annee_semaine', how='left').fillna(0)
-df_semaine['% Anomalies'] = (df_semaine['Nb Anomalies'] / df_semaine['Nb Contrôles'] * 100).round(2)
-
-# Graphique par heure
-st.subheader("Évolution par Heure")
-fig_heure = make_subplots(specs=[[{"secondary_y": True}]])
-fig_heure.add_trace(
-    go.Scatter(x=df_heure['heure'], y=df_heure['Nb Contrôles'], name="Nb Contrôles", line=dict(color='blue')),
-    secondary_y=False
-)
-fig_heure.add_trace(
-    go.Scatter(x=df_heure['heure'], y=df_heure['Nb Anomalies'], name="Nb Anomalies", line=dict(color='red')),
-    secondary_y=False
-)
-fig_heure.add_trace(
-    go.Scatter(x=df_heure['heure'], y=df_heure['% Anomalies'], name="% Anomalies", line=dict(color='green', dash='dash')),
-    secondary_y=True
-)
-fig_heure.update_layout(
-    title="Évolution des Contrôles et Anomalies par Heure",
-    xaxis_title="Heure de la Journée",
-    yaxis_title="Nombre de Contrôles/Anomalies",
-    legend=dict(x=0, y=1.1, orientation="h", font=dict(size=12)),
-    font=dict(size=14),
-    margin=dict(l=50, r=50, t=100, b=50),
-    xaxis=dict(tickfont=dict(size=12)),
-    yaxis=dict(tickfont=dict(size=12))
-)
-fig_heure.update_yaxes(title_text="% Anomalies", secondary_y=True, tickfont=dict(size=12))
-if not df_heure['Nb Anomalies'].empty:
-    max_anom_heure = df_heure.loc[df_heure['Nb Anomalies'].idxmax()]
-    fig_heure.add_annotation(
-        x=max_anom_heure['heure'], y=max_anom_heure['Nb Anomalies'],
-        text=f"Pic: {int(max_anom_heure['Nb Anomalies'])} anomalies",
-        showarrow=True, arrowhead=1, ax=20, ay=-30, font=dict(size=12)
+def build_temporel():
+    # Préparer les données pour la visualisation temporelle
+    # Par heure
+    df_heure = aggregate(['heure']).rename(
+        columns={'nb_controles': 'Nb Contrôles', 'nb_anomalies': 'Nb Anomalies', 'taux_anomalies': '% Anomalies'}
     )
-st.plotly_chart(fig_heure, use_container_width=True)
-st.dataframe(df_heure)
-
-# Graphique par semaine
-st.subheader("Évolution par Semaine")
-fig_semaine = make_subplots(specs=[[{"secondary_y": True}]])
-fig_semaine.add_trace(
-    go.Scatter(x=df_semaine['annee_semaine'], y=df_semaine['Nb Contrôles'], name="Nb Contrôles", line=dict(color='blue')),
-    secondary_y=False
-)
-fig_semaine.add_trace(
-    go.Scatter(x=df_semaine['annee_semaine'], y=df_semaine['Nb Anomalies'], name="Nb Anomalies", line=dict(color='red')),
-    secondary_y=False
-)
-fig_semaine.add_trace(
-    go.Scatter(x=df_semaine['annee_semaine'], y=df_semaine['% Anomalies'], name="% Anomalies", line=dict(color='green', dash='dash')),
-    secondary_y=True
-)
-fig_semaine.update_layout(
-    title="Évolution des Contrôles et Anomalies par Semaine",
-    xaxis_title="Semaine (Année-Semaine)",
-    yaxis_title="Nombre de Contrôles/Anomalies",
-    legend=dict(x=0, y=1.1, orientation="h", font=dict(size=12)),
-    font=dict(size=14),
-    margin=dict(l=50, r=50, t=100, b=50),
-    xaxis=dict(tickfont=dict(size=12), tickangle=45),
-    yaxis=dict(tickfont=dict(size=12))
-)
-fig_semaine.update_yaxes(title_text="% Anomalies", secondary_y=True, tickfont=dict(size=12))
-if not df_semaine['Nb Anomalies'].empty:
-    max_anom_semaine = df_semaine.loc[df_semaine['Nb Anomalies'].idxmax()]
-    fig_semaine.add_annotation(
-        x=max_anom_semaine['annee_semaine'], y=max_anom_semaine['Nb Anomalies'],
-        text=f"Pic: {int(max_anom_semaine['Nb Anomalies'])} anomalies",
-        showarrow=True, arrowhead=1, ax=20, ay=-30, font=dict(size=12)
+    df_heure['% Anomalies'] = df_heure['% Anomalies'].round(2)
+
+    # Par semaine
+    df_semaine = aggregate(['annee_semaine']).rename(
+        columns={'nb_controles': 'Nb Contrôles', 'nb_anomalies': 'Nb Anomalies', 'taux_anomalies': '% Anomalies'}
+    )
+    df_semaine['% Anomalies'] = df_semaine['% Anomalies'].round(2)
+    # Rendu allégé : premier jour de chaque semaine, en abscisse numérique d'un axe de dates
+    x_semaine = week_starts(df_semaine['annee_semaine']) if LEGER else df_semaine['annee_semaine'].to_numpy()
+
+    # Graphique par heure
+    fig_heure = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_heure.add_trace(
+        line_trace(df_heure['heure'], df_heure['Nb Contrôles'], leger=LEGER, name="Nb Contrôles", line=dict(color='blue')),
+        secondary_y=False
+    )
+    fig_heure.add_trace(
+        line_trace(df_heure['heure'], df_heure['Nb Anomalies'], leger=LEGER, name="Nb Anomalies", line=dict(color='red')),
+        secondary_y=False
+    )
+    fig_heure.add_trace(
+        line_trace(df_heure['heure'], df_heure['% Anomalies'], leger=LEGER, name="% Anomalies", line=dict(color='green', dash='dash')),
+        secondary_y=True
+    )
+    fig_heure.update_layout(
+        title="Évolution des Contrôles et Anomalies par Heure",
+        xaxis_title="Heure de la Journée",
+        yaxis_title="Nombre de Contrôles/Anomalies",
+        legend=dict(x=0, y=1.1, orientation="h", font=dict(size=12)),
+        font=dict(size=14),
+        margin=dict(l=50, r=50, t=100, b=50),
+        xaxis=dict(tickfont=dict(size=12)),
+        yaxis=dict(tickfont=dict(size=12))
+    )
+    fig_heure.update_yaxes(title_text="% Anomalies", secondary_y=True, tickfont=dict(size=12))
+    if not df_heure['Nb Anomalies'].empty:
+        max_anom_heure = df_heure.loc[df_heure['Nb Anomalies'].idxmax()]
+        fig_heure.add_annotation(
+            x=max_anom_heure['heure'], y=max_anom_heure['Nb Anomalies'],
+            text=f"Pic: {int(max_anom_heure['Nb Anomalies'])} anomalies",
+            showarrow=True, arrowhead=1, ax=20, ay=-30, font=dict(size=12)
+        )
+
+    # Graphique par semaine
+    fig_semaine = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_semaine.add_trace(
+        line_trace(x_semaine, df_semaine['Nb Contrôles'], leger=LEGER, name="Nb Contrôles", line=dict(color='blue')),
+        secondary_y=False
+    )
+    fig_semaine.add_trace(
+        line_trace(x_semaine, df_semaine['Nb Anomalies'], leger=LEGER, name="Nb Anomalies", line=dict(color='red')),
+        secondary_y=False
     )
-st.plotly_chart(fig_semaine, use_container_width=True)
-st.dataframe(df_semaine)
+    fig_semaine.add_trace(
+        line_trace(x_semaine, df_semaine['% Anomalies'], leger=LEGER, name="% Anomalies", line=dict(color='green', dash='dash')),
+        secondary_y=True
+    )
+    fig_semaine.update_layout(
+        title="Évolution des Contrôles et Anomalies par Semaine",
+        xaxis_title="Semaine (Année-Semaine)",
+        yaxis_title="Nombre de Contrôles/Anomalies",
+        legend=dict(x=0, y=1.1, orientation="h", font=dict(size=12)),
+        font=dict(size=14),
+        margin=dict(l=50, r=50, t=100, b=50),
+        xaxis=dict(tickfont=dict(size=12), tickangle=45),
+        yaxis=dict(tickfont=dict(size=12))
+    )
+    fig_semaine.update_yaxes(title_text="% Anomalies", secondary_y=True, tickfont=dict(size=12))
+    if LEGER:
+        fig_semaine.update_xaxes(type="date", tickformat="%Y-W%W", hoverformat="%Y-W%W")
+    if not df_semaine['Nb Anomalies'].empty:
+        max_anom_semaine = df_semaine.loc[df_semaine['Nb Anomalies'].idxmax()]
+        fig_semaine.add_annotation(
+            x=x_semaine[df_semaine['Nb Anomalies'].idxmax()], y=max_anom_semaine['Nb Anomalies'],
+            text=f"Pic: {int(max_anom_semaine['Nb Anomalies'])} anomalies",
+            showarrow=True, arrowhead=1, ax=20, ay=-30, font=dict(size=12)
+        )
+    return df_heure, fig_heure, df_semaine, fig_semaine
+
+def render_temporel():
+    df_heure, fig_heure, df_semaine, fig_semaine = section('temporel', build_temporel)
+    st.subheader("Évolution par Heure")
+    plot(fig_heure)
+    st.dataframe(df_heure)
+    st.subheader("Évolution par Semaine")
+    plot(fig_semaine)
+    st.dataframe(df_semaine)
+
+lazy_section("Visualisation Temporelle des Anomalies", 'temporel', render_temporel)
 
 # Section 5: Types de Vérifications et Anomalies Spécifiques
-st.header("Types de Vérifications et Anomalies")
-col_verif, col_anomalie = st.columns(2)
-
-# Nb Contrôles Avant/Après Chargement
-with col_verif:
-    verif_type = filtered_df['type_de_verification'].value_counts().reset_index()
+def build_types():
+    # Nb Contrôles Avant/Après Chargement
+    verif_type = aggregate(['type_de_verification']).sort_values('nb_controles', ascending=False, kind='stable')
+    verif_type = verif_type[['type_de_verification', 'nb_controles']]
     verif_type.columns = ['Type', 'Nombre']
     fig_verif = px.pie(verif_type, values='Nombre', names='Type', title="Répartition Types de Vérifications")
-    st.plotly_chart(fig_verif, use_container_width=True)
 
-# Anomalies par Type (Chargement, Véhicule, Suivi)
-with col_anomalie:
+    # Anomalies par Type (Chargement, Véhicule, Suivi)
     fig_anom = make_subplots(rows=1, cols=3, subplot_titles=('Anomalies Chargement', 'Anomalies Véhicule', 'Anomalies Suivi'))
-    if 'anomalie_de_chargement' in filtered_df.columns:
-        anom_charg = filtered_df['anomalie_de_chargement'].dropna().astype(str)
-        anom_charg = anom_charg[anom_charg.str.strip().str.lower() != 'none']
-        anom_charg = anom_charg[anom_charg.str.strip() != '']
-        anom_charg = anom_charg.value_counts().head(5)
-    else:
-        anom_charg = pd.Series(dtype=int)
+    anom_charg = aggregate(['anomalie_de_chargement']).set_index('anomalie_de_chargement')['nb_controles'].sort_values(ascending=False, kind='stable')
+    anom_charg = anom_charg[~anom_charg.index.astype(str).str.strip().str.lower().isin(['none', ''])].head(5)
     fig_anom.add_trace(go.Bar(x=anom_charg.index, y=anom_charg.values), row=1, col=1)
 
-    if 'anomalie_de_vehicule' in filtered_df.columns:
-        anom_veh = filtered_df['anomalie_de_vehicule'].dropna().astype(str)
-        anom_veh = anom_veh[anom_veh.str.strip().str.lower() != 'none']
-        anom_veh = anom_veh[anom_veh.str.strip() != '']
-        anom_veh = anom_veh.value_counts().head(5)
-    else:
-        anom_veh = pd.Series(dtype=int)
+    anom_veh = aggregate(['anomalie_de_vehicule']).set_index('anomalie_de_vehicule')['nb_controles'].sort_values(ascending=False, kind='stable')
+    anom_veh = anom_veh[~anom_veh.index.astype(str).str.strip().str.lower().isin(['none', ''])].head(5)
     fig_anom.add_trace(go.Bar(x=anom_veh.index, y=anom_veh.values), row=1, col=2)
 
-    if 'anomalie_suivi_de_tournee' in filtered_df.columns:
-        anom_suivi = filtered_df['anomalie_suivi_de_tournee'].dropna().astype(str)
-        anom_suivi = anom_suivi[anom_suivi.str.strip().str.lower() != 'none']
-        anom_suivi = anom_suivi[anom_suivi.str.strip() != '']
-        anom_suivi = anom_suivi.value_counts().head(5)
-    else:
-        anom_suivi = pd.Series(dtype=int)
+    anom_suivi = aggregate(['anomalie_suivi_de_tournee']).set_index('anomalie_suivi_de_tournee')['nb_controles'].sort_values(ascending=False, kind='stable')
+    anom_suivi = anom_suivi[~anom_suivi.index.astype(str).str.strip().str.lower().isin(['none', ''])].head(5)
     fig_anom.add_trace(go.Bar(x=anom_suivi.index, y=anom_suivi.values), row=1, col=3)
     fig_anom.update_layout(height=400, title_text="Top Anomalies par Catégorie")
-    st.plotly_chart(fig_anom, use_container_width=True)
+    return fig_verif, fig_anom
+
+def render_types():
+    col_verif, col_anomalie = st.columns(2)
+    fig_verif, fig_anom = section('types', build_types)
+    with col_verif:
+        plot(fig_verif)
+    with col_anomalie:
+        plot(fig_anom)
+
+lazy_section("Types de Vérifications et Anomalies", 'types', render_types)
 
 # Nouvelle Section: Analyse des Vérifications Documentaires
-st.header("Analyse des Vérifications Documentaires")
-col_licence, col_permis, col_liste = st.columns(3)
-
-# Présence de la licence de transport
-with col_licence:
-    if 'presence_licence_transport' in filtered_df.columns:
-        licence_counts = filtered_df['presence_licence_transport'].value_counts().reset_index()
-        licence_counts.columns = ['Présence Licence', 'Nombre']
-        fig_licence = px.pie(licence_counts, values='Nombre', names='Présence Licence', 
-                             title="Présence de la Licence de Transport")
-        st.plotly_chart(fig_licence, use_container_width=True)
-
-# Présentation du permis de conduire
-with col_permis:
-    if 'presentation_permis_conduire' in filtered_df.columns:
-        permis_counts = filtered_df['presentation_permis_conduire'].value_counts().reset_index()
-        permis_counts.columns = ['Permis Présenté', 'Nombre']
-        fig_permis = px.pie(permis_counts, values='Nombre', names='Permis Présenté', 
-                            title="Présentation du Permis de Conduire")
-        st.plotly_chart(fig_permis, use_container_width=True)
-
-# Vérification de la liste nominative
-with col_liste:
-    if 'verification_liste_nominative' in filtered_df.columns:
-        liste_counts = filtered_df['verification_liste_nominative'].value_counts().reset_index()
-        liste_counts.columns = ['Liste Nominative Vérifiée', 'Nombre']
-        fig_liste = px.pie(liste_counts, values='Nombre', names='Liste Nominative Vérifiée', 
-                           title="Vérification Liste Nominative")
-        st.plotly_chart(fig_liste, use_container_width=True)
+def build_documentaires():
+    # Présence de la licence de transport
+    licence_counts = aggregate(['presence_licence_transport']).sort_values('nb_controles', ascending=False, kind='stable')
+    licence_counts = licence_counts[['presence_licence_transport', 'nb_controles']]
+    licence_counts.columns = ['Présence Licence', 'Nombre']
+    fig_licence = px.pie(licence_counts, values='Nombre', names='Présence Licence', 
+                         title="Présence de la Licence de Transport")
+
+    # Présentation du permis de conduire
+    permis_counts = aggregate(['presentation_permis_conduire']).sort_values('nb_controles', ascending=False, kind='stable')
+    permis_counts = permis_counts[['presentation_permis_conduire', 'nb_controles']]
+    permis_counts.columns = ['Permis Présenté', 'Nombre']
+    fig_permis = px.pie(permis_counts, values='Nombre', names='Permis Présenté', 
+                        title="Présentation du Permis de Conduire")
+
+    # Vérification de la liste nominative
+    liste_counts = aggregate(['verification_liste_nominative']).sort_values('nb_controles', ascending=False, kind='stable')
+    liste_counts = liste_counts[['verification_liste_nominative', 'nb_controles']]
+    liste_counts.columns = ['Liste Nominative Vérifiée', 'Nombre']
+    fig_liste = px.pie(liste_counts, values='Nombre', names='Liste Nominative Vérifiée', 
+                       title="Vérification Liste Nominative")
+    return fig_licence, fig_permis, fig_liste
+
+def render_documentaires():
+    col_licence, col_permis, col_liste = st.columns(3)
+    fig_licence, fig_permis, fig_liste = section('documentaires', build_documentaires)
+    with col_licence:
+        plot(fig_licence)
+    with col_permis:
+        plot(fig_permis)
+    with col_liste:
+        plot(fig_liste)
+
+lazy_section("Analyse des Vérifications Documentaires", 'documentaires', render_documentaires)
 
 # Section 6: Anomalies CP vs DSP
-st.header("Anomalies par Appartenance (CP / DSP)")
-anom_cp_dsp = filtered_df.groupby(['appartenance_du_conducteur', 'anomalie']).size().unstack(fill_value=0)
-for col in ['Oui', 'Non']:
-    if col not in anom_cp_dsp.columns:
-        anom_cp_dsp[col] = 0
-pourcent_anomalies = filtered_df.groupby('appartenance_du_conducteur').apply(
-    lambda x: (len(x[x['anomalie'] == 'Oui']) / len(x) * 100) if len(x) > 0 else 0
-).reset_index(name='% Anomalies')
-fig_cp_dsp = px.bar(
-    anom_cp_dsp.reset_index(),
-    x='appartenance_du_conducteur',
-    y=['Oui', 'Non'],
-    barmode='stack',
-    title="Anomalies CP vs DSP (Volume)",
-    labels={'value': 'Nombre de Contrôles', 'appartenance_du_conducteur': 'Appartenance'}
-)
-st.plotly_chart(fig_cp_dsp, use_container_width=True)
-st.subheader("Pourcentage d'Anomalies par Appartenance")
-fig_pourcent_anomalies = px.bar(
-    pourcent_anomalies,
-    x='appartenance_du_conducteur',
-    y='% Anomalies',
-    title="% d'Anomalies par Appartenance",
-    labels={'appartenance_du_conducteur': 'Appartenance', '% Anomalies': 'Pourcentage d\'Anomalies'},
-    text='% Anomalies'
-)
-fig_pourcent_anomalies.update_traces(texttemplate='%{text:.2f}%', textposition='auto')
-st.plotly_chart(fig_pourcent_anomalies, use_container_width=True)
-st.dataframe(pourcent_anomalies)
+def build_cp_dsp():
+    par_appartenance = aggregate(['appartenance_du_conducteur'])
+    anom_cp_dsp = pd.DataFrame({
+        'appartenance_du_conducteur': par_appartenance['appartenance_du_conducteur'],
+        'Oui': par_appartenance['nb_anomalies'],
+        'Non': par_appartenance['nb_controles'] - par_appartenance['nb_anomalies'],
+    })
+    pourcent_anomalies = pd.DataFrame({
+        'appartenance_du_conducteur': par_appartenance['appartenance_du_conducteur'],
+        '% Anomalies': par_appartenance['taux_anomalies'],
+    })
+    fig_cp_dsp = px.bar(
+        anom_cp_dsp,
+        x='appartenance_du_conducteur',
+        y=['Oui', 'Non'],
+        barmode='stack',
+        title="Anomalies CP vs DSP (Volume)",
+        labels={'value': 'Nombre de Contrôles', 'appartenance_du_conducteur': 'Appartenance'}
+    )
+    fig_pourcent_anomalies = px.bar(
+        pourcent_anomalies,
+        x='appartenance_du_conducteur',
+        y='% Anomalies',
+        title="% d'Anomalies par Appartenance",
+        labels={'appartenance_du_conducteur': 'Appartenance', '% Anomalies': 'Pourcentage d\'Anomalies'},
+        text='% Anomalies'
+    )
+    fig_pourcent_anomalies.update_traces(texttemplate='%{text:.2f}%', textposition='auto')
+    return fig_cp_dsp, pourcent_anomalies, fig_pourcent_anomalies
+
+def render_cp_dsp():
+    fig_cp_dsp, pourcent_anomalies, fig_pourcent_anomalies = section('cp_dsp', build_cp_dsp)
+    plot(fig_cp_dsp)
+    st.subheader("Pourcentage d'Anomalies par Appartenance")
+    plot(fig_pourcent_anomalies)
+    st.dataframe(pourcent_anomalies)
+
+lazy_section("Anomalies par Appartenance (CP / DSP)", 'cp_dsp', render_cp_dsp)
 
 # Section 7: Analyse du Top 20 des Tournées avec le plus d'Anomalies Positives
-st.header("Analyse du Top 20 des Tournées avec le plus d'Anomalies Positives")
-top_tournees_anomalies = filtered_df[filtered_df['anomalie'] == 'Oui'].groupby('tournee').size().reset_index(name='Nb Anomalies')
-total_par_tournee = filtered_df.groupby('tournee').size().reset_index(name='Nb Contrôles')
-top_tournees = pd.merge(top_tournees_anomalies, total_par_tournee, on='tournee', how='left')
-top_tournees['% Anomalies'] = (top_tournees['Nb Anomalies'] / top_tournees['Nb Contrôles'] * 100).round(2)
-top_tournees = top_tournees.sort_values('Nb Anomalies', ascending=False).head(20)
-top_tournees['tournee'] = top_tournees['tournee'].astype(str)
-agences_par_tournee = filtered_df.groupby('tournee')['agences_antennes'].unique().reset_index()
-def join_agences(arr):
-    try:
-        lst = [str(x) for x in arr if pd.notna(x)]
-        return '; '.join(sorted(set(lst)))
-    except Exception:
-        return ''
-agences_par_tournee['Agences'] = agences_par_tournee['agences_antennes'].apply(join_agences)
-agences_par_tournee = agences_par_tournee.drop(columns=['agences_antennes'])
-top_tournees = pd.merge(top_tournees, agences_par_tournee, on='tournee', how='left')
-
-st.subheader("Détails du Top 20")
-st.dataframe(top_tournees)
-if not top_tournees_anomalies.empty:
-    max_anom = top_tournees_anomalies.iloc[0]
-    st.write(f"La tournée avec le plus d'anomalies est la {max_anom['tournee']} avec {max_anom['Nb Anomalies']} anomalies.")
-    st.write("Ces tournées représentent les zones prioritaires pour des investigations supplémentaires ou des améliorations.")
-else:
-    st.write("Aucune anomalie détectée dans les données filtrées.")
+def build_tournees():
+    # Comptes et taux par tournée, et liste des agences concernées (comptes par tournée et agence)
+    par_tournee = aggregate(['tournee'])
+    agences_par_tournee = aggregate(['tournee', 'agences_antennes']).groupby('tournee', observed=True)['agences_antennes'].agg(
+        lambda agences: '; '.join(sorted(set(agences.astype(str))))
+    )
+    top_tournees = par_tournee.loc[par_tournee['nb_anomalies'] > 0, ['tournee', 'nb_anomalies', 'nb_controles', 'taux_anomalies']]
+    top_tournees.columns = ['tournee', 'Nb Anomalies', 'Nb Contrôles', '% Anomalies']
+    top_tournees['% Anomalies'] = top_tournees['% Anomalies'].round(2)
+    top_tournees = top_tournees.sort_values('Nb Anomalies', ascending=False, kind='stable').head(20)
+    top_tournees['Agences'] = top_tournees['tournee'].map(agences_par_tournee).astype(str)
+    top_tournees['tournee'] = top_tournees['tournee'].astype(str)
+    return top_tournees.reset_index(drop=True)
+
+def render_tournees():
+    top_tournees = section('tournees', build_tournees)
+    st.subheader("Détails du Top 20")
+    st.dataframe(top_tournees)
+    if not top_tournees.empty:
+        max_anom = top_tournees.iloc[0]
+        st.write(f"La tournée avec le plus d'anomalies est la {max_anom['tournee']} avec {max_anom['Nb Anomalies']} anomalies.")
+        st.write("Ces tournées représentent les zones prioritaires pour des investigations supplémentaires ou des améliorations.")
+    else:
+        st.write("Aucune anomalie détectée dans les données filtrées.")
+
+lazy_section("Analyse du Top 20 des Tournées avec le plus d'Anomalies Positives", 'tournees', render_tournees)
+
+# Affichage des données brutes (optionnel), page par page : seule la page affichée est lue en base
+# ou extraite des lignes en mémoire, et changer de page, de tri ou de colonnes ne réexécute que la vue
+@st.fragment
+def render_donnees():
+    if not st.checkbox("Afficher les Données Filtrées"):
+        return
+    total = int(aggregate([]).iloc[0]['nb_controles'])
+    colonnes = data.columns.tolist() if BACKEND == "memoire" else load_columns()
+    st.subheader(f"{total} lignes filtrées")
+    if total == 0:
+        return
+
+    col1, col2, col3 = st.columns(3)
+    tri = col1.selectbox("Trier par", colonnes, index=colonnes.index('id') if 'id' in colonnes else 0, key='donnees_tri')
+    taille = col2.selectbox("Lignes par page", PAGE_SIZES, key='donnees_taille')
+    decroissant = col3.toggle("Ordre décroissant", key='donnees_decroissant')
+    affichees = st.multiselect("Colonnes affichées", colonnes, default=colonnes, key='donnees_colonnes')
+
+    pages = -(-total // taille)
+    # Une page au-delà de la dernière (filtres ou taille de page modifiés) revient à la dernière
+    if st.session_state.get('donnees_page', 1) > pages:
+        st.session_state['donnees_page'] = pages
+    page = st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, key='donnees_page')
+    if not affichees:
+        st.write("Aucune colonne sélectionnée.")
+        return
+
+    offset = (page - 1) * taille
+    if BACKEND == "memoire":
+        lignes = frame_page(filtered_rows(), affichees, tri, decroissant, offset, taille)
+    else:
+        lignes = load_page(tuple(affichees), tri, decroissant, offset, taille, where, params, version)
+    st.caption(f"Lignes {offset + 1} à {offset + len(lignes)} sur {total}")
+    st.dataframe(lignes, hide_index=True)
+
+render_donnees()
 
-# Affichage des données brutes (optionnel)
-if st.checkbox("Afficher les Données Filtrées"):
-    st.dataframe(filtered_df)
\ No newline at end of file
+# Efficacité du cache des sections (toutes sessions confondues)
+stats = cache_stats(sections_cache)
+st.sidebar.caption(
+    f"Cache des sections : {stats['hits']} réutilisations, {stats['misses']} calculs "
+    f"({stats['hit_rate']:.0%}), {stats['entries']} entrées, {stats['bytes'] / 2**20:.1f} Mo"
+)
+if BACKEND == "memoire":
+    # Coût du dernier chargement des lignes en mémoire : toute la table, ou les seules lignes écrites depuis
+    state = load_dataset_state()
+    st.sidebar.caption(f"Données : {state['lignes_lues']} lignes lues au dernier chargement ({state['mode']})")
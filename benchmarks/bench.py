@@ -0,0 +1,210 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import parse_cache
+import preprocessing
+import preprocessing2
+from benchmarks.synthetic import generate_workbooks
+from ingestion import iter_excel_chunks
+from preprocessing_utils import (
+    arrondir_demi_heure, derive_temporal_features, extract_tournee_pda_societe, extract_vehicle_info,
+    parse_vehicle_info, split_tournee_pda_societe
+)
+
+ROWS = [10_000, 100_000, 1_000_000]
+# Les versions ligne à ligne (références) sont trop lentes au-delà : elles sont ignorées
+REFERENCE_MAX_ROWS = 100_000
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def _cold_parse_cache():
+    """Vide le dictionnaire des valeurs découpées (mémoire et disque) : mesure à froid."""
+    parse_cache._caches.clear()
+    shutil.rmtree(parse_cache.PARSE_CACHE_DIR, ignore_errors=True)
+
+
+def _chain(stages):
+    def run(df):
+        for _, stage, _ in stages:
+            df = stage(df)
+        return df
+    return run
+
+
+def measure(func, setup, repeats=3, memory=True):
+    """
+    Mesure une fonction sur des entrées fraîches, préparées par `setup()` hors chronométrage.
+
+    Returns:
+        dict: Temps mural et CPU (meilleur des `repeats` passages), temps de chaque passage,
+            et pic de mémoire allouée (passage supplémentaire sous tracemalloc).
+    """
+    walls, cpus = [], []
+    for _ in range(repeats):
+        args = setup()
+        wall, cpu = time.perf_counter(), time.process_time()
+        func(*args)
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+
+    peak = None
+    if memory:
+        args = setup()
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1] - base
+        finally:
+            tracemalloc.stop()
+    return {"wall_s": min(walls), "cpu_s": min(cpus), "wall_s_all": walls, "peak_bytes": peak}
+
+
+def benchmarks(paths, rows, reference_max_rows=REFERENCE_MAX_ROWS):
+    """
+    Liste des mesures pour une taille de jeu : (nom, fonction, préparation des entrées, répétitions).
+
+    Les entrées de chaque étape sont calculées une fois en exécutant les étapes précédentes.
+    """
+    read_chunks = lambda: [
+        chunk for path in paths["chargement"] for chunk in iter_excel_chunks(path, skiprows=[1])
+    ]
+    raw = pd.concat(read_chunks(), ignore_index=True)
+    documentaire = pd.concat(
+        [chunk for path in paths["documentaire"] for chunk in iter_excel_chunks(path)], ignore_index=True
+    )
+    vehicules = raw["Type de véhicule / immatriculation"]
+    tournees = raw["Tournée / PDA / Nom de la société si DSP"]
+    debuts = pd.to_datetime(raw["Heure de début"])
+
+    # Schéma commun de preprocessing2 : documentaire puis chargement, comme CLASSEURS
+    classeurs = [(paths["documentaire"][0], {}, False), (paths["chargement"][0], {"skiprows": [1]}, True)]
+    columns = preprocessing2.common_columns(classeurs)
+    combined = pd.concat([
+        preprocessing2.align_chunk(documentaire, False, columns, -1),
+        preprocessing2.align_chunk(raw, True, columns, -1),
+    ], ignore_index=True)
+
+    fresh = lambda df: (lambda: (_cold_parse_cache(), (df.copy(),))[1])
+    items = [
+        ("read", lambda: len(read_chunks()), lambda: (), 1),
+        ("preprocessing", preprocessing.preprocessing, fresh(raw), 3),
+        ("preprocessing2", preprocessing2.preprocessing, fresh(combined), 3),
+    ]
+    for module in (preprocessing, preprocessing2):
+        df = combined if module is preprocessing2 else raw
+        for i, (name, stage, _) in enumerate(module.STAGES):
+            _cold_parse_cache()
+            stage_input = _chain(module.STAGES[:i])(df.copy())
+            items.append((f"{module.__name__}.{name}", stage, fresh(stage_input), 3))
+            if name == "parse":
+                # Dictionnaire des valeurs découpées déjà rempli : cas des exécutions quotidiennes
+                warm = lambda s=stage_input, stage=stage: (stage(s.copy()), (s.copy(),))[1]
+                items.append((f"{module.__name__}.{name}_warm", stage, warm, 3))
+
+    renamed = documentaire.rename(columns=preprocessing2.rename_dict)
+    items += [
+        ("rename_columns", preprocessing2.rename_columns, lambda: (renamed.copy(),), 3),
+        ("parse_vehicle_info", parse_vehicle_info, lambda: (vehicules,), 3),
+        ("split_tournee_pda_societe", split_tournee_pda_societe, lambda: (tournees,), 3),
+        ("derive_temporal_features", derive_temporal_features, lambda: (debuts,), 3),
+    ]
+    if rows <= reference_max_rows:
+        items += [
+            ("extract_vehicle_info", lambda s: s.apply(lambda x: pd.Series(extract_vehicle_info(x))),
+             lambda: (vehicules,), 1),
+            ("extract_tournee_pda_societe", lambda s: s.apply(lambda x: pd.Series(extract_tournee_pda_societe(x))),
+             lambda: (tournees,), 1),
+            ("arrondir_demi_heure", lambda s: s.apply(arrondir_demi_heure), lambda: (debuts.dropna(),), 1),
+        ]
+    return items
+
+
+def run(rows=ROWS, workdir=".bench_data", seed=0, repeats=3, memory=True, only=None,
+        reference_max_rows=REFERENCE_MAX_ROWS):
+    """
+    Exécute la suite sur des classeurs synthétiques de chaque taille.
+
+    Les classeurs sont générés une fois dans `workdir` puis réutilisés ; les caches du
+    preprocessing (dictionnaire des valeurs découpées) sont isolés dans ce répertoire.
+
+    Returns:
+        dict: {"meta": contexte de la mesure, "results": une entrée par mesure et par taille}.
+    """
+    commit, dirty = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit, "dirty": dirty,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "seed": seed, "repeats": repeats,
+        },
+        "results": [],
+    }
+    workdir = os.path.abspath(workdir)
+    cwd = os.getcwd()
+    for n in rows:
+        paths = generate_workbooks(os.path.join(workdir, f"{n}-{seed}"), n, seed)
+        os.chdir(os.path.join(workdir, f"{n}-{seed}"))
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                items = benchmarks(paths, n, reference_max_rows)
+            for name, func, setup, default_repeats in items:
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = measure(func, setup, min(repeats, default_repeats), memory)
+                result = {"name": name, "rows": n, **result, "rows_per_s": n / result["wall_s"] if result["wall_s"] else None}
+                report["results"].append(result)
+                peak = f"{result['peak_bytes'] / 2**20:9.1f} MB" if result["peak_bytes"] is not None else ""
+                print(f"{name:<35} {n:>9} lignes {result['wall_s']:9.3f} s {result['cpu_s']:9.3f} s CPU {peak}")
+        finally:
+            _cold_parse_cache()
+            os.chdir(cwd)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Mesure le preprocessing sur des classeurs synthétiques (temps et pic de mémoire par étape)."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS,
+                        help="tailles des jeux (lignes de chargement), jusqu'à 5 000 000")
+    parser.add_argument("--workdir", default=".bench_data", help="répertoire des classeurs générés")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="passages par mesure (le meilleur est retenu)")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic de mémoire (tracemalloc)")
+    parser.add_argument("--only", nargs="+", help="ne garder que les mesures dont le nom contient l'un de ces motifs")
+    parser.add_argument("--reference-max-rows", type=int, default=REFERENCE_MAX_ROWS,
+                        help="taille maximale pour les versions ligne à ligne")
+    parser.add_argument("--output", help="fichier JSON des résultats (par défaut benchmark-<commit>.json)")
+    args = parser.parse_args()
+
+    report = run(args.rows, args.workdir, args.seed, args.repeats, not args.no_memory, args.only,
+                 args.reference_max_rows)
+    output = args.output or f"benchmark-{(report['meta']['commit'] or 'local')[:10]}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {output}")
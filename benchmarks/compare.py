@@ -0,0 +1,63 @@
+import argparse
+import json
+import sys
+
+# Écart relatif toléré avant de signaler une régression (10 %)
+THRESHOLD = 0.10
+# En dessous de cet écart absolu, les variations de temps sont du bruit de mesure
+MIN_SECONDS = 0.005
+
+
+def load_results(path):
+    """Résultats d'un fichier produit par benchmarks.bench, indexés par (mesure, lignes)."""
+    with open(path) as f:
+        report = json.load(f)
+    return report["meta"], {(r["name"], r["rows"]): r for r in report["results"]}
+
+
+def compare(base, head, threshold=THRESHOLD, min_seconds=MIN_SECONDS):
+    """
+    Compare deux séries de mesures, mesure par mesure et taille par taille.
+
+    Returns:
+        list: Une ligne par mesure commune : (mesure, lignes, temps avant, temps après,
+            rapport des temps, rapport des pics de mémoire, régression).
+    """
+    rows = []
+    for key in sorted(base.keys() & head.keys(), key=lambda k: (k[1], k[0])):
+        before, after = base[key], head[key]
+        ratio = after["wall_s"] / before["wall_s"] if before["wall_s"] else float("inf")
+        memory = None
+        if before.get("peak_bytes") and after.get("peak_bytes") is not None:
+            memory = after["peak_bytes"] / before["peak_bytes"]
+        regression = (
+            (ratio > 1 + threshold and after["wall_s"] - before["wall_s"] > min_seconds)
+            or (memory is not None and memory > 1 + threshold)
+        )
+        rows.append((key[0], key[1], before["wall_s"], after["wall_s"], ratio, memory, regression))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare deux fichiers de résultats de benchmarks.bench (code de sortie 1 en cas de régression)."
+    )
+    parser.add_argument("base", help="résultats de référence (par exemple ceux de la branche principale)")
+    parser.add_argument("head", help="résultats à comparer")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="écart relatif toléré, en temps comme en mémoire")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS,
+                        help="écart de temps absolu en dessous duquel il n'y a pas de régression")
+    args = parser.parse_args()
+
+    base_meta, base = load_results(args.base)
+    head_meta, head = load_results(args.head)
+    print(f"avant : {base_meta.get('commit')}  après : {head_meta.get('commit')}")
+    regressions = 0
+    for name, n, before, after, ratio, memory, regression in compare(base, head, args.threshold, args.min_seconds):
+        memory = f"{memory:6.2f}x" if memory is not None else "      -"
+        flag = "RÉGRESSION" if regression else ""
+        print(f"{name:<35} {n:>9} {before:9.3f} s -> {after:9.3f} s {ratio:6.2f}x  mémoire {memory}  {flag}")
+        regressions += regression
+    print(f"{regressions} régression(s)")
+    sys.exit(1 if regressions else 0)
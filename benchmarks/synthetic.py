@@ -0,0 +1,223 @@
+import argparse
+import os
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+# Une feuille Excel contient au plus 1 048 576 lignes : au-delà, un classeur par tranche
+MAX_ROWS_PER_WORKBOOK = 1_000_000
+
+AGENCES = {
+    "REGION EST": ["STRASBOURG", "METZ", "NANCY", "REIMS", "DIJON", "MULHOUSE"],
+    "REGION NORD": ["LILLE", "AMIENS", "ROUEN", "ARRAS", "VALENCIENNES", "DUNKERQUE"],
+    "REGION OUEST": ["RENNES", "NANTES", "BREST", "ANGERS", "LE MANS", "TOURS"],
+    "REGION SUD": ["MARSEILLE", "NICE", "TOULOUSE", "MONTPELLIER", "BORDEAUX", "PERPIGNAN"],
+}
+AGENCE_COLUMNS = {
+    "REGION EST": "AGENCES/ ANTENNES REGION EST",
+    "REGION NORD": "AGENCES/ANTENNES REGION NORD",
+    "REGION OUEST": "AGENCES/ANTENNES REGION OUEST",
+    "REGION SUD": "AGENCES/ANTENNES REGION SUD",
+}
+
+# En-têtes longs du classeur documentaire (avec \xa0 et retours à la ligne, comme les vrais)
+LICENCE = ("Présence dans le véhicule de la copie numérotée de la licence de transport.\xa0\n"
+           "Hypothèse de la non présentation : Contactez le\xa0gérant de l'entreprise de Transport "
+           "afin de l'en informer.\xa0\nC'est à lui de ")
+PERMIS = ("Présentation du Permis de Conduire\nHypothèse de la non présentation du permis de conduire :\xa0 "
+          "Contactez le\xa0gérant de l'entreprise de Transport\xa0\xa0afin de l'en informer.\n"
+          "C'est à lui de gérer\xa0la situation.")
+LISTE_NOMINATIVE = ("Vérification Liste nominative des salariés affectés à la prestation\n"
+                    "La personne en charge du contrôle à quai doit se munir de la liste nominative "
+                    "fournie par le gérant de l'entreprise de Transport et ")
+
+CHARGEMENT_HEADERS = [
+    "Id", "Heure de début", "Heure de fin", "Adresse de messagerie", "Nom", "Date",
+    "Nom de la personne en charge de la vérification", "Lieu de la vérification",
+    "Appartenance du conducteur", "Tournée / PDA / Nom de la société si DSP",
+    "Type de véhicule / immatriculation", "Type de vérification", "REGION", *AGENCE_COLUMNS.values(),
+    "ANOMALIE", "ANOMALIE DE CHARGEMENT\xa0", "ANOMALIE DE VEHICULE", "ANOMALIE SUIVI DE TOURNEE",
+    "Matière dangereuse", "Commentaires ( N° de colis...)", "Commentaires", "Commentaires divers\xa0",
+]
+DOCUMENTAIRE_HEADERS = [
+    "Id", "Heure de début", "Heure de fin", "Adresse de messagerie", "Nom", "Date du contrôle",
+    "Personne en charge de la vérification", "Lieu de la vérification", "Appartenance du conducteur",
+    "Tournée / PDA / Nom de la société si besoin", "Type de véhicule / Immatriculation",
+    "Type de vérification", "REGION", *AGENCE_COLUMNS.values(),
+    LICENCE, "Numéro de la licence", PERMIS, LISTE_NOMINATIVE, "ANOMALIE", "ANOMALIE DE VEHICULE",
+]
+
+
+def _vocabulary(rng):
+    """Valeurs récurrentes : tournées, véhicules et contrôleurs reviennent d'un jour à l'autre."""
+    societes = [f"TRANSPORTS {name}" for name in
+                ["MARTIN", "EXPRESS 59", "DU SUD", "RAPIDE", "LEGRAND", "ATLANTIQUE", "DUBOIS & FILS"]]
+    tournees = []
+    for _ in range(3000):
+        numero = str(rng.integers(1, 999))
+        pda = chr(65 + rng.integers(0, 26))
+        societe = societes[rng.integers(0, len(societes))]
+        form = rng.integers(0, 7)
+        tournees.append([
+            f"{numero} {pda}", f"{numero}{pda}", f"{numero}/{pda}", f"{numero} / {pda} / {societe}",
+            f"{numero.zfill(4)} {pda.lower()}  {societe.lower()}", numero, societe
+        ][form])
+
+    types = ["Fourgon", "VL", "Camion", "Trafic", "Master", "Kangoo", "Jumper", "Porteur 20m3"]
+    vehicules = []
+    for _ in range(5000):
+        letters = "".join(chr(65 + c) for c in rng.integers(0, 26, 4))
+        immat = f"{letters[:2]}-{rng.integers(100, 999)}-{letters[2:]}"
+        kind = types[rng.integers(0, len(types))]
+        form = rng.integers(0, 6)
+        vehicules.append([
+            f"{kind} / {immat}", f"{kind.lower()} {immat.replace('-', ' ').lower()}", immat.replace("-", ""),
+            f"{immat} /", kind, f"  {kind}/ {immat} "
+        ][form])
+
+    prenoms = ["Jean", "Marie", "Ali", "Sophie", "Luc", "Nadia", "Paul", "Inès", "Hugo", "Léa"]
+    noms = ["Martin", "Bernard", "Dubois", "Petit", "Durand", "Leroy", "Moreau", "Simon", "Laurent", "Roux"]
+    controleurs = [f"{p} {n}-{m}" for p in prenoms for n in noms for m in noms[:2]]
+    return np.array(tournees, dtype=object), np.array(vehicules, dtype=object), np.array(controleurs, dtype=object)
+
+
+def synthetic_frame(n_rows, seed=0, documentaire=False, start="2024-01-01", days=30):
+    """
+    Construit `n_rows` contrôles synthétiques réalistes, aux en-têtes des vrais classeurs.
+
+    Args:
+        n_rows (int): Nombre de lignes.
+        seed (int): Graine du générateur (même graine, mêmes données).
+        documentaire (bool): En-têtes et valeurs du classeur de vérification documentaire.
+        start (str): Premier jour des contrôles.
+        days (int): Nombre de jours couverts.
+
+    Returns:
+        pd.DataFrame: Colonnes dans l'ordre des vrais classeurs.
+    """
+    rng = np.random.default_rng(seed)
+    tournees, vehicules, controleurs = _vocabulary(np.random.default_rng(0))
+    # Répartition de Zipf : quelques tournées et véhicules reviennent très souvent
+    zipf = lambda size: np.minimum(rng.zipf(1.3, n_rows), size) - 1
+
+    debut = (pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n_rows), unit="D")
+             + pd.to_timedelta(rng.integers(5 * 3600, 21 * 3600, n_rows), unit="s"))
+    fin = debut + pd.to_timedelta(rng.integers(120, 1800, n_rows), unit="s")
+    regions = np.array(list(AGENCES), dtype=object)[rng.integers(0, len(AGENCES), n_rows)]
+    anomalie = rng.random(n_rows) < 0.15
+    controleur = controleurs[rng.integers(0, len(controleurs), n_rows)]
+
+    data = {
+        "Id": np.arange(1, n_rows + 1),
+        "Heure de début": debut,
+        "Heure de fin": fin,
+        "Adresse de messagerie": np.char.add(np.char.lower(controleur.astype(str)), "@colisprive.fr").astype(object),
+        "Nom": controleur,
+        "Date": debut.normalize(),
+        "Nom de la personne en charge de la vérification": controleurs[rng.integers(0, len(controleurs), n_rows)],
+        "Lieu de la vérification": rng.choice(np.array(["Quai", "Parking", "Agence", "Hub"], dtype=object), n_rows),
+        "Appartenance du conducteur": rng.choice(
+            np.array(["COLIS PRIVE", "COLIS PRIVE LIVRAISON", "DSP"], dtype=object), n_rows, p=[0.3, 0.2, 0.5]),
+        "Tournée / PDA / Nom de la société si DSP": np.where(rng.random(n_rows) < 0.03, None, tournees[zipf(len(tournees))]),
+        "Type de véhicule / immatriculation": np.where(rng.random(n_rows) < 0.03, None, vehicules[zipf(len(vehicules))]),
+        "Type de vérification": rng.choice(
+            np.array(["AVANT CHARGEMENT", "APRES CHARGEMENT", "INOPINEE"], dtype=object), n_rows),
+        "REGION": regions,
+    }
+    for region, column in AGENCE_COLUMNS.items():
+        agences = np.array([f"{region[7:]} - {a}" for a in AGENCES[region]], dtype=object)
+        data[column] = np.where(regions == region, agences[rng.integers(0, len(agences), n_rows)], None)
+
+    oui, non = ("Oui", "Non") if documentaire else ("OUI", "NON")
+    if documentaire:
+        data["Date du contrôle"] = data.pop("Date")
+        data["Personne en charge de la vérification"] = data.pop("Nom de la personne en charge de la vérification")
+        data["Tournée / PDA / Nom de la société si besoin"] = data.pop("Tournée / PDA / Nom de la société si DSP")
+        data["Type de véhicule / Immatriculation"] = data.pop("Type de véhicule / immatriculation")
+        data[LICENCE] = np.where(rng.random(n_rows) < 0.9, oui, non)
+        data["Numéro de la licence"] = np.char.add("LIC-", rng.integers(10000, 99999, n_rows).astype(str)).astype(object)
+        data[PERMIS] = np.where(rng.random(n_rows) < 0.95, oui, non)
+        data[LISTE_NOMINATIVE] = np.where(rng.random(n_rows) < 0.9, oui, non)
+        data["ANOMALIE"] = np.where(anomalie, oui, non)
+        data["ANOMALIE DE VEHICULE"] = np.where(anomalie & (rng.random(n_rows) < 0.5), "Pneus usés", None)
+        return pd.DataFrame(data)[DOCUMENTAIRE_HEADERS]
+
+    data["ANOMALIE"] = np.where(anomalie, oui, non)
+    data["ANOMALIE DE CHARGEMENT\xa0"] = np.where(
+        anomalie, rng.choice(np.array(["Colis non chargé", "Colis mal rangé", None], dtype=object), n_rows), None)
+    data["ANOMALIE DE VEHICULE"] = np.where(anomalie & (rng.random(n_rows) < 0.3), "Véhicule sale", None)
+    data["ANOMALIE SUIVI DE TOURNEE"] = np.where(anomalie & (rng.random(n_rows) < 0.2), "Tournée non scannée", None)
+    data["Matière dangereuse"] = np.where(rng.random(n_rows) < 0.01, "OUI", None)
+    data["Commentaires ( N° de colis...)"] = np.where(anomalie & (rng.random(n_rows) < 0.5), "Colis 123456789", None)
+    data["Commentaires"] = None
+    data["Commentaires divers\xa0"] = np.where(rng.random(n_rows) < 0.05, "RAS", None)
+    return pd.DataFrame(data)[CHARGEMENT_HEADERS]
+
+
+def write_workbook(df, path, instructions_row=False, chunksize=50_000):
+    """
+    Écrit un DataFrame dans un classeur Excel en flux (openpyxl en écriture seule).
+
+    Args:
+        df (pd.DataFrame): Données à écrire, en-têtes compris.
+        path (str): Chemin du classeur.
+        instructions_row (bool): Ajouter sous l'en-tête la ligne de consignes des vrais classeurs
+            de concordance de chargement (ignorée à la lecture, skiprows=[1]).
+        chunksize (int): Nombre de lignes converties à la fois.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    if instructions_row:
+        sheet.append(["Merci de remplir une ligne par contrôle"] + [None] * (len(df.columns) - 1))
+    for start in range(0, len(df), chunksize):
+        part = df.iloc[start:start + chunksize].astype(object)
+        part = part.where(part.notna(), None)
+        for row in part.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def generate_workbooks(directory, n_rows, seed=0, documentaire_ratio=0.25):
+    """
+    Génère des classeurs de concordance synthétiques dans `directory`.
+
+    Jusqu'à MAX_ROWS_PER_WORKBOOK lignes, les deux classeurs portent les noms des vrais
+    fichiers ; au-delà, le classeur de chargement est découpé en classeurs mensuels
+    (voir preprocessing2.py --inputs). Les classeurs déjà générés sont réutilisés.
+
+    Returns:
+        dict: Chemins des classeurs, {"chargement": [...], "documentaire": [...]}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {"chargement": [], "documentaire": []}
+    for kind, total, documentaire in [
+        ("chargement", n_rows, False),
+        ("documentaire", max(1, int(n_rows * documentaire_ratio)), True),
+    ]:
+        parts = -(-total // MAX_ROWS_PER_WORKBOOK)
+        base = ("VERIFICATION DE CONCORDANCE DE CHARGEMENT\xa0VERIFICATION DOCUMENTAIRE - ETAT DES VEHICULES"
+                if documentaire else "VERIFICATION DE CONCORDANCE DE CHARGEMENT")
+        for part in range(parts):
+            rows = min(MAX_ROWS_PER_WORKBOOK, total - part * MAX_ROWS_PER_WORKBOOK)
+            month = pd.Timestamp("2024-01-01") + pd.DateOffset(months=part)
+            name = f"{base}.xlsx" if parts == 1 else f"{base} {month:%Y-%m}.xlsx"
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                df = synthetic_frame(rows, seed=seed + part + (1000 if documentaire else 0),
+                                     documentaire=documentaire, start=f"{month:%Y-%m-%d}")
+                write_workbook(df, path, instructions_row=not documentaire)
+            paths[kind].append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génère des classeurs de concordance synthétiques.")
+    parser.add_argument("directory", help="répertoire de sortie")
+    parser.add_argument("--rows", type=int, default=10_000, help="nombre de contrôles de chargement")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for kind, paths in generate_workbooks(args.directory, args.rows, args.seed).items():
+        for path in paths:
+            print(f"{kind} : {path}")
@@ -0,0 +1,129 @@
+import collections
+import threading
+
+import numpy as np
+import pandas as pd
+
+from dashboard_data import selection_key
+
+# Nombre de sélections de lignes gardées par index (les combinaisons de filtres les plus récentes)
+SELECTIONS_CACHE_SIZE = 32
+
+
+def _codes(values):
+    """Codes (-1 pour une valeur manquante) et libellés d'une dimension de filtre."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values)
+
+
+def build_bitmaps(df, columns):
+    """
+    Index bitmap des dimensions de filtre : pour chaque valeur présente, l'ensemble de ses
+    lignes en bits compactés (np.packbits, 1 bit par ligne).
+
+    Construit une fois par jeu de données chargé ; select_rows() combine ensuite les bitmaps
+    par OU (valeurs d'une dimension) et ET (entre dimensions).
+
+    Args:
+        df (pd.DataFrame): Lignes au schéma de apply_schema.
+        columns (Sequence[str]): Dimensions de filtre (catégories ou booléens).
+
+    Returns:
+        dict: Index à passer à select_rows.
+    """
+    bitmaps = {}
+    for column in columns:
+        codes, labels = _codes(df[column])
+        # Valeurs présentes comptées en une passe ; une seule comparaison par valeur présente
+        presentes = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(labels))).tolist()
+        bitmaps[column] = {labels[i]: np.packbits(codes == i) for i in presentes}
+    return {
+        "rows": len(df),
+        "bitmaps": bitmaps,
+        "selections": collections.OrderedDict(),
+        "lock": threading.Lock(),
+    }
+
+
+def update_bitmaps(index, df, positions):
+    """
+    Index bitmap de lignes fusionnées par dashboard_data.merge_rows, à partir de celui des
+    lignes précédentes : seuls les bits des lignes écrites (remplacées à leur position ou
+    ajoutées à la fin) sont effacés puis posés selon leurs nouvelles valeurs.
+
+    L'index précédent reste utilisé par les sessions en cours : chaque bitmap est copié (une
+    copie d'octets, 1 bit par ligne), les valeurs de la table ne sont pas relues.
+
+    Args:
+        index (dict): Résultat de build_bitmaps (ou update_bitmaps) sur les lignes précédentes.
+        df (pd.DataFrame): Lignes fusionnées.
+        positions (np.ndarray): Positions des lignes écrites dans df.
+
+    Returns:
+        dict: Index à passer à select_rows.
+    """
+    nbytes = (len(df) + 7) // 8
+    # np.packbits range le premier bit d'un octet dans son bit de poids fort
+    octets, bits = positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8)
+    bitmaps = {}
+    for column, previous in index["bitmaps"].items():
+        updated = {}
+        for label, bitmap in previous.items():
+            bitmap = np.concatenate([bitmap, np.zeros(nbytes - len(bitmap), dtype=np.uint8)])
+            np.bitwise_and.at(bitmap, octets, ~bits)
+            updated[label] = bitmap
+        codes, labels = _codes(df[column].iloc[positions])
+        for i in np.unique(codes[codes >= 0]):
+            if labels[i] not in updated:
+                updated[labels[i]] = np.zeros(nbytes, dtype=np.uint8)
+            np.bitwise_or.at(updated[labels[i]], octets[codes == i], bits[codes == i])
+        # Une valeur dont toutes les lignes ont changé sort de l'index, comme dans build_bitmaps
+        bitmaps[column] = {label: bitmap for label, bitmap in updated.items() if bitmap.any()}
+    return {
+        "rows": len(df),
+        "bitmaps": bitmaps,
+        "selections": collections.OrderedDict(),
+        "lock": threading.Lock(),
+    }
+
+
+def select_rows(index, selections):
+    """
+    Lignes retenues par les sélections de la barre latérale ; pendant en mémoire de where_clause.
+
+    Une dimension dont toutes les valeurs sont sélectionnées n'est pas filtrée. Le résultat
+    est mis en cache par combinaison de filtres (SELECTIONS_CACHE_SIZE dernières combinaisons).
+
+    Args:
+        index (dict): Résultat de build_bitmaps.
+        selections (dict): Colonne -> valeurs sélectionnées.
+
+    Returns:
+        np.ndarray: Masque booléen des lignes (lecture seule, partagé entre les appels).
+    """
+    bitmaps = index["bitmaps"]
+    key = selection_key(selections, bitmaps)
+    with index["lock"]:
+        if key in index["selections"]:
+            index["selections"].move_to_end(key)
+            return index["selections"][key]
+
+    nbytes = (index["rows"] + 7) // 8
+    bits = np.full(nbytes, 0xFF, dtype=np.uint8)
+    for column, selected in selections.items():
+        if set(selected) >= bitmaps[column].keys():
+            continue
+        union = np.zeros(nbytes, dtype=np.uint8)
+        for value in selected:
+            if value in bitmaps[column]:
+                np.bitwise_or(union, bitmaps[column][value], out=union)
+        np.bitwise_and(bits, union, out=bits)
+    mask = np.unpackbits(bits, count=index["rows"]).view(bool)
+    mask.flags.writeable = False
+
+    with index["lock"]:
+        index["selections"][key] = mask
+        if len(index["selections"]) > SELECTIONS_CACHE_SIZE:
+            index["selections"].popitem(last=False)
+    return mask
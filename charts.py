@@ -0,0 +1,98 @@
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# Nombre de points au-delà duquel une courbe est réduite par lttb() en rendu allégé : deux ans de
+# semaines. La courbe par heure (24 points) n'est jamais réduite, la courbe par semaine (52 points
+# par an) l'est sur une période de plus de deux ans
+POINTS_MAX = 104
+
+# Poids et temps de sérialisation déjà mesurés, par figure (retirés quand la figure est libérée)
+_payloads = {}
+_lock = threading.Lock()
+
+
+def lttb(x, y, threshold=POINTS_MAX):
+    """
+    Indices des points gardés par Largest-Triangle-Three-Buckets pour tracer une série de
+    `threshold` points au plus, de même allure que la série complète.
+
+    Le premier et le dernier point sont gardés ; les autres sont répartis en seaux de taille
+    égale, dans chacun desquels est gardé le point formant le plus grand triangle avec le
+    point gardé précédent et la moyenne du seau suivant (pics et creux conservés).
+
+    Args:
+        x (array-like): Abscisses numériques, croissantes.
+        y (array-like): Ordonnées.
+        threshold (int): Nombre de points maximal.
+
+    Returns:
+        np.ndarray: Indices croissants des points gardés (tous si la série est assez courte).
+    """
+    n = len(x)
+    if n <= threshold or threshold < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    # Bornes des threshold - 2 seaux entre le premier et le dernier point
+    bornes = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.intp) + 1
+    bornes[-1] = n - 1
+
+    kept = np.empty(threshold, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    for i in range(threshold - 2):
+        debut, fin = bornes[i], bornes[i + 1]
+        suivant = slice(bornes[i + 1], bornes[i + 2]) if i + 2 < len(bornes) else slice(n - 1, n)
+        moyenne_x, moyenne_y = x[suivant].mean(), y[suivant].mean()
+        ax, ay = x[kept[i]], y[kept[i]]
+        aires = np.abs((ax - moyenne_x) * (y[debut:fin] - ay) - (ax - x[debut:fin]) * (moyenne_y - ay))
+        kept[i + 1] = debut + int(aires.argmax())
+    return kept
+
+
+def line_trace(x, y, leger=False, **kwargs):
+    """
+    Courbe d'un graphique temporel : go.Scatter, ou en rendu allégé go.Scattergl (WebGL) sur la
+    série réduite à POINTS_MAX points par lttb(), dont les abscisses doivent être numériques.
+    """
+    if not leger:
+        return go.Scatter(x=x, y=y, **kwargs)
+    x, y = np.asarray(x), np.asarray(y)
+    kept = lttb(x, y)
+    return go.Scattergl(x=x[kept], y=y[kept], **kwargs)
+
+
+def week_starts(labels):
+    """
+    Premier jour des semaines 'AAAA-Wss' (numérotation de strftime('%Y-W%W'), voir
+    DERIVED_DIMENSIONS) en millisecondes depuis 1970 : abscisses numériques d'un axe de dates,
+    encodées en binaire dans le JSON des figures plutôt qu'en texte. La semaine 00 commence
+    au 1er janvier.
+    """
+    labels = pd.Series(labels, dtype=str)
+    lundis = pd.to_datetime(labels + "-1", format="%Y-W%W-%w")
+    debuts = np.maximum(lundis, pd.to_datetime(labels.str[:4], format="%Y"))
+    return debuts.to_numpy(dtype="datetime64[ms]").astype(np.int64).astype(float)
+
+
+def payload(fig):
+    """
+    Poids (octets) et temps de sérialisation (secondes) du JSON d'une figure Plotly, tel
+    qu'envoyé au navigateur. Mesurés une fois par figure : une figure en cache n'est pas
+    resérialisée pour être mesurée.
+    """
+    key = id(fig)
+    with _lock:
+        if key in _payloads:
+            return _payloads[key]
+    debut = time.perf_counter()
+    taille = len(pio.to_json(fig, validate=False))
+    mesure = (taille, time.perf_counter() - debut)
+    with _lock:
+        _payloads[key] = mesure
+    weakref.finalize(fig, _payloads.pop, key, None)
+    return mesure
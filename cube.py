@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from dashboard_data import METRICS, finish_aggregate
+
+# Axes du cube de comptes, suivis d'un dernier axe anomalie (0 = non, 1 = oui)
+CUBE_DIMENSIONS = [
+    "agences_antennes", "jour", "heure_arrondie", "type_de_verification", "appartenance_du_conducteur", "is_surete",
+]
+# Taille maximale du cube (cellules int32) : au-delà, les sections agrègent les lignes
+MAX_CUBE_CELLS = 50_000_000
+
+
+def _axis(values):
+    """Codes et libellés d'un axe ; les valeurs manquantes ont leur propre case, en dernier."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy(dtype=np.intp)
+        labels = list(values.cat.categories)
+    else:
+        codes, labels = pd.factorize(values, sort=True)
+        labels = list(labels)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(np.nan)
+    return codes, labels
+
+
+def build_cube(df, dims=CUBE_DIMENSIONS, max_cells=MAX_CUBE_CELLS):
+    """
+    Réduit les lignes chargées en un cube dense de comptes : une case par combinaison des
+    valeurs de `dims` et de 'anomalie'.
+
+    Le cube est construit une fois par jeu de données (un np.bincount) ; chaque section s'en
+    déduit ensuite par sélection d'indices et somme sur les axes (cube_aggregate), quel que
+    soit le nombre de lignes.
+
+    Args:
+        df (pd.DataFrame): Lignes au schéma de apply_schema.
+        dims (Sequence[str]): Dimensions du cube (celles absentes de df sont ignorées).
+        max_cells (int): Nombre maximal de cases.
+
+    Returns:
+        dict: {"counts": np.ndarray int32, "axes": {dimension: libellés}}, ou None si le cube
+            dépasserait `max_cells` cases.
+    """
+    dims = [dim for dim in dims if dim in df.columns]
+    axes, codes = {}, []
+    for dim in dims:
+        dim_codes, axes[dim] = _axis(df[dim])
+        codes.append(dim_codes)
+    codes.append(df["anomalie"].to_numpy(dtype=np.intp))
+    shape = tuple(len(labels) for labels in axes.values()) + (2,)
+    if np.prod(shape, dtype=np.int64) > max_cells:
+        return None
+
+    flat = np.ravel_multi_index(codes, shape)
+    counts = np.bincount(flat, minlength=int(np.prod(shape))).astype(np.int32).reshape(shape)
+    return {"counts": counts, "axes": axes}
+
+
+def update_cube(cube, removed, added):
+    """
+    Met à jour les comptes du cube après une lecture incrémentale : les anciennes versions des
+    lignes remplacées sont décomptées et les lignes lues ajoutées, sans relire les autres lignes.
+
+    Le cube d'origine n'est pas modifié (il peut être lu par d'autres sessions).
+
+    Args:
+        cube (dict): Résultat de build_cube.
+        removed (pd.DataFrame): Lignes retirées (merge_rows).
+        added (pd.DataFrame): Lignes ajoutées, au schéma de apply_schema.
+
+    Returns:
+        dict: Nouveau cube, ou None si une valeur ajoutée n'a pas de case (le cube est à reconstruire).
+    """
+    counts = cube["counts"].copy()
+    flat_counts = counts.reshape(-1)
+    for rows, sign in ((removed, -1), (added, 1)):
+        if rows.empty:
+            continue
+        codes = [pd.Index(labels).get_indexer(rows[dim]) for dim, labels in cube["axes"].items()]
+        codes.append(rows["anomalie"].to_numpy(dtype=np.intp))
+        if any((dim_codes < 0).any() for dim_codes in codes):
+            return None
+        np.add.at(flat_counts, np.ravel_multi_index(codes, counts.shape), sign)
+    return {"counts": counts, "axes": cube["axes"]}
+
+
+def cube_covers(cube, dims, selections):
+    """Indique si le cube suffit à une section : dimensions et filtres sont tous des axes du cube."""
+    return cube is not None and all(dim in cube["axes"] for dim in list(dims) + list(selections))
+
+
+def cube_aggregate(cube, dims, selections):
+    """
+    Comptes par combinaison de `dims` des lignes retenues par `selections`, lus dans le cube.
+
+    Chaque filtre est une sélection d'indices sur son axe (aucune si toutes les valeurs sont
+    retenues) ; les autres axes sont sommés.
+
+    Args:
+        cube (dict): Résultat de build_cube.
+        dims (Sequence[str]): Axes du cube à garder.
+        selections (dict): Axe -> valeurs retenues.
+
+    Returns:
+        pd.DataFrame: Même format que aggregate_frame (combinaisons vides retirées).
+    """
+    counts, axes = cube["counts"], cube["axes"]
+    names = list(axes)
+    labels = dict(axes)
+    for dim, selected in selections.items():
+        axis = names.index(dim)
+        positions = pd.Index(axes[dim]).get_indexer(list(selected))
+        positions = np.sort(positions[positions >= 0])
+        if len(positions) < counts.shape[axis]:
+            counts = np.take(counts, positions, axis=axis)
+            labels[dim] = [axes[dim][i] for i in positions]
+
+    # Sommer les axes non demandés, puis ranger les axes gardés dans l'ordre de `dims`
+    summed = tuple(i for i, name in enumerate(names) if name not in dims)
+    counts = counts.sum(axis=summed, dtype=np.int64)
+    kept = [name for name in names if name in dims]
+    counts = np.moveaxis(counts, [kept.index(dim) for dim in dims], range(len(dims)))
+
+    flat = counts.reshape(-1, 2)
+    result = pd.DataFrame({"nb_controles": flat.sum(axis=1), "nb_anomalies": flat[:, 1]})
+    if dims:
+        index = pd.MultiIndex.from_product([labels[dim] for dim in dims], names=list(dims))
+        result = pd.concat([index.to_frame(index=False), result], axis=1)
+        result = result[result["nb_controles"] > 0]
+        for dim in dims:
+            result[dim] = result[dim].astype(object)
+    return finish_aggregate(result[list(dims) + METRICS], list(dims))
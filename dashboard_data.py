@@ -0,0 +1,490 @@
+import numpy as np
+import pandas as pd
+
+from preprocessing_utils import CRENEAUX_DEMI_HEURE, JOURS_FR
+
+# Schéma du DataFrame des tableaux de bord, appliqué une fois au chargement :
+# les colonnes absentes sont ignorées, les colonnes non listées sont laissées telles quelles
+DASHBOARD_TIMESTAMPS = ["date", "heure_de_debut", "heure_de_fin"]
+DASHBOARD_BOOLEANS = ["anomalie", "is_surete"]
+# Dimensions des filtres : catégories où NULL devient le libellé NON_RENSEIGNE
+DASHBOARD_DIMENSIONS = ["agences_antennes", "type_de_verification", "appartenance_du_conducteur"]
+# Colonnes peu variées : catégories (NULL reste manquant)
+DASHBOARD_CATEGORIES = [
+    "lieu_de_la_verification", "region", "tournee_pda_nom_societe", "tournee", "pda", "nom_de_la_societe",
+    "anomalie_de_chargement", "anomalie_de_vehicule", "anomalie_suivi_de_tournee",
+    "presence_licence_transport", "numero_licence", "presentation_permis_conduire",
+    "verification_liste_nominative",
+]
+# Catégories ordonnées dont les codes (int8) suivent l'ordre naturel : lundi -> dimanche, 00:00 -> 23:30
+DASHBOARD_ORDERED = {"jour": JOURS_FR, "heure_arrondie": CRENEAUX_DEMI_HEURE}
+
+NON_RENSEIGNE = "NON RENSEIGNÉ"
+# Valeurs texte lues comme vraies dans les colonnes booléennes ('OUI' / 'Oui', 'True'...)
+VALEURS_VRAIES = {"OUI", "TRUE", "T", "1"}
+
+
+def _labels(values):
+    """Valeurs distinctes d'une colonne en texte, avec les codes de chaque ligne (-1 si NULL)."""
+    codes, uniques = pd.factorize(values)
+    return codes, pd.Index(uniques).astype(str)
+
+
+def to_boolean(values):
+    """Colonne booléenne stricte : vrai pour True / 'OUI' / 'Oui' / 'True', faux sinon (NULL compris)."""
+    if values.dtype == bool:
+        return values
+    codes, labels = _labels(values)
+    vrais = np.append(labels.str.strip().str.upper().isin(VALEURS_VRAIES), False)
+    return pd.Series(vrais[codes], index=values.index, name=values.name)
+
+
+def to_category(values, fill=None):
+    """Catégorie des valeurs en texte ; les NULL prennent le libellé `fill` s'il est donné."""
+    values = values.astype("category")
+    if values.cat.categories.dtype != object:
+        values = values.cat.rename_categories(values.cat.categories.astype(str))
+    if fill is not None and values.isna().any():
+        if fill not in values.cat.categories:
+            values = values.cat.add_categories([fill])
+        values = values.fillna(fill)
+    return values
+
+
+def to_ordered(values, order, fill=None):
+    """
+    Catégorie ordonnée selon `order`, reconnue sans tenir compte de la casse ni des espaces.
+
+    Les libellés gardent la casse des données ('LUNDI' ou 'Lundi') ; les valeurs hors de
+    `order` sont conservées, placées après, et les NULL prennent le libellé `fill` s'il est donné.
+
+    Args:
+        values (pd.Series): Colonne brute (texte ou datetime.time).
+        order (Sequence[str]): Libellés dans l'ordre naturel.
+        fill (str, optional): Libellé des valeurs manquantes.
+
+    Returns:
+        pd.Series: Catégorie ordonnée (codes int8).
+    """
+    codes, labels = _labels(values)
+    keys = labels.str.strip().str.upper()
+    reference = pd.Index([o.upper() for o in order])
+    positions = reference.get_indexer(keys)
+
+    present = labels[positions >= 0]
+    casse = str.upper if len(present) and present.str.isupper().all() else (lambda o: o)
+    categories = [casse(o) for o in order] + sorted(labels[positions < 0])
+    manquant = -1
+    if fill is not None and (codes < 0).any():
+        categories.append(fill)
+        manquant = len(categories) - 1
+
+    # Code de chaque valeur distincte dans `categories`, puis de chaque ligne
+    inconnues = pd.Index(categories).get_indexer(labels)
+    mapping = np.where(positions >= 0, positions, inconnues)
+    mapping = np.append(mapping, manquant)
+    return pd.Series(
+        pd.Categorical.from_codes(mapping[codes], categories=categories, ordered=True),
+        index=values.index, name=values.name,
+    )
+
+
+def apply_schema(df):
+    """
+    Convertit le DataFrame lu en base vers le schéma compact des tableaux de bord.
+
+    Dates en datetime64, 'anomalie' et 'is_surete' en booléens, colonnes peu variées en
+    catégories, 'jour' et 'heure_arrondie' en catégories ordonnées (codes int8). Les NULL des
+    dimensions de filtre deviennent NON_RENSEIGNE plutôt que le texte 'None'.
+
+    Args:
+        df (pd.DataFrame): Résultat brut de la requête.
+
+    Returns:
+        pd.DataFrame: Le même DataFrame, converti sur place.
+    """
+    for col in df.columns:
+        if col in DASHBOARD_TIMESTAMPS:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif col in DASHBOARD_BOOLEANS:
+            df[col] = to_boolean(df[col])
+        elif col in DASHBOARD_DIMENSIONS:
+            df[col] = to_category(df[col], fill=NON_RENSEIGNE)
+        elif col in DASHBOARD_CATEGORIES:
+            df[col] = to_category(df[col])
+        elif col in DASHBOARD_ORDERED:
+            df[col] = to_ordered(df[col], DASHBOARD_ORDERED[col], fill=NON_RENSEIGNE if col == "jour" else None)
+    return df
+
+
+def non_vides(counts):
+    """Comptes d'une catégorie sans les modalités absentes de la sélection (value_counts garde les zéros)."""
+    return counts[counts > 0]
+
+
+def distinct_query(table, column):
+    """Requête des valeurs distinctes d'une dimension de filtre."""
+    return f"SELECT DISTINCT {column} FROM {table};"
+
+
+def filter_options(column, values):
+    """
+    Options d'un filtre de la barre latérale, à partir des valeurs distinctes lues en base.
+
+    Les valeurs sont gardées telles qu'en base (elles sont renvoyées à where_clause), en
+    types Python ; NULL devient NON_RENSEIGNE (faux pour un booléen). Les jours sont triés
+    du lundi au dimanche, les autres valeurs par ordre alphabétique.
+    """
+    if column in DASHBOARD_BOOLEANS:
+        return sorted(set(to_boolean(values).tolist()), reverse=True)
+    present = sorted(values.dropna().astype(str).unique().tolist())
+    if column in DASHBOARD_ORDERED:
+        ordre = [o.upper() for o in DASHBOARD_ORDERED[column]]
+        rang = {o: i for i, o in enumerate(ordre)}
+        present.sort(key=lambda v: rang.get(v.strip().upper(), len(ordre)))
+    if values.isna().any():
+        present.append(NON_RENSEIGNE)
+    return present
+
+
+def where_clause(selections, options):
+    """
+    Clause WHERE paramétrée correspondant aux sélections de la barre latérale.
+
+    Une dimension dont toutes les options sont sélectionnées n'est pas filtrée ; sinon sa
+    condition porte sur la colonne brute (col = ANY(:col)), ce qui laisse Postgres utiliser
+    les index de migrations/. NON_RENSEIGNE sélectionne les NULL ; un booléen NULL compte comme faux.
+
+    Args:
+        selections (dict): Colonne -> valeurs sélectionnées.
+        options (dict): Colonne -> toutes les options (filter_options).
+
+    Returns:
+        tuple: (clause SQL, commençant par " WHERE" ou vide, paramètres nommés).
+    """
+    conditions, params = [], {}
+    for column, selected in selections.items():
+        if set(selected) >= set(options[column]):
+            continue
+        values = [value for value in selected if value != NON_RENSEIGNE]
+        params[column] = values
+        if column in DASHBOARD_BOOLEANS:
+            conditions.append(f"coalesce({column}, false) = ANY(:{column})")
+        elif NON_RENSEIGNE in selected:
+            conditions.append(f"({column} = ANY(:{column}) OR {column} IS NULL)")
+        else:
+            conditions.append(f"{column} = ANY(:{column})")
+    if not conditions:
+        return "", {}
+    return " WHERE " + " AND ".join(conditions), params
+
+
+def selection_key(selections, options):
+    """
+    Clé normalisée d'une combinaison de filtres, pour les caches : dimensions réellement
+    filtrées (pas toutes leurs options sélectionnées), valeurs triées.
+    """
+    key = []
+    for column, selected in sorted(selections.items()):
+        if set(selected) >= set(options[column]):
+            continue
+        key.append((column, tuple(sorted({str(value) for value in selected}))))
+    return tuple(key)
+
+
+# Version des données de chaque table de contrôles (migrations/004), écrite par pg_loader.bump_version
+DATA_VERSIONS = "data_versions"
+
+
+def version_query(table):
+    """
+    Requête de la version des données de `table` : numéro et date de la dernière écriture de
+    pg_loader (ou de rollup.py), dans la table DATA_VERSIONS ; (0, None) pour une table jamais
+    chargée. Elle change à chaque chargement et sert de clé aux caches des tableaux de bord.
+    """
+    return (
+        f"SELECT coalesce(max(version), 0) AS version, max(modifie_le) AS modifie_le "
+        f"FROM {DATA_VERSIONS} WHERE table_name = '{table}';"
+    )
+
+
+# Date de dernière écriture de chaque ligne (migrations/003), base des lectures incrémentales
+MODIFIE_LE = "modifie_le"
+
+
+def watermark_query(table):
+    """
+    Requête du filigrane d'une lecture de `table`, à exécuter juste avant elle : instant à
+    partir duquel relire les lignes écrites ensuite (delta_query), et nombre cumulé de lignes
+    supprimées (statistiques de Postgres).
+
+    L'instant est le début de la plus ancienne transaction en cours, s'il est antérieur au
+    présent : une ligne écrite par une transaction pas encore validée porte une date
+    antérieure à sa validation (now() au début de la transaction) et doit être relue. Les
+    transactions d'autres rôles ne sont visibles qu'avec pg_read_all_stats ; les chargements
+    utilisent la même connexion que les dashboards.
+    """
+    return (
+        "SELECT least(now(), (SELECT min(xact_start) FROM pg_stat_activity "
+        "WHERE datname = current_database() AND pid <> pg_backend_pid())) AS depuis, "
+        "(SELECT n_tup_del FROM pg_stat_user_tables "
+        f"WHERE relid = '{table}'::regclass) AS suppressions;"
+    )
+
+
+def delta_query(table):
+    """Requête des lignes de `table` insérées ou modifiées depuis le filigrane :depuis (watermark_query)."""
+    return f"SELECT * FROM {table} WHERE {MODIFIE_LE} >= :depuis;"
+
+
+def merge_rows(df, delta, key="id"):
+    """
+    Fusionne des lignes nouvelles ou modifiées dans les lignes chargées, toutes deux au schéma
+    de apply_schema : une ligne dont `key` est déjà présente est remplacée à sa position, les
+    autres sont ajoutées à la fin. Les lignes non modifiées gardent donc leur position, ce qui
+    permet de mettre à jour l'index bitmap des seules lignes écrites (bitmaps.update_bitmaps).
+    Les catégories sont réunies (nouvelles valeurs après les anciennes, ordre des catégories
+    ordonnées conservé).
+
+    Args:
+        df (pd.DataFrame): Lignes chargées (`key` unique).
+        delta (pd.DataFrame): Lignes lues par delta_query (`key` unique).
+        key (str): Clé des lignes.
+
+    Returns:
+        tuple: (lignes fusionnées, anciennes versions des lignes remplacées, positions des
+            lignes de delta dans les lignes fusionnées).
+    """
+    positions = pd.Index(df[key]).get_indexer(delta[key])
+    replaced = positions >= 0
+    anciennes = df.iloc[positions[replaced]]
+    positions[~replaced] = len(df) + np.arange((~replaced).sum())
+    dtypes, elargies = {}, {}
+    for col in df.columns.intersection(delta.columns):
+        dtype = df[col].dtype
+        if not isinstance(dtype, pd.CategoricalDtype):
+            continue
+        nouvelles = pd.Index(delta[col].dropna().unique()).difference(dtype.categories)
+        if len(nouvelles):
+            dtype = elargies[col] = pd.CategoricalDtype(dtype.categories.append(nouvelles), ordered=dtype.ordered)
+        dtypes[col] = dtype
+    kept = df.astype(elargies) if elargies else df
+    # Ordre des lignes : celles de df, où chaque ligne remplacée pointe vers sa nouvelle version, puis les ajouts
+    order = np.arange(len(df) + (~replaced).sum())
+    order[positions] = len(df) + np.arange(len(delta))
+    merged = pd.concat([kept, delta.astype(dtypes)[df.columns]], ignore_index=True)
+    return merged.take(order).reset_index(drop=True), anciennes, positions
+
+
+def frame_options(df, column):
+    """
+    Options d'un filtre à partir des lignes déjà chargées (au schéma de apply_schema) : les
+    libellés des catégories présentes, dans leur ordre (NON_RENSEIGNE en dernier), ou
+    [True, False] pour un booléen.
+    """
+    if column in DASHBOARD_BOOLEANS:
+        return sorted(set(df[column].tolist()), reverse=True)
+    values = df[column].cat.remove_unused_categories()
+    return values.cat.categories.tolist()
+
+
+# Tailles de page proposées par la vue des données brutes
+PAGE_SIZES = [50, 100, 500, 1000]
+
+
+def page_query(table, columns, sort, descending=False, where=""):
+    """
+    Requête d'une page de lignes brutes : colonnes `columns` des lignes filtrées, triées par
+    `sort` (valeurs manquantes en dernier) puis par id, ce qui garde les pages stables. Les
+    jours et créneaux suivent leur ordre naturel (DASHBOARD_ORDERED), comme en mémoire.
+
+    Seule la page demandée quitte Postgres (paramètres :page_limit et :page_offset, avec ceux
+    de where_clause). Les noms de colonnes sont insérés dans la requête : ils doivent venir du
+    schéma de la table.
+
+    Args:
+        table (str): Table des contrôles.
+        columns (Sequence[str]): Colonnes affichées.
+        sort (str): Colonne de tri.
+        descending (bool): Tri décroissant.
+        where (str): Clause de where_clause.
+
+    Returns:
+        str: Requête SQL (ORDER BY, LIMIT, OFFSET).
+    """
+    direction = "DESC" if descending else "ASC"
+    order = f"{sort} {direction} NULLS LAST"
+    if sort in DASHBOARD_ORDERED:
+        # Rang dans l'ordre naturel, sans tenir compte de la casse ; les valeurs hors de l'ordre viennent après
+        rangs = ", ".join(f"'{o.upper()}'" for o in DASHBOARD_ORDERED[sort])
+        order = f"array_position(ARRAY[{rangs}], upper(trim({sort}::text))) {direction} NULLS LAST, {order}"
+    if sort != "id":
+        order += ", id"
+    return (
+        f"SELECT {', '.join(columns)} FROM {table}{where} "
+        f"ORDER BY {order} LIMIT :page_limit OFFSET :page_offset;"
+    )
+
+
+def frame_page(df, columns, sort, descending=False, offset=0, limit=PAGE_SIZES[0]):
+    """
+    Page de lignes brutes tirée des lignes chargées, pendant en mémoire de page_query : seule
+    la colonne de tri est triée (tri stable, valeurs manquantes en dernier), puis les lignes
+    de la page sont extraites.
+    """
+    order = df[sort].reset_index(drop=True).sort_values(
+        ascending=not descending, kind="stable", na_position="last"
+    ).index
+    return df.iloc[order[offset:offset + limit]][list(columns)].reset_index(drop=True)
+
+
+# Dimensions calculées des sections : expression SQL, calcul pandas dans derived_column()
+DERIVED_DIMENSIONS = {
+    "heure": "extract(hour FROM heure_de_debut)::int",
+    # Même numérotation que strftime('%Y-W%W') : semaines commençant le lundi, semaine 00 avant le premier lundi
+    "annee_semaine": (
+        "to_char(date, 'YYYY') || '-W' || "
+        "lpad(((extract(doy FROM date)::int + 7 - extract(isodow FROM date)::int) / 7)::text, 2, '0')"
+    ),
+}
+# Condition SQL d'une anomalie, équivalente à to_boolean
+ANOMALIE_SQL = "upper(trim(anomalie)) IN ({})".format(", ".join(f"'{v}'" for v in sorted(VALEURS_VRAIES)))
+METRICS = ["nb_controles", "nb_anomalies"]
+# Pourcentage d'anomalies de chaque groupe, calculé avec les comptes (finish_aggregate)
+TAUX = "taux_anomalies"
+
+
+# Clés de la table pré-agrégée <table>_rollup (migrations/002 ou rollup.create_rollup), tenue à jour par pg_loader
+# après chaque chargement.
+# Des lignes écrites par un autre moyen (SQL à la main, autre outil) ne sont pas reportées dans le rollup :
+# il faut alors le reconstruire avec `python rollup.py <table>`
+ROLLUP_KEYS = [
+    "date", "heure_arrondie", "heure", "agences_antennes", "jour",
+    "type_de_verification", "appartenance_du_conducteur", "is_surete",
+]
+
+
+def rollup_table(table):
+    """Nom de la table pré-agrégée d'une table de contrôles."""
+    return f"{table}_rollup"
+
+
+def aggregate_query(table, dims, where="", rollup=True):
+    """
+    Requête des comptes par combinaison de `dims` : nombre de contrôles et d'anomalies.
+
+    Quand toutes les dimensions (et donc les filtres de where_clause) sont des clés du rollup,
+    ou s'en déduisent (annee_semaine depuis date), la requête somme les comptes de
+    <table>_rollup : son coût ne dépend pas de la longueur de l'historique. Sinon (tournées,
+    catégories d'anomalies...), ou si la base n'a pas de rollup (`rollup` faux, voir
+    rollup.has_rollup), elle agrège les lignes de `table`.
+
+    Args:
+        table (str): Table des contrôles.
+        dims (Sequence[str]): Colonnes ou dimensions calculées (DERIVED_DIMENSIONS) ; vide pour le total.
+        where (str): Clause de where_clause, dont les paramètres sont passés à l'exécution.
+        rollup (bool): La table <table>_rollup existe (migration 002 appliquée).
+
+    Returns:
+        str: Requête SQL (GROUP BY avec count(*) et count(*) FILTER, ou sum des comptes du rollup).
+    """
+    if rollup and all(dim in ROLLUP_KEYS or dim in DERIVED_DIMENSIONS for dim in dims):
+        select = [dim if dim in ROLLUP_KEYS else f"{DERIVED_DIMENSIONS[dim]} AS {dim}" for dim in dims]
+        select += [f"coalesce(sum({metric}), 0)::bigint AS {metric}" for metric in METRICS]
+        table = rollup_table(table)
+    else:
+        select = [f"{DERIVED_DIMENSIONS.get(dim, dim)} AS {dim}" for dim in dims]
+        select += ["count(*) AS nb_controles", f"count(*) FILTER (WHERE {ANOMALIE_SQL}) AS nb_anomalies"]
+    query = f"SELECT {', '.join(select)} FROM {table}{where}"
+    if dims:
+        query += " GROUP BY " + ", ".join(str(i + 1) for i in range(len(dims)))
+    return query + ";"
+
+
+def derived_column(df, dim):
+    """Colonne `dim` des lignes chargées, calculée pour les dimensions de DERIVED_DIMENSIONS."""
+    if dim == "heure":
+        return df["heure_de_debut"].dt.hour.rename(dim)
+    if dim == "annee_semaine":
+        # Une chaîne par date distincte plutôt que par ligne
+        codes, dates = pd.factorize(df["date"])
+        labels = np.append(dates.strftime("%Y-W%W").to_numpy(dtype=object), np.nan)
+        return pd.Series(labels[codes], index=df.index, name=dim)
+    return df[dim]
+
+
+def finish_aggregate(result, dims):
+    """
+    Met les comptes au format commun des sections : schéma des tableaux de bord appliqué aux
+    dimensions, groupes à dimension manquante retirés, tri par dimensions, comptes entiers et
+    taux d'anomalies (0 pour un groupe vide).
+    """
+    result = apply_schema(result).dropna(subset=list(dims))
+    for dim in dims:
+        if dim == "heure":
+            result[dim] = result[dim].astype(int)
+        elif isinstance(result[dim].dtype, pd.CategoricalDtype):
+            result[dim] = result[dim].cat.remove_unused_categories()
+    if dims:
+        result = result.sort_values(list(dims), kind="stable")
+    result[METRICS] = result[METRICS].astype(np.int64)
+    controles = result["nb_controles"].to_numpy()
+    result[TAUX] = np.divide(
+        result["nb_anomalies"].to_numpy(), controles, out=np.zeros(len(result)), where=controles > 0
+    ) * 100
+    return result.reset_index(drop=True)
+
+
+def _codes(values):
+    """Codes de chaque ligne (-1 si manquant) et libellés d'une dimension."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(dtype=np.intp), values.cat.categories
+    return pd.factorize(values, sort=True)
+
+
+def aggregate_frame(df, dims):
+    """
+    Comptes par combinaison de `dims` calculés sur les lignes chargées, au format de aggregate_query.
+
+    Un seul passage sur les lignes : les codes des dimensions sont combinés en un numéro de
+    groupe par ligne, puis np.bincount compte les contrôles et, pondéré par 'anomalie', les
+    anomalies de chaque groupe. Les lignes à dimension manquante sont ignorées.
+
+    Args:
+        df (pd.DataFrame): Lignes filtrées, au schéma de apply_schema.
+        dims (Sequence[str]): Colonnes ou dimensions calculées ; vide pour le total.
+
+    Returns:
+        pd.DataFrame: Colonnes `dims`, "nb_controles", "nb_anomalies" et "taux_anomalies".
+    """
+    keys = [derived_column(df, dim) for dim in dims]
+    codes, labels = zip(*map(_codes, keys)) if keys else ((), ())
+    anomalie = df["anomalie"].to_numpy()
+    if codes:
+        present = np.logical_and.reduce([c >= 0 for c in codes])
+        if not present.all():
+            codes, anomalie = [c[present] for c in codes], anomalie[present]
+    shape = tuple(len(l) for l in labels)
+    groups = np.ravel_multi_index(codes, shape) if codes else np.zeros(len(anomalie), dtype=np.intp)
+
+    cells = int(np.prod(shape, dtype=np.int64))
+    if cells <= 4 * len(groups) + 1024:
+        # Peu de combinaisons possibles : un compteur par combinaison, les vides retirées ensuite
+        nb_controles = np.bincount(groups, minlength=cells)
+        nb_anomalies = np.bincount(groups, weights=anomalie, minlength=cells)
+        uniques = np.flatnonzero(nb_controles) if codes else np.zeros(1, dtype=np.intp)
+        nb_controles, nb_anomalies = nb_controles[uniques], nb_anomalies[uniques]
+    else:
+        uniques, groups = np.unique(groups, return_inverse=True)
+        nb_controles = np.bincount(groups)
+        nb_anomalies = np.bincount(groups, weights=anomalie)
+
+    result = {}
+    positions = np.unravel_index(uniques, shape) if codes else ()
+    for key, dim_codes, dim_labels in zip(keys, positions, labels):
+        if isinstance(key.dtype, pd.CategoricalDtype):
+            result[key.name] = pd.Categorical.from_codes(dim_codes, dtype=key.dtype)
+        else:
+            result[key.name] = dim_labels.take(dim_codes)
+    result["nb_controles"], result["nb_anomalies"] = nb_controles, nb_anomalies
+    return finish_aggregate(pd.DataFrame(result), list(dims))
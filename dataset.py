@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from bitmaps import build_bitmaps, update_bitmaps
+from cube import build_cube, update_cube
+from dashboard_data import MODIFIE_LE, apply_schema, delta_query, merge_rows, watermark_query
+
+# Intervalle entre deux mises à jour des lignes en mémoire (le ttl="10m" des autres lectures)
+REFRESH_SECONDS = 600
+
+
+def new_dataset(table, filtres):
+    """Jeu de données en mémoire d'une table, pas encore chargé : à tenir à jour par refresh_dataset."""
+    return {
+        "table": table,
+        "filtres": tuple(filtres),
+        # (lignes, cube de comptes, index bitmap des filtres, version)
+        "dataset": None,
+        "depuis": None,
+        "suppressions": None,
+        "lu_le": None,
+        # Lignes lues lors du dernier chargement et sa nature ("complet" ou "incrémental")
+        "lignes_lues": 0,
+        "mode": None,
+        "lock": threading.Lock(),
+    }
+
+
+def refresh_due(state):
+    """Indique si le jeu de données est à charger, ou à mettre à jour (REFRESH_SECONDS écoulées)."""
+    return state["dataset"] is None or time.monotonic() - state["lu_le"] >= REFRESH_SECONDS
+
+
+def refresh_dataset(state, connection):
+    """
+    Charge le jeu de données, ou le met à jour avec les seules lignes écrites depuis la lecture
+    précédente.
+
+    La première lecture prend toute la table. Les suivantes relisent les lignes dont
+    modifie_le (migrations/003) est postérieure au filigrane de la lecture précédente
+    (watermark_query), les fusionnent par id dans les lignes en mémoire (merge_rows) et
+    reportent la différence dans le cube de comptes (update_cube) : leur coût suit le nombre
+    de lignes écrites, pas la taille de la table. Les lignes remplacées gardent leur position :
+    l'index bitmap des filtres n'est modifié que pour les lignes écrites (update_bitmaps),
+    au prix d'une copie de ses bitmaps. Une suppression de lignes, ou une table sans
+    modifie_le, provoque une lecture complète.
+
+    La version du jeu de données ne change que si des lignes ont été lues : les sections en
+    cache restent valables tant que la table n'est pas modifiée.
+
+    Args:
+        state (dict): Résultat de new_dataset, partagé entre les sessions.
+        connection: Connexion SQLAlchemy.
+
+    Returns:
+        tuple: (lignes, cube de comptes ou None, index bitmap, version).
+    """
+    with state["lock"]:
+        if not refresh_due(state):
+            return state["dataset"]
+        table = state["table"]
+        depuis, suppressions = connection.execute(text(watermark_query(table))).one()
+
+        complet = (
+            state["dataset"] is None
+            or MODIFIE_LE not in state["dataset"][0].columns
+            or suppressions != state["suppressions"]
+        )
+        if complet:
+            df = apply_schema(pd.read_sql(text(f"SELECT * FROM {table};"), connection))
+            state["dataset"] = (df, build_cube(df), build_bitmaps(df, state["filtres"]), time.time_ns())
+            lues = len(df)
+        else:
+            delta = pd.read_sql(text(delta_query(table)), connection, params={"depuis": state["depuis"]})
+            lues = len(delta)
+            if lues:
+                df, cube, bitmaps, _ = state["dataset"]
+                delta = apply_schema(delta)
+                df, anciennes, positions = merge_rows(df, delta)
+                if cube is not None:
+                    cube = update_cube(cube, anciennes, delta)
+                    if cube is None:
+                        # Nouvelle valeur d'une dimension : le cube est reconstruit avec ses axes
+                        cube = build_cube(df)
+                state["dataset"] = (df, cube, update_bitmaps(bitmaps, df, positions), time.time_ns())
+
+        state.update(
+            depuis=depuis, suppressions=suppressions, lu_le=time.monotonic(),
+            lignes_lues=lues, mode="complet" if complet else "incrémental",
+        )
+        return state["dataset"]
@@ -0,0 +1,138 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Schéma typé du jeu Parquet : les colonnes absentes du DataFrame sont ignorées,
+# les autres colonnes texte sont stockées en string
+PARQUET_CATEGORIES = ["agences_antennes", "jour", "region", "type_de_verification", "appartenance_du_conducteur"]
+PARQUET_TIMESTAMPS = ["heure_de_debut", "heure_de_fin", "date"]
+PARQUET_BOOLEANS = ["is_surete"]
+PARQUET_INTEGERS = ["id"]
+
+# Partitionnement : un répertoire par mois (d'après 'date') puis par région
+PARTITION_COLS = ["annee_mois", "region"]
+
+
+def to_parquet_frame(df):
+    """
+    Convertit un DataFrame prétraité vers les types du jeu Parquet.
+
+    Dates en timestamp, 'is_surete' en booléen, colonnes peu variées en catégories
+    (dictionnaire Parquet), texte en string ; ajoute la colonne de partition 'annee_mois'.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col in PARQUET_TIMESTAMPS:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif col in PARQUET_BOOLEANS:
+            df[col] = df[col].map({True: True, False: False, "True": True, "False": False}).astype("boolean")
+        elif col in PARQUET_INTEGERS:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+        elif col in PARQUET_CATEGORIES:
+            df[col] = df[col].astype("string").astype("category")
+        elif df[col].dtype == object:
+            df[col] = df[col].astype("string")
+
+    df["annee_mois"] = pd.to_datetime(df["date"], errors="coerce").dt.strftime("%Y-%m").astype("string")
+    return df
+
+
+def _write_dataset(df, root, basename, existing_data_behavior="overwrite_or_ignore"):
+    table = pa.Table.from_pandas(to_parquet_frame(df), preserve_index=False)
+    pq.write_to_dataset(
+        table, root, partition_cols=PARTITION_COLS,
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior=existing_data_behavior,
+    )
+
+
+def _partition_key(values):
+    """Partition (mois, région) en tuple comparable ; une valeur manquante devient None."""
+    return tuple(None if pd.isna(value) else str(value) for value in values)
+
+
+def _partition_filter(partitions):
+    """Expression pyarrow sélectionnant les partitions données (lignes de valeurs de PARTITION_COLS)."""
+    expression = None
+    for annee_mois, region in partitions[PARTITION_COLS].drop_duplicates().itertuples(index=False):
+        match = (
+            (ds.field("annee_mois").is_null() if pd.isna(annee_mois) else ds.field("annee_mois") == annee_mois)
+            & (ds.field("region").is_null() if pd.isna(region) else ds.field("region") == region)
+        )
+        expression = match if expression is None else expression | match
+    return expression
+
+
+def upsert_parquet(df, root, key="id", basename="upsert"):
+    """
+    Ajoute ou remplace des lignes dans le jeu Parquet partitionné, selon la colonne `key`.
+
+    Seules les partitions (mois, région) touchées sont relues puis réécrites : celles des
+    lignes de df, et celles qui contiennent déjà leurs clés (une ligne dont la date ou la
+    région a changé quitte son ancienne partition). Une partition vidée est supprimée.
+    """
+    if df.empty:
+        return
+    if not os.path.exists(root):
+        _write_dataset(df, root, basename)
+        return
+
+    dataset = ds.dataset(root, format="parquet", partitioning="hive")
+    keys = pd.to_numeric(df[key], errors="coerce").dropna().astype("int64")
+    # Partitions où se trouvent déjà les clés reçues (lecture des seules colonnes de clé et de partition)
+    located = dataset.to_table(
+        columns=PARTITION_COLS, filter=ds.field(key).isin(keys.tolist())
+    ).to_pandas()
+    for col in PARTITION_COLS:
+        located[col] = located[col].astype(object)
+    incoming = to_parquet_frame(df[["date", "region"]])[PARTITION_COLS].astype(object)
+    touched = _partition_filter(pd.concat([incoming, located], ignore_index=True))
+
+    existing = dataset.to_table(filter=touched).to_pandas()
+    if not existing.empty:
+        # Les colonnes de partition reviennent en catégories : repartir de valeurs simples
+        for col in PARTITION_COLS:
+            existing[col] = existing[col].astype(object)
+        existing = existing[~existing[key].isin(keys)]
+        existing = to_parquet_frame(existing.drop(columns=["annee_mois"]))
+    merged = to_parquet_frame(df)
+    if not existing.empty:
+        merged = pd.concat([existing, merged], ignore_index=True)
+
+    # Partitions touchées qui ne reçoivent plus aucune ligne : leurs fichiers sont retirés
+    written = {_partition_key(values) for values in merged[PARTITION_COLS].itertuples(index=False)}
+    for fragment in dataset.get_fragments(filter=touched):
+        partition = ds.get_partition_keys(fragment.partition_expression)
+        if _partition_key(partition.get(col) for col in PARTITION_COLS) not in written:
+            os.remove(fragment.path)
+
+    merged = merged.drop(columns=["annee_mois"])
+    _write_dataset(merged, root, basename, existing_data_behavior="delete_matching")
+
+
+def tee_parquet(chunks, root, incremental=False):
+    """
+    Écrit chaque bloc dans le jeu Parquet et le transmet tel quel à l'étape suivante.
+
+    En mode complet, le jeu est reconstruit dans un répertoire temporaire qui remplace
+    l'ancien une fois le flux épuisé ; en mode incrémental, les blocs y sont fusionnés
+    avec upsert_parquet.
+    """
+    if incremental:
+        for i, chunk in enumerate(chunks):
+            upsert_parquet(chunk, root, basename=f"upsert-{pd.Timestamp.now():%Y%m%d%H%M%S}-{i:05d}")
+            yield chunk
+        return
+
+    tmp = f"{root}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    for i, chunk in enumerate(chunks):
+        _write_dataset(chunk, tmp, f"part-{i:05d}")
+        yield chunk
+    shutil.rmtree(root, ignore_errors=True)
+    if os.path.exists(tmp):
+        os.replace(tmp, root)
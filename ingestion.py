@@ -0,0 +1,301 @@
+import os
+import zlib
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+# Nombre de lignes traitées à la fois lors de la lecture en flux des classeurs
+CHUNKSIZE = 50_000
+
+# Décalage du numéro de classeur dans la clé d'une ligne : clé = (classeur << 40) | id de la ligne,
+# ou (classeur << 40) | POSITION | position pour une ligne sans id utilisable (voir row_keys)
+SOURCE_SHIFT = 40
+SOURCE_MASK = (1 << (62 - SOURCE_SHIFT)) - 1
+POSITION = 1 << 62
+# Colonnes de l'id métier dans les classeurs bruts (avant renommage)
+ID_COLUMNS = ("id", "Id")
+# Format des clés du filigrane : un filigrane d'un autre format est ignoré (exécution complète)
+WATERMARK_VERSION = 2
+
+
+def _header_names(cells):
+    """
+    Reproduit les noms de colonnes de pd.read_excel : "Unnamed: i" pour les en-têtes vides,
+    suffixes ".1", ".2"... pour les doublons.
+    """
+    names = []
+    seen = {}
+    for i, cell in enumerate(cells):
+        name = f"Unnamed: {i}" if cell is None else str(cell)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _iter_rows(path, skiprows=None, sheet_name=None):
+    """Parcourt les lignes non ignorées d'une feuille, en lecture seule (en-tête compris)."""
+    skiprows = set(skiprows or [])
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        for i, row in enumerate(sheet.iter_rows(values_only=True)):
+            if i not in skiprows:
+                yield row
+    finally:
+        workbook.close()
+
+
+def read_excel_header(path, skiprows=None, sheet_name=None):
+    """
+    Lit uniquement la ligne d'en-tête d'un classeur.
+
+    Returns:
+        list: Noms de colonnes, tels que pd.read_excel les produirait.
+    """
+    rows = _iter_rows(path, skiprows, sheet_name)
+    try:
+        return _header_names(next(rows, ()))
+    finally:
+        rows.close()
+
+
+def iter_excel_chunks(path, chunksize=CHUNKSIZE, skiprows=None, sheet_name=None):
+    """
+    Lit un classeur Excel en flux et le découpe en DataFrames d'au plus `chunksize` lignes.
+
+    S'appuie sur l'itérateur de lignes en lecture seule d'openpyxl : la mémoire utilisée
+    dépend de `chunksize`, pas de la taille du classeur. Les colonnes sont de type object
+    pour que le typage ne dépende pas du découpage ; les lignes entièrement vides sont ignorées.
+
+    Args:
+        path (str): Chemin du classeur.
+        chunksize (int): Nombre maximal de lignes par bloc.
+        skiprows (Iterable[int], optional): Indices de lignes à ignorer (comme pd.read_excel).
+        sheet_name (str, optional): Feuille à lire, la première par défaut.
+
+    Yields:
+        pd.DataFrame: Blocs successifs, indexés à la suite les uns des autres.
+    """
+    rows = _iter_rows(path, skiprows, sheet_name)
+    try:
+        header = _header_names(next(rows, ()))
+        width = len(header)
+        start = 0
+        buffer = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[:width] + (None,) * (width - len(row)))
+            if len(buffer) >= chunksize:
+                yield pd.DataFrame(buffer, columns=header, dtype=object,
+                                   index=pd.RangeIndex(start, start + len(buffer)))
+                start += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header, dtype=object,
+                               index=pd.RangeIndex(start, start + len(buffer)))
+    finally:
+        rows.close()
+
+
+def write_csv_chunks(chunks, path, **to_csv_kwargs):
+    """
+    Écrit des blocs successifs dans un même fichier CSV, au fur et à mesure.
+
+    Le premier bloc crée le fichier avec l'en-tête, les suivants sont ajoutés à la fin.
+
+    Returns:
+        int: Nombre total de lignes écrites.
+    """
+    total = 0
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), **to_csv_kwargs)
+        total += len(chunk)
+    return total
+
+
+def watermark_path(output):
+    """Chemin du filigrane associé à un fichier de sortie."""
+    return f"{output}.watermark.npz"
+
+
+def empty_watermark():
+    """Filigrane vide : toutes les lignes seront considérées comme nouvelles."""
+    return pd.DataFrame(
+        {"fingerprint": np.array([], dtype=np.uint64), "id": np.array([], dtype=np.int64)},
+        index=pd.Index(np.array([], dtype=np.int64), name="key")
+    )
+
+
+def load_watermark(path):
+    """
+    Charge le filigrane d'une ingestion incrémentale.
+
+    Le filigrane associe à chaque ligne déjà traitée (clé de row_keys) l'empreinte de
+    son contenu brut et l'id qui lui a été attribué en sortie.
+
+    Returns:
+        pd.DataFrame: Colonnes "fingerprint" et "id", indexées par clé ; vide si absent ou
+            d'un autre format que WATERMARK_VERSION.
+    """
+    if not os.path.exists(path):
+        return empty_watermark()
+    with np.load(path) as data:
+        if "version" not in data or int(data["version"]) != WATERMARK_VERSION:
+            return empty_watermark()
+        return pd.DataFrame(
+            {"fingerprint": data["fingerprint"], "id": data["id"]},
+            index=pd.Index(data["key"], name="key")
+        )
+
+
+def save_watermark(path, watermark, updates=()):
+    """
+    Enregistre le filigrane, complété par les mises à jour de l'exécution courante.
+
+    L'écriture passe par un fichier temporaire : un filigrane n'est jamais à moitié écrit.
+    """
+    updates = [update for update in updates if len(update)]
+    if updates:
+        changes = pd.concat(updates)
+        # Un id répété d'un bloc à l'autre garde sa dernière ligne : les clés restent uniques
+        changes = changes[~changes.index.duplicated(keep="last")]
+        watermark = pd.concat([watermark.drop(index=changes.index, errors="ignore"), changes])
+
+    tmp = f"{path}.tmp.npz"
+    np.savez(
+        tmp,
+        key=watermark.index.to_numpy(dtype=np.int64),
+        fingerprint=watermark["fingerprint"].to_numpy(dtype=np.uint64),
+        id=watermark["id"].to_numpy(dtype=np.int64),
+        version=WATERMARK_VERSION,
+    )
+    os.replace(tmp, path)
+
+
+def source_id(path):
+    """
+    Numéro stable d'un classeur, dérivé de son nom de fichier.
+
+    Ne dépend ni du répertoire ni de l'ordre des classeurs lus : ajouter un fichier
+    mensuel ne change pas les clés des lignes des autres classeurs.
+    """
+    return zlib.crc32(os.path.basename(path).encode("utf-8")) & SOURCE_MASK
+
+
+def row_keys(chunk, source=0, seen_ids=None):
+    """
+    Clés des lignes d'un bloc brut dans le filigrane : numéro du classeur et id métier de la
+    ligne (colonne de ID_COLUMNS), ou sa position dans le classeur à défaut.
+
+    L'id est retenu s'il est entier, compris entre 0 et 2**40 et pas encore vu dans le
+    classeur : la clé suit alors la ligne quand des lignes sont insérées ou supprimées plus
+    haut dans la feuille. Un id répété garde sa clé d'id à sa première occurrence ; les
+    suivantes, dans le même bloc ou dans un bloc ultérieur, prennent une clé de position.
+    Une clé de position suppose une feuille où les lignes ne sont qu'ajoutées à la fin : une
+    insertion ou une suppression décale les clés de toutes les lignes suivantes.
+
+    Args:
+        chunk (pd.DataFrame): Bloc issu de iter_excel_chunks (index = position de la ligne).
+        source (int): Numéro du classeur (voir source_id).
+        seen_ids (set, optional): Ids déjà rencontrés dans les blocs précédents du classeur,
+            complété par ceux du bloc. Sans lui, l'unicité n'est vérifiée que dans le bloc.
+
+    Returns:
+        np.ndarray: Clés int64 des lignes.
+    """
+    keys = chunk.index.to_numpy(dtype=np.int64) | POSITION
+    column = next((col for col in ID_COLUMNS if col in chunk.columns), None)
+    if column is not None:
+        ids = pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=float)
+        valid = (ids >= 0) & (ids < 1 << SOURCE_SHIFT) & (ids == np.floor(ids))
+        valid &= ~pd.Series(ids).duplicated().to_numpy()
+        if seen_ids:
+            candidates = np.flatnonzero(valid)
+            valid[candidates] = [value not in seen_ids for value in ids[candidates].tolist()]
+        keys[valid] = ids[valid].astype(np.int64)
+        if seen_ids is not None:
+            seen_ids.update(keys[valid].tolist())
+    return (np.int64(source) << SOURCE_SHIFT) | keys
+
+
+def split_delta(chunk, watermark, source=0, seen_ids=None):
+    """
+    Ne garde d'un bloc brut que les lignes nouvelles ou modifiées depuis le filigrane.
+
+    Une ligne est identifiée par son classeur et son id métier, ou sa position à défaut
+    (row_keys) ; elle est modifiée si l'empreinte de son contenu brut diffère de celle du
+    filigrane.
+
+    Args:
+        chunk (pd.DataFrame): Bloc issu de iter_excel_chunks (index = position de la ligne).
+        watermark (pd.DataFrame): Filigrane chargé par load_watermark.
+        source (int): Numéro du classeur (voir source_id).
+        seen_ids (set, optional): Ids déjà rencontrés dans le classeur (voir row_keys), à
+            partager entre les blocs d'un même classeur.
+
+    Returns:
+        tuple: (lignes nouvelles ou modifiées, mises à jour du filigrane pour ces lignes).
+            L'id des mises à jour vaut -1 pour une ligne nouvelle, l'id déjà attribué sinon.
+    """
+    keys = row_keys(chunk, source, seen_ids)
+    fingerprints = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+
+    positions = watermark.index.get_indexer(keys)
+    seen = positions >= 0
+    known_ids = np.full(len(keys), -1, dtype=np.int64)
+    delta = ~seen
+    if seen.any():
+        known_ids[seen] = watermark["id"].to_numpy()[positions[seen]]
+        delta[seen] = watermark["fingerprint"].to_numpy()[positions[seen]] != fingerprints[seen]
+
+    update = pd.DataFrame(
+        {"fingerprint": fingerprints[delta], "id": known_ids[delta]},
+        index=pd.Index(keys[delta], name="key")
+    )
+    return (chunk if delta.all() else chunk[delta].copy()), update
+
+
+def upsert_csv_chunks(chunks, path, key="id", **to_csv_kwargs):
+    """
+    Ajoute ou remplace des lignes dans un CSV existant, selon la colonne `key`.
+
+    Les lignes dont la clé est absente du fichier sont ajoutées à la fin au fil de l'eau ;
+    s'il existe des lignes à remplacer, le fichier est réécrit une seule fois, en flux.
+
+    Returns:
+        int: Nombre de lignes ajoutées ou remplacées.
+    """
+    if not os.path.exists(path):
+        return write_csv_chunks(chunks, path, **to_csv_kwargs)
+
+    header = list(pd.read_csv(path, nrows=0).columns)
+    existing = set(pd.read_csv(path, usecols=[key], dtype=str)[key])
+
+    total = 0
+    replacements = []
+    for chunk in chunks:
+        chunk = chunk[header]
+        present = chunk[key].astype(str).isin(existing)
+        chunk[~present].to_csv(path, mode="a", header=False, **to_csv_kwargs)
+        if present.any():
+            replacements.append(chunk[present])
+        total += len(chunk)
+
+    if replacements:
+        replaced = pd.concat(replacements)
+        replaced_keys = set(replaced[key].astype(str))
+        tmp = f"{path}.tmp"
+        parts = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=CHUNKSIZE)
+        for i, part in enumerate(parts):
+            part = part[~part[key].isin(replaced_keys)]
+            part.to_csv(tmp, mode="w" if i == 0 else "a", header=(i == 0), **to_csv_kwargs)
+        replaced.to_csv(tmp, mode="a", header=False, **to_csv_kwargs)
+        os.replace(tmp, path)
+
+    return total
@@ -0,0 +1,207 @@
+import contextlib
+import datetime
+import json
+import time
+
+import psutil
+
+# Mesures de l'exécution en cours ; None quand l'instrumentation est désactivée
+_run = None
+
+
+def _rss():
+    return psutil.Process().memory_info().rss
+
+
+def enabled():
+    """Indique si une exécution instrumentée est en cours."""
+    return _run is not None
+
+
+def start_run(name):
+    """
+    Démarre l'instrumentation d'une exécution.
+
+    Jusqu'à finish_run(), step() et timed_chunks() enregistrent par étape le temps mural,
+    le temps CPU, le nombre de lignes et la variation de RSS. Sans start_run(), ces
+    fonctions ne mesurent rien et ne coûtent presque rien.
+    """
+    global _run
+    _run = {
+        "name": name,
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "rss_start": _rss(),
+        "rss_peak": _rss(),
+        "steps": {},
+        "stack": [],
+    }
+
+
+def _enter(name):
+    now, cpu, rss = time.perf_counter(), time.process_time(), _rss()
+    if _run["stack"]:
+        # Le temps passé dans une étape imbriquée n'est pas compté dans l'étape englobante
+        _pause(_run["stack"][-1], now, cpu, rss)
+    _run["stack"].append({"name": name, "wall": now, "cpu": cpu, "rss": rss})
+    _run["rss_peak"] = max(_run["rss_peak"], rss)
+
+
+def _pause(frame, now, cpu, rss):
+    record = _record(frame["name"])
+    record["wall_s"] += now - frame["wall"]
+    record["cpu_s"] += cpu - frame["cpu"]
+    record["rss_delta_bytes"] += rss - frame["rss"]
+
+
+def _exit(rows=None, call=True):
+    now, cpu, rss = time.perf_counter(), time.process_time(), _rss()
+    frame = _run["stack"].pop()
+    _pause(frame, now, cpu, rss)
+    record = _record(frame["name"])
+    record["calls"] += call
+    if rows is not None:
+        record["rows"] += rows
+    _run["rss_peak"] = max(_run["rss_peak"], rss)
+    if _run["stack"]:
+        _run["stack"][-1].update(wall=now, cpu=cpu, rss=rss)
+
+
+def _record(name):
+    return _run["steps"].setdefault(
+        name, {"calls": 0, "rows": 0, "wall_s": 0.0, "cpu_s": 0.0, "rss_delta_bytes": 0}
+    )
+
+
+@contextlib.contextmanager
+def step(name, rows=None):
+    """
+    Mesure un bloc de code comme une étape `name` (cumulée sur tous les appels).
+
+    Le temps et la variation de RSS des étapes imbriquées sont retirés de l'étape
+    englobante : chaque étape ne compte que son propre travail. `rows` est le nombre
+    de lignes traitées par le bloc.
+    """
+    if _run is None:
+        yield
+        return
+    _enter(name)
+    try:
+        yield
+    finally:
+        _exit(rows)
+
+
+def add_rows(name, rows):
+    """Ajoute `rows` lignes à l'étape `name`, quand elles ne sont connues qu'après coup."""
+    if _run is not None:
+        _record(name)["rows"] += rows
+
+
+def timed_chunks(name, chunks):
+    """
+    Mesure le travail fait pour produire chaque bloc d'un itérateur, comme une étape `name`.
+
+    Sans instrumentation, renvoie `chunks` tel quel.
+    """
+    if _run is None:
+        return chunks
+    return _timed_chunks(name, chunks)
+
+
+def _timed_chunks(name, chunks):
+    iterator = iter(chunks)
+    while True:
+        _enter(name)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            _exit(call=False)
+            return
+        except BaseException:
+            _exit()
+            raise
+        _exit(len(chunk))
+        yield chunk
+
+
+def stop_run():
+    """
+    Termine l'exécution instrumentée sans rapport et renvoie ses étapes, pour merge_steps().
+
+    Sert aux processus de travail, dont les mesures sont ajoutées à celles du processus principal.
+    """
+    global _run
+    run, _run = _run, None
+    return run["steps"] if run is not None else {}
+
+
+def merge_steps(steps):
+    """
+    Ajoute à l'exécution en cours les étapes mesurées dans un autre processus.
+
+    Les temps des processus parallèles s'additionnent : leur total peut dépasser la durée
+    murale de l'exécution.
+    """
+    if _run is None:
+        return
+    for name, other in steps.items():
+        record = _record(name)
+        for field, value in other.items():
+            record[field] += value
+
+
+def finish_run(path=None, **extra):
+    """
+    Termine l'exécution instrumentée, écrit le rapport JSON et affiche le tableau récapitulatif.
+
+    Args:
+        path (str, optional): Fichier du rapport JSON (aucun fichier si None).
+        **extra: Informations ajoutées au rapport (fichier de sortie, lignes écrites...).
+
+    Returns:
+        dict: Le rapport, ou None si l'instrumentation n'était pas active.
+    """
+    global _run
+    if _run is None:
+        return None
+    run, _run = _run, None
+    rss_end = _rss()
+    wall = time.perf_counter() - run["wall"]
+    report = {
+        "name": run["name"],
+        "started": run["started"],
+        "wall_s": wall,
+        "cpu_s": time.process_time() - run["cpu"],
+        "rss_start_mb": run["rss_start"] / 2**20,
+        "rss_end_mb": rss_end / 2**20,
+        "rss_peak_mb": max(run["rss_peak"], rss_end) / 2**20,
+        **extra,
+        "steps": [
+            {"step": name, **{k: v for k, v in record.items() if k != "rss_delta_bytes"},
+             "rss_delta_mb": record["rss_delta_bytes"] / 2**20}
+            for name, record in run["steps"].items()
+        ],
+    }
+    if path:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print_report(report)
+    return report
+
+
+def print_report(report):
+    """Affiche le rapport d'une exécution sous forme de tableau, une ligne par étape."""
+    print(f"{'étape':<14} {'appels':>7} {'lignes':>10} {'mur (s)':>9} {'CPU (s)':>9} {'% mur':>6} {'ΔRSS (Mo)':>10}")
+    for record in report["steps"]:
+        share = 100 * record["wall_s"] / report["wall_s"] if report["wall_s"] else 0
+        print(f"{record['step']:<14} {record['calls']:>7} {record['rows']:>10} {record['wall_s']:>9.3f} "
+              f"{record['cpu_s']:>9.3f} {share:>6.1f} {record['rss_delta_mb']:>10.1f}")
+    print(f"{'total':<14} {'':>7} {'':>10} {report['wall_s']:>9.3f} {report['cpu_s']:>9.3f} {'':>6} "
+          f"{report['rss_end_mb'] - report['rss_start_mb']:>10.1f}  (pic RSS {report['rss_peak_mb']:.0f} Mo)")
+
+
+def report_path(output):
+    """Chemin du rapport d'exécution associé à un fichier de sortie."""
+    return f"{output}.report.json"
@@ -0,0 +1,63 @@
+import argparse
+import glob
+import os
+
+# Scripts SQL numérotés (001_xxx.sql, 002_xxx.sql...), appliqués une fois chacun, dans l'ordre
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATIONS_TABLE = "schema_migrations"
+
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """Scripts de migration du répertoire, triés : liste de (version, chemin)."""
+    paths = sorted(glob.glob(os.path.join(glob.escape(directory), "*.sql")))
+    return [(os.path.splitext(os.path.basename(path))[0], path) for path in paths]
+
+
+def apply_migrations(conn, directory=MIGRATIONS_DIR):
+    """
+    Applique les migrations pas encore passées sur la base.
+
+    Les versions appliquées sont enregistrées dans la table schema_migrations ; chaque
+    script s'exécute dans sa propre transaction avec son enregistrement, si bien qu'un
+    script en échec n'est ni appliqué à moitié ni marqué comme passé. Un verrou consultatif
+    évite que deux chargements simultanés appliquent le même script.
+
+    Args:
+        conn: Connexion DB-API (psycopg2).
+        directory (str): Répertoire des scripts.
+
+    Returns:
+        list: Versions appliquées par cet appel.
+    """
+    applied = []
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} "
+            "(version text PRIMARY KEY, applied_at timestamptz NOT NULL DEFAULT now())"
+        )
+    for version, path in list_migrations(directory):
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (MIGRATIONS_TABLE,))
+            cur.execute(f"SELECT 1 FROM {MIGRATIONS_TABLE} WHERE version = %s", (version,))
+            if cur.fetchone():
+                continue
+            with open(path, encoding="utf-8") as f:
+                cur.execute(f.read())
+            cur.execute(f"INSERT INTO {MIGRATIONS_TABLE} (version) VALUES (%s)", (version,))
+            applied.append(version)
+            print(f"Migration {version} appliquée")
+    return applied
+
+
+if __name__ == "__main__":
+    from pg_loader import connect
+
+    parser = argparse.ArgumentParser(description="Applique les migrations SQL de migrations/ sur la base des dashboards.")
+    parser.add_argument("--dsn", help="chaîne de connexion (par défaut DATABASE_URL ou .streamlit/secrets.toml)")
+    args = parser.parse_args()
+    conn = connect(args.dsn)
+    try:
+        if not apply_migrations(conn):
+            print("Base déjà à jour")
+    finally:
+        conn.close()
@@ -0,0 +1,20 @@
+-- Index des filtres de la barre latérale des dashboards (clause WHERE construite par dashboard_data.where_clause)
+-- Chaque table n'est indexée que si elle existe : une table créée ensuite reçoit ses index à son premier chargement
+-- (pg_loader.prepare_table, FILTER_INDEXES)
+DO $$
+BEGIN
+    IF to_regclass('db_verification_concordance') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS idx_concordance_agence_jour
+            ON db_verification_concordance (agences_antennes, jour);
+        CREATE INDEX IF NOT EXISTS idx_concordance_type_appartenance
+            ON db_verification_concordance (type_de_verification, appartenance_du_conducteur);
+    END IF;
+
+    IF to_regclass('db_verifications_chargement') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS idx_chargement_agence_jour
+            ON db_verifications_chargement (agences_antennes, jour);
+        CREATE INDEX IF NOT EXISTS idx_chargement_surete_type_appartenance
+            ON db_verifications_chargement (is_surete, type_de_verification, appartenance_du_conducteur);
+    END IF;
+END
+$$;
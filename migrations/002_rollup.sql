@@ -0,0 +1,33 @@
+-- Comptes pré-agrégés des dashboards : contrôles et anomalies par date, créneau d'une demi-heure,
+-- heure, agence, jour, type de vérification, appartenance (et sûreté pour le chargement).
+-- Remplies ici depuis l'historique, puis recalculées date par date après chaque chargement
+-- par rollup.refresh_rollup, avec les mêmes expressions (dashboard_data.DERIVED_DIMENSIONS et ANOMALIE_SQL).
+-- Seules les tables existantes ont leur rollup ici ; une table créée ensuite reçoit le sien à son premier
+-- chargement (rollup.create_rollup). Sans rollup, les dashboards agrègent la table des contrôles.
+DO $$
+BEGIN
+    IF to_regclass('db_verification_concordance') IS NOT NULL THEN
+        CREATE TABLE IF NOT EXISTS db_verification_concordance_rollup AS
+        SELECT date, heure_arrondie, extract(hour FROM heure_de_debut)::int AS heure, agences_antennes, jour,
+               type_de_verification, appartenance_du_conducteur,
+               count(*) AS nb_controles,
+               count(*) FILTER (WHERE upper(trim(anomalie)) IN ('1', 'OUI', 'T', 'TRUE')) AS nb_anomalies
+        FROM db_verification_concordance
+        GROUP BY 1, 2, 3, 4, 5, 6, 7;
+        CREATE INDEX IF NOT EXISTS idx_concordance_rollup_date ON db_verification_concordance_rollup (date);
+        CREATE INDEX IF NOT EXISTS idx_concordance_date ON db_verification_concordance (date);
+    END IF;
+
+    IF to_regclass('db_verifications_chargement') IS NOT NULL THEN
+        CREATE TABLE IF NOT EXISTS db_verifications_chargement_rollup AS
+        SELECT date, heure_arrondie, extract(hour FROM heure_de_debut)::int AS heure, agences_antennes, jour,
+               type_de_verification, appartenance_du_conducteur, is_surete,
+               count(*) AS nb_controles,
+               count(*) FILTER (WHERE upper(trim(anomalie)) IN ('1', 'OUI', 'T', 'TRUE')) AS nb_anomalies
+        FROM db_verifications_chargement
+        GROUP BY 1, 2, 3, 4, 5, 6, 7, 8;
+        CREATE INDEX IF NOT EXISTS idx_chargement_rollup_date ON db_verifications_chargement_rollup (date);
+        CREATE INDEX IF NOT EXISTS idx_chargement_date ON db_verifications_chargement (date);
+    END IF;
+END
+$$;
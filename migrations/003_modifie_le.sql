@@ -0,0 +1,31 @@
+-- Date de dernière écriture de chaque ligne de contrôle : les dashboards en mémoire ne relisent que les lignes
+-- écrites depuis leur dernier chargement (dataset.refresh_dataset). Remplie par défaut à l'insertion, et par
+-- trigger à chaque mise à jour (upsert de pg_loader.merge_staging compris). Les lignes déjà chargées
+-- prennent la date de la migration. Seules les tables existantes sont modifiées ici ; une table créée ensuite
+-- reçoit colonne, trigger et index à son premier chargement (pg_loader.add_modifie_le).
+CREATE OR REPLACE FUNCTION set_modifie_le() RETURNS trigger AS $$
+BEGIN
+    NEW.modifie_le := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF to_regclass('db_verification_concordance') IS NOT NULL THEN
+        ALTER TABLE db_verification_concordance ADD COLUMN IF NOT EXISTS modifie_le timestamptz NOT NULL DEFAULT now();
+        DROP TRIGGER IF EXISTS trg_concordance_modifie_le ON db_verification_concordance;
+        CREATE TRIGGER trg_concordance_modifie_le BEFORE UPDATE ON db_verification_concordance
+            FOR EACH ROW EXECUTE FUNCTION set_modifie_le();
+        CREATE INDEX IF NOT EXISTS idx_concordance_modifie_le ON db_verification_concordance (modifie_le);
+    END IF;
+
+    IF to_regclass('db_verifications_chargement') IS NOT NULL THEN
+        ALTER TABLE db_verifications_chargement ADD COLUMN IF NOT EXISTS modifie_le timestamptz NOT NULL DEFAULT now();
+        DROP TRIGGER IF EXISTS trg_chargement_modifie_le ON db_verifications_chargement;
+        CREATE TRIGGER trg_chargement_modifie_le BEFORE UPDATE ON db_verifications_chargement
+            FOR EACH ROW EXECUTE FUNCTION set_modifie_le();
+        CREATE INDEX IF NOT EXISTS idx_chargement_modifie_le ON db_verifications_chargement (modifie_le);
+    END IF;
+END
+$$;
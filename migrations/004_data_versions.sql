@@ -0,0 +1,9 @@
+-- Version des données de chaque table de contrôles : incrémentée dans la transaction de chaque chargement
+-- (pg_loader.bump_version) et à chaque reconstruction du rollup (rollup.py), elle sert de clé aux caches des
+-- dashboards (dashboard_data.version_query). La date de la dernière incrémentation distingue deux versions de
+-- même numéro si la table est recréée.
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name text PRIMARY KEY,
+    version bigint NOT NULL,
+    modifie_le timestamptz NOT NULL DEFAULT now()
+);
@@ -0,0 +1,135 @@
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from preprocessing_utils import (
+    DIGITS_PATTERN, IMMAT_PATTERN, TOURNEE_PATTERN, parse_vehicle_info, split_tournee_pda_societe
+)
+from stage_cache import digest
+
+# Dictionnaires valeur brute -> valeurs découpées, un fichier Parquet par fonction de découpage
+PARSE_CACHE_DIR = ".parse_cache"
+# Nombre maximal de valeurs distinctes conservées par dictionnaire (les moins récemment vues sont évincées)
+MAX_ENTRIES = 200_000
+
+# Dictionnaires chargés dans le processus : (répertoire, nom) -> (version, table)
+_caches = {}
+
+
+def _cache_file(cache_dir, name, version):
+    return os.path.join(cache_dir, f"{name}-{version}.parquet")
+
+
+def _load(cache_dir, name, version):
+    """Dictionnaire en mémoire, chargé depuis le disque au premier appel (vide si absent)."""
+    cached = _caches.get((cache_dir, name))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    path = _cache_file(cache_dir, name, version)
+    if os.path.exists(path):
+        table = pd.read_parquet(path).set_index("raw")
+    else:
+        table = None
+    _caches[(cache_dir, name)] = (version, table)
+    return table
+
+
+def cached_parse(values, parse, deps=(), name=None, cache_dir=PARSE_CACHE_DIR):
+    """
+    Applique une fonction de découpage de texte libre en ne traitant que les valeurs jamais vues.
+
+    La colonne est factorisée : chaque valeur distincte n'est découpée qu'une fois, puis
+    le résultat est retrouvé dans un dictionnaire persistant (valeur brute -> résultat)
+    enrichi des valeurs nouvelles. Les valeurs sont comparées sous forme de texte, comme
+    les fonctions de découpage les lisent (str(valeur)).
+
+    Le dictionnaire est propre à une version du code de `parse` et de `deps` : modifier
+    une règle de découpage repart d'un dictionnaire vide. Les modifications restent en
+    mémoire jusqu'à flush_parse_caches().
+
+    Args:
+        values (pd.Series): Colonne brute.
+        parse (Callable): Fonction de découpage vectorisée (pd.Series -> pd.DataFrame).
+        deps (Iterable): Motifs et fonctions utilisés par `parse`, pris en compte dans la version.
+        name (str, optional): Nom du dictionnaire, par défaut le nom de `parse`.
+        cache_dir (str): Répertoire des dictionnaires.
+
+    Returns:
+        pd.DataFrame: Même résultat que parse(values), indexé comme `values`.
+    """
+    name = name or parse.__name__
+    version = digest(parse, *deps)[:16]
+    table = _load(cache_dir, name, version)
+    if table is None:
+        table = parse(pd.Series([], dtype=object)).assign(last_used=np.int64(0))
+        table.index = pd.Index([], dtype=object, name="raw")
+
+    present = values.notna().to_numpy()
+    codes = np.full(len(values), -1, dtype=np.intp)
+    present_codes, uniques = pd.factorize(values[present].astype(str))
+    codes[present] = present_codes
+    uniques = pd.Index(uniques, dtype=object)
+
+    now = time.time_ns()
+    positions = table.index.get_indexer(uniques)
+    unseen = positions < 0
+    if unseen.any():
+        # Découper uniquement les valeurs distinctes absentes du dictionnaire
+        parsed = parse(pd.Series(uniques[unseen], dtype=object)).set_axis(uniques[unseen])
+        parsed["last_used"] = now
+        parsed.index.name = "raw"
+        table = pd.concat([table, parsed])
+        positions = table.index.get_indexer(uniques)
+    table.iloc[positions, table.columns.get_loc("last_used")] = now
+    _caches[(cache_dir, name)] = (version, table)
+
+    # Ligne entièrement vide en fin de table pour les valeurs manquantes (code -1)
+    columns = table.columns.drop("last_used")
+    lookup = table[columns].iloc[positions].reset_index(drop=True)
+    lookup = pd.concat([lookup, pd.DataFrame({col: [pd.NA] for col in columns}, dtype="string")],
+                       ignore_index=True)
+    result = lookup.iloc[codes].astype("string")
+    result.index = values.index
+    return result
+
+
+def flush_parse_caches(cache_dir=PARSE_CACHE_DIR, max_entries=MAX_ENTRIES):
+    """
+    Enregistre les dictionnaires chargés dans le processus, évinçant les valeurs les moins
+    récemment vues au-delà de `max_entries`, et supprime les versions périmées.
+
+    Le dictionnaire est fusionné avec la version sur disque, qu'un autre processus (pool de
+    preprocessing2) a pu enrichir entre-temps ; l'écriture passe par un fichier temporaire
+    propre au processus, si bien qu'un dictionnaire n'est jamais à moitié écrit.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    for (directory, name), (version, table) in _caches.items():
+        if directory != cache_dir or table is None:
+            continue
+        path = _cache_file(cache_dir, name, version)
+        if os.path.exists(path):
+            table = pd.concat([pd.read_parquet(path).set_index("raw"), table])
+        table = table.sort_values("last_used", kind="stable")
+        table = table[~table.index.duplicated(keep="last")].iloc[-max_entries:]
+        _caches[(directory, name)] = (version, table)
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        table.reset_index().to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        for stale in glob.glob(os.path.join(glob.escape(cache_dir), f"{glob.escape(name)}-*.parquet")):
+            if stale != path:
+                os.remove(stale)
+
+
+def parse_vehicle_info_cached(values):
+    """parse_vehicle_info avec le dictionnaire persistant des valeurs déjà découpées."""
+    return cached_parse(values, parse_vehicle_info, [IMMAT_PATTERN.pattern])
+
+
+def split_tournee_pda_societe_cached(values):
+    """split_tournee_pda_societe avec le dictionnaire persistant des valeurs déjà découpées."""
+    return cached_parse(values, split_tournee_pda_societe, [TOURNEE_PATTERN.pattern, DIGITS_PATTERN.pattern])
@@ -0,0 +1,241 @@
+import argparse
+import io
+import os
+import tomllib
+
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+
+from dashboard_data import DATA_VERSIONS, MODIFIE_LE, rollup_table
+from ingestion import CHUNKSIZE
+from migrate import apply_migrations
+from rollup import ROLLUP_DATES, create_rollup, has_rollup, mark_rollup_dates, refresh_rollup
+
+# Fichier de secrets partagé avec les dashboards (section [connections.postgresql])
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+# Index des filtres de la barre latérale (clause WHERE de dashboard_data.where_clause), par table de contrôles :
+# ceux de migrations/001, créés aussi par prepare_table pour une table apparue après la migration
+FILTER_INDEXES = {
+    "db_verification_concordance": {
+        "idx_concordance_agence_jour": ["agences_antennes", "jour"],
+        "idx_concordance_type_appartenance": ["type_de_verification", "appartenance_du_conducteur"],
+    },
+    "db_verifications_chargement": {
+        "idx_chargement_agence_jour": ["agences_antennes", "jour"],
+        "idx_chargement_surete_type_appartenance": ["is_surete", "type_de_verification", "appartenance_du_conducteur"],
+    },
+}
+# Colonne de la table de staging numérotant les lignes dans leur ordre d'arrivée (COPY)
+STAGING_SEQ = "_seq"
+
+
+def connect(dsn=None):
+    """
+    Ouvre une connexion psycopg2 vers la base des dashboards.
+
+    Ordre de résolution : `dsn`, variable d'environnement DATABASE_URL, puis la section
+    [connections.postgresql] de .streamlit/secrets.toml utilisée par st.connection.
+    """
+    dsn = dsn or os.environ.get("DATABASE_URL")
+    if dsn:
+        return psycopg2.connect(dsn)
+
+    with open(SECRETS_FILE, "rb") as f:
+        secrets = tomllib.load(f)["connections"]["postgresql"]
+    if "url" in secrets:
+        return psycopg2.connect(secrets["url"])
+    return psycopg2.connect(
+        host=secrets.get("host"), port=secrets.get("port"), dbname=secrets.get("database"),
+        user=secrets.get("username"), password=secrets.get("password"),
+    )
+
+
+def table_columns(cur, table):
+    """Colonnes de la table cible, dans l'ordre de la table."""
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = %s AND table_schema = current_schema() ORDER BY ordinal_position",
+        (table,)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def copy_frame(cur, staging, df, columns):
+    """Envoie un DataFrame dans la table de staging avec COPY FROM STDIN (format CSV)."""
+    buffer = io.StringIO()
+    df.reindex(columns=columns).to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S")
+    buffer.seek(0)
+    cur.copy_expert(
+        sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.Identifier(staging), sql.SQL(", ").join(map(sql.Identifier, columns))
+        ),
+        buffer
+    )
+
+
+def merge_staging(cur, staging, table, columns, key="id"):
+    """
+    Fusionne la table de staging dans la table cible : insertion ou mise à jour sur `key`.
+
+    Une clé présente plusieurs fois dans le flux (ligne corrigée plus bas dans le fichier) ne
+    garde que sa dernière occurrence, celle de plus grand STAGING_SEQ : ON CONFLICT DO UPDATE
+    refuse de modifier deux fois la même ligne.
+    """
+    updates = [col for col in columns if col != key]
+    cur.execute(
+        sql.SQL(
+            "INSERT INTO {table} ({cols}) "
+            "SELECT DISTINCT ON ({key}) {cols} FROM {staging} ORDER BY {key}, {seq} DESC "
+            "ON CONFLICT ({key}) DO UPDATE SET {updates}"
+        ).format(
+            table=sql.Identifier(table),
+            cols=sql.SQL(", ").join(map(sql.Identifier, columns)),
+            staging=sql.Identifier(staging),
+            key=sql.Identifier(key),
+            seq=sql.Identifier(STAGING_SEQ),
+            updates=sql.SQL(", ").join(
+                sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(col)) for col in updates
+            ),
+        )
+    )
+    return cur.rowcount
+
+
+def prepare_table(cur, table):
+    """
+    Met en place ce que les dashboards attendent de `table` : index des filtres (FILTER_INDEXES),
+    table pré-agrégée (rollup.create_rollup) et date de dernière écriture (add_modifie_le).
+
+    Les migrations ne portent que sur les tables présentes lors de leur passage ; appelée à
+    chaque chargement, prepare_table couvre aussi une table créée ensuite. Seuls les éléments
+    absents sont créés : une table déjà prête n'est ni verrouillée ni modifiée.
+    """
+    # Deux chargements simultanés de la même table ne créent pas deux fois le même élément
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"prepare_table:{table}",))
+    for name, columns in FILTER_INDEXES.get(table, {}).items():
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            cur.execute(sql.SQL("CREATE INDEX {} ON {} ({})").format(
+                sql.Identifier(name), sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+            ))
+    columns = table_columns(cur, table)
+    if create_rollup(cur, table, columns):
+        print(f"Table pré-agrégée {rollup_table(table)} créée")
+    add_modifie_le(cur, table, columns)
+
+
+def add_modifie_le(cur, table, columns):
+    """
+    Ajoute à `table`, comme la migration 003, la colonne modifie_le (date de dernière écriture
+    d'une ligne, lue par dataset.refresh_dataset), son trigger de mise à jour et son index.
+    Seuls les éléments absents sont créés.
+    """
+    # Mêmes noms que la migration 003 (trg_concordance_modifie_le, idx_chargement_modifie_le...)
+    alias = table.rsplit("_", 1)[-1]
+    if MODIFIE_LE not in columns:
+        cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN {} timestamptz NOT NULL DEFAULT now()").format(
+            sql.Identifier(table), sql.Identifier(MODIFIE_LE)
+        ))
+    cur.execute("SELECT to_regproc('set_modifie_le')")
+    if cur.fetchone()[0] is None:
+        cur.execute(
+            "CREATE FUNCTION set_modifie_le() RETURNS trigger AS $$ "
+            "BEGIN NEW.modifie_le := now(); RETURN NEW; END; $$ LANGUAGE plpgsql"
+        )
+    trigger = f"trg_{alias}_modifie_le"
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgrelid = %s::regclass AND tgname = %s", (table, trigger))
+    if cur.fetchone() is None:
+        cur.execute(
+            sql.SQL("CREATE TRIGGER {} BEFORE UPDATE ON {} FOR EACH ROW EXECUTE FUNCTION set_modifie_le()").format(
+                sql.Identifier(trigger), sql.Identifier(table)
+            )
+        )
+    index = f"idx_{alias}_modifie_le"
+    cur.execute("SELECT to_regclass(%s)", (index,))
+    if cur.fetchone()[0] is None:
+        cur.execute(sql.SQL("CREATE INDEX {} ON {} ({})").format(
+            sql.Identifier(index), sql.Identifier(table), sql.Identifier(MODIFIE_LE)
+        ))
+
+
+def bump_version(cur, table):
+    """
+    Incrémente la version des données de `table` (DATA_VERSIONS), clé des caches des
+    dashboards : à appeler dans la transaction qui écrit les lignes.
+    """
+    cur.execute(
+        sql.SQL(
+            "INSERT INTO {versions} (table_name, version) VALUES (%s, 1) "
+            "ON CONFLICT (table_name) DO UPDATE SET version = {versions}.version + 1, modifie_le = now()"
+        ).format(versions=sql.Identifier(DATA_VERSIONS)),
+        (table,)
+    )
+
+
+def tee_postgres(chunks, table, dsn=None, key="id"):
+    """
+    Charge chaque bloc dans PostgreSQL et le transmet tel quel à l'étape suivante.
+
+    Les blocs sont copiés dans une table de staging temporaire (COPY FROM STDIN), puis
+    fusionnés dans `table` une fois le flux épuisé : staging et fusion forment une seule
+    transaction, annulée si le flux est interrompu. La table cible doit avoir une
+    contrainte d'unicité sur `key` ; seules ses colonnes présentes dans les blocs sont chargées.
+    Les migrations en attente, puis la mise en place de `table` (prepare_table), sont
+    appliquées avant le chargement ; le rollup des dashboards est recalculé pour les dates
+    touchées et la version des données incrémentée (bump_version), dans la transaction de la fusion.
+    """
+    staging = f"staging_{table}"
+    conn = connect(dsn)
+    try:
+        apply_migrations(conn)
+        with conn, conn.cursor() as cur:
+            prepare_table(cur, table)
+        with conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS, {} bigserial) ON COMMIT DROP").format(
+                    sql.Identifier(staging), sql.Identifier(table), sql.Identifier(STAGING_SEQ)
+                )
+            )
+            target_columns = table_columns(cur, table)
+            columns = None
+            for chunk in chunks:
+                if columns is None:
+                    columns = [col for col in target_columns if col in chunk.columns]
+                copy_frame(cur, staging, chunk, columns)
+                yield chunk
+            if columns:
+                rollup = has_rollup(cur, table)
+                if rollup:
+                    mark_rollup_dates(cur, staging, table, key)
+                rows = merge_staging(cur, staging, table, columns, key)
+                print(f"{rows} lignes chargées dans {table}")
+                if rollup:
+                    # Comptes pré-agrégés des dates touchées, dans la même transaction que la fusion
+                    refresh_rollup(cur, table, ROLLUP_DATES)
+                bump_version(cur, table)
+    finally:
+        conn.close()
+
+
+def load_csv(path, table, dsn=None, key="id", chunksize=CHUNKSIZE):
+    """
+    Charge un CSV produit par le preprocessing dans `table`, bloc par bloc.
+
+    Returns:
+        int: Nombre de lignes lues dans le CSV.
+    """
+    total = 0
+    chunks = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[""], chunksize=chunksize)
+    for chunk in tee_postgres(chunks, table, dsn, key):
+        total += len(chunk)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Charge un CSV prétraité dans PostgreSQL (COPY + upsert sur id).")
+    parser.add_argument("csv", help="fichier CSV produit par preprocessing.py ou preprocessing2.py")
+    parser.add_argument("table", help="table cible, par exemple db_verification_concordance")
+    parser.add_argument("--dsn", help="chaîne de connexion (par défaut DATABASE_URL ou .streamlit/secrets.toml)")
+    args = parser.parse_args()
+    load_csv(args.csv, args.table, args.dsn)
@@ -1,76 +1,38 @@
+import argparse
+
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import openpyxl
 import re
 
-df = pd.read_excel("VERIFICATION DE CONCORDANCE DE CHARGEMENT.xlsx", engine="openpyxl", skiprows=[1,1])
-
-def extract_vehicle_info(value):
-    if pd.isna(value):
-        return pd.NA, pd.NA
-    
-    value = str(value).upper().strip()
-    immat_pattern = r'[A-Z]{1,2}-?\d{2,3}-?[A-Z]{1,2}|[A-Z]{1,2}\d{2,3}[A-Z]{1,2}'
-    immat_match = re.search(immat_pattern, value.replace(" ", ""))
-    
-    if immat_match:
-        immat = immat_match.group(0)
-        immat = immat.replace("-", "")
-        if len(immat) >= 5:
-            immat_standard = f"{immat[:2]}-{immat[2:-2]}-{immat[-2:]}"
-        else:
-            immat_standard = immat
-        type_vehicule = value.replace(immat_match.group(0), "").strip().replace("/", "").strip()
-        if not type_vehicule:
-            type_vehicule = "INCONNU"
-    else:
-        type_vehicule = value
-        immat_standard = pd.NA
-    
-    return type_vehicule, immat_standard
-
-def extract_tournee_pda_societe(value):
-    if pd.isna(value):
-        return pd.NA, pd.NA, pd.NA
-    
-    value = str(value).upper().strip()
-    pattern = r'^(\d+)(?:[\s/]*([A-Z]))?(?:[\s/]*(.*))?$'
-    match = re.match(pattern, value.replace("/", " ").strip())
-    
-    tournee = pd.NA
-    pda = pd.NA
-    societe = pd.NA
-    
-    if match:
-        tournee = match.group(1)
-        pda = match.group(2) if match.group(2) else pd.NA
-        societe = match.group(3) if match.group(3) else pd.NA
-    else:
-        if re.match(r'^\d+$', value):
-            tournee = value
-        else:
-            societe = value
-    
-    if pd.notna(societe):
-        societe = re.sub(r'\s+', ' ', societe.strip())
-        if not societe:
-            societe = pd.NA
-    
-    return tournee, pda, societe
-
-def arrondir_demi_heure(dt):
-    minute = dt.minute
-    if minute < 15:
-        minute = 0
-    elif minute < 45:
-        minute = 30
-    else:
-        dt += pd.Timedelta(hours=1)
-        minute = 0
-    return dt.replace(minute=minute, second=0, microsecond=0)
-
-def preprocessing(df):
+from export import tee_parquet
+from instrumentation import add_rows, finish_run, report_path, start_run, step, timed_chunks
+from ingestion import (
+    CHUNKSIZE, empty_watermark, iter_excel_chunks, load_watermark, save_watermark, split_delta,
+    upsert_csv_chunks, watermark_path, write_csv_chunks
+)
+from parse_cache import (
+    cached_parse, flush_parse_caches, parse_vehicle_info_cached, split_tournee_pda_societe_cached
+)
+from pg_loader import tee_postgres
+from preprocessing_utils import (
+    CRENEAUX_DEMI_HEURE, DIGITS_PATTERN, IMMAT_PATTERN, JOURS_FR, MINUTES_PAR_JOUR, REGION_AGENCE_COLUMNS,
+    TOURNEE_PATTERN, coalesce_agences, derive_temporal_features, parse_vehicle_info, region_agence_columns,
+    split_tournee_pda_societe
+)
+from stage_cache import (
+    cached_read, chunk_key, digest, is_exported, is_read_cached, mark_exported, prune_cache, read_chunk_count,
+    read_key, run_stages, stage_keys
+)
+
+INPUT_FILE = "VERIFICATION DE CONCORDANCE DE CHARGEMENT.xlsx"
+READ_OPTIONS = {"skiprows": [1]}
+OUTPUT_FILE = "verif_concordance1.csv"
+PARQUET_DIR = "verif_concordance1.parquet"
+TABLE = "db_verification_concordance"
+
+def stage_coalesce(df):
     # Ensure 'id' column exists; if not, you may need to generate it (e.g., df.index + 1)
     if 'id' not in df.columns and 'Id' not in df.columns:
         print("Warning: 'id' column not found in Excel. You may need to generate it manually.")
@@ -81,32 +43,30 @@ def preprocessing(df):
         df.rename(columns={'Id': 'id'}, inplace=True)
 
     # Handle AGENCES/ANTENNES based on REGION
-    df["agences_antennes"] = ""
-    for index, row in df.iterrows():
-        if row["REGION"] == "REGION EST":
-            df.at[index, "agences_antennes"] = row["AGENCES/ ANTENNES REGION EST"]
-        elif row["REGION"] == "REGION NORD":
-            df.at[index, "agences_antennes"] = row["AGENCES/ANTENNES REGION NORD"]
-        elif row["REGION"] == "REGION OUEST":
-            df.at[index, "agences_antennes"] = row["AGENCES/ANTENNES REGION OUEST"]
-        elif row["REGION"] == "REGION SUD":
-            df.at[index, "agences_antennes"] = row["AGENCES/ANTENNES REGION SUD"]
-
-    # Drop unnecessary columns
-    df = df.drop(columns=["AGENCES/ ANTENNES REGION EST", "AGENCES/ANTENNES REGION NORD", 
-                          "AGENCES/ANTENNES REGION OUEST", "AGENCES/ANTENNES REGION SUD"], errors='ignore')
+    return coalesce_agences(df, target="agences_antennes")
 
+def stage_parse(df):
     # Extract vehicle info (though these columns are dropped as they aren't in the table)
-    df[["Type de véhicule", "Immatriculation"]] = df["Type de véhicule / immatriculation"].apply(
-        lambda x: pd.Series(extract_vehicle_info(x))
-    )
+    df[["Type de véhicule", "Immatriculation"]] = parse_vehicle_info_cached(df["Type de véhicule / immatriculation"])
     df = df.drop(columns=["Type de véhicule / immatriculation"], errors='ignore')
 
     # Extract tournée, PDA, and nom de la société
-    df[["tournee", "pda", "nom_de_la_societe"]] = df["Tournée / PDA / Nom de la société si DSP"].apply(
-        lambda x: pd.Series(extract_tournee_pda_societe(x))
-    )
+    df[["tournee", "pda", "nom_de_la_societe"]] = split_tournee_pda_societe_cached(df["Tournée / PDA / Nom de la société si DSP"])
+    return df
 
+def stage_derive(df):
+    # Convert datetime columns
+    df["Heure de début"] = pd.to_datetime(df["Heure de début"], errors='coerce')
+    df["Heure de fin"] = pd.to_datetime(df["Heure de fin"], errors='coerce')
+    df["Date"] = pd.to_datetime(df["Date"], errors='coerce')
+
+    # Derive jour (in French, capitalized) and heure_arrondie as string (HH:MM:SS)
+    temporal = derive_temporal_features(df["Heure de début"])
+    df["jour"] = temporal["jour"].str.upper()
+    df["heure_arrondie"] = temporal["heure_arrondie"]
+    return df
+
+def stage_rename(df):
     # Rename columns to match table schema
     df.rename(columns={
         "Heure de début": "heure_de_debut",
@@ -134,17 +94,6 @@ def preprocessing(df):
                      "Commentaires divers", "Type de véhicule", "Immatriculation"], 
             inplace=True, errors='ignore')
 
-    # Convert datetime columns
-    df["heure_de_debut"] = pd.to_datetime(df["heure_de_debut"], errors='coerce')
-    df["heure_de_fin"] = pd.to_datetime(df["heure_de_fin"], errors='coerce')
-    df["date"] = pd.to_datetime(df["date"], errors='coerce')
-
-    # Derive jour column (in French, capitalized)
-    df["jour"] = df["heure_de_debut"].dt.day_name(locale='fr_FR').str.upper()
-
-    # Derive heure_arrondie as string (HH:MM:SS)
-    df["heure_arrondie"] = df["heure_de_debut"].apply(arrondir_demi_heure).dt.strftime('%H:%M:%S')
-
     # Ensure all columns are uppercase where appropriate
     for col in ["lieu_de_la_verification", "appartenance_du_conducteur", 
                 "tournee_pda_nom_societe", "type_de_verification", "region", 
@@ -158,7 +107,118 @@ def preprocessing(df):
 
     return df
 
-df = preprocessing(df)
+# Named stages of preprocessing(): (name, function, helpers and settings it depends on).
+# The stage cache keys each stage's output on its code and on these dependencies.
+STAGES = [
+    ("coalesce", stage_coalesce, [coalesce_agences, region_agence_columns, REGION_AGENCE_COLUMNS]),
+    ("parse", stage_parse, [parse_vehicle_info, split_tournee_pda_societe, parse_vehicle_info_cached,
+                            split_tournee_pda_societe_cached, cached_parse,
+                            IMMAT_PATTERN.pattern, TOURNEE_PATTERN.pattern, DIGITS_PATTERN.pattern]),
+    ("derive", stage_derive, [derive_temporal_features, JOURS_FR, CRENEAUX_DEMI_HEURE, MINUTES_PAR_JOUR]),
+    ("rename", stage_rename, []),
+]
 
-# Save to CSV
-df.to_csv("verif_concordance1.csv", index=False)
\ No newline at end of file
+def preprocessing(df):
+    for name, stage, _ in STAGES:
+        with step(name, len(df)):
+            df = stage(df)
+    return df
+
+
+def export_key(load=False):
+    """
+    Cache key of the export stage, or None while the workbook has not been read into the cache.
+
+    It covers the key of every chunk's last stage and the output settings.
+    """
+    key = read_key(INPUT_FILE, CHUNKSIZE, READ_OPTIONS)
+    if not is_read_cached(key):
+        return None
+    final_keys = [stage_keys(chunk_key(key, i), STAGES)[-1] for i in range(read_chunk_count(key))]
+    return digest(*final_keys, OUTPUT_FILE, PARQUET_DIR, TABLE if load else None)
+
+def run(incremental=False, load=False, use_cache=True, profile=False):
+    """
+    Run the whole pipeline, or only the rows added or changed since the last run.
+
+    Every run records a watermark (row fingerprints) next to the CSV; in incremental
+    mode, rows whose fingerprint is unchanged are skipped and the others are upserted
+    into the existing CSV and Parquet dataset on 'id'.
+
+    Full runs go through the stage cache: each stage's output is stored under a key
+    derived from its input, code and settings, so a rerun resumes at the first changed
+    stage and skips the export when nothing changed at all.
+
+    With `profile`, wall time, CPU time, row counts and RSS delta are recorded for every
+    step, printed as a table and saved as a JSON report next to the CSV.
+    """
+    if profile:
+        start_run("preprocessing")
+    watermark_file = watermark_path(OUTPUT_FILE)
+    with step("watermark"):
+        watermark = load_watermark(watermark_file) if incremental else empty_watermark()
+    # Without a watermark every row is new: a full run is equivalent and cheaper
+    incremental = incremental and len(watermark) > 0
+    # Incremental runs already skip unchanged rows; the stage cache is for full runs
+    use_cache = use_cache and not incremental
+    updates = []
+
+    if use_cache and is_exported(export_key(load), [OUTPUT_FILE, PARQUET_DIR, watermark_file]):
+        print(f"{OUTPUT_FILE} is up to date")
+        finish_run(report_path(OUTPUT_FILE), output=OUTPUT_FILE, rows_written=0)
+        return
+
+    def delta_chunks():
+        # Stream the workbook in fixed-size chunks so memory stays flat
+        if use_cache:
+            key = read_key(INPUT_FILE, CHUNKSIZE, READ_OPTIONS)
+            chunks = cached_read(key, lambda: iter_excel_chunks(INPUT_FILE, CHUNKSIZE, **READ_OPTIONS))
+        else:
+            chunks = iter_excel_chunks(INPUT_FILE, CHUNKSIZE, **READ_OPTIONS)
+        # Ids met across the whole workbook: a repeated id is keyed on its position
+        seen_ids = set()
+        for i, chunk in enumerate(timed_chunks("read", chunks)):
+            with step("delta", len(chunk)):
+                delta, update = split_delta(chunk, watermark, seen_ids=seen_ids)
+            updates.append(update)
+            if not len(delta):
+                continue
+            if use_cache:
+                yield run_stages(chunk_key(key, i), lambda: delta, STAGES)[0]
+            else:
+                yield preprocessing(delta)
+
+    # Typed, partitioned Parquet copy written alongside the CSV
+    chunks = timed_chunks("parquet", tee_parquet(delta_chunks(), PARQUET_DIR, incremental=incremental))
+    if load:
+        # Bulk load into PostgreSQL (COPY into a staging table, then upsert on 'id')
+        chunks = timed_chunks("postgres", tee_postgres(chunks, TABLE))
+    with step("csv"):
+        if incremental:
+            total = upsert_csv_chunks(chunks, OUTPUT_FILE, key="id", index=False)
+        else:
+            total = write_csv_chunks(chunks, OUTPUT_FILE, index=False)
+    add_rows("csv", total)
+    with step("watermark"):
+        save_watermark(watermark_file, watermark, updates)
+    flush_parse_caches()
+    if use_cache:
+        mark_exported(export_key(load))
+        # Old workbook versions and stage outputs are no longer read: keep the cache within CACHE_MAX_BYTES
+        prune_cache()
+    print(f"{total} rows written to {OUTPUT_FILE}")
+    finish_run(report_path(OUTPUT_FILE), output=OUTPUT_FILE, rows_written=total)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process rows added or changed since the last run")
+    parser.add_argument("--load", action="store_true",
+                        help=f"load the processed rows into the {TABLE} table")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute every stage instead of reusing the stage cache")
+    parser.add_argument("--profile", action="store_true",
+                        help="time every step and write a JSON run report next to the CSV")
+    args = parser.parse_args()
+    run(incremental=args.incremental, load=args.load, use_cache=not args.no_cache, profile=args.profile)
@@ -1,120 +1,231 @@
+import argparse
+import glob
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import openpyxl
 import re
 
-# Charger les fichiers Excel
-df1 = pd.read_excel("VERIFICATION DE CONCORDANCE DE CHARGEMENT VERIFICATION DOCUMENTAIRE - ETAT DES VEHICULES.xlsx", engine="openpyxl")
-df2 = pd.read_excel("VERIFICATION DE CONCORDANCE DE CHARGEMENT.xlsx", engine="openpyxl", skiprows=[1, 1])
+from export import tee_parquet
+from instrumentation import (
+    add_rows, enabled, finish_run, merge_steps, report_path, start_run, step, stop_run, timed_chunks
+)
+from ingestion import (
+    CHUNKSIZE, empty_watermark, iter_excel_chunks, load_watermark, read_excel_header, save_watermark,
+    source_id, split_delta, upsert_csv_chunks, watermark_path, write_csv_chunks
+)
+from parse_cache import (
+    cached_parse, flush_parse_caches, parse_vehicle_info_cached, split_tournee_pda_societe_cached
+)
+from pg_loader import tee_postgres
+from preprocessing_utils import (
+    CRENEAUX_DEMI_HEURE, DIGITS_PATTERN, IMMAT_PATTERN, JOURS_FR, MINUTES_PAR_JOUR, REGION_AGENCE_COLUMNS,
+    TOURNEE_PATTERN, coalesce_agences, derive_temporal_features, parse_vehicle_info, region_agence_columns,
+    split_tournee_pda_societe
+)
+from stage_cache import (
+    CACHE_DIR, cached_read, chunk_key, digest, is_exported, is_read_cached, mark_exported, prune_cache,
+    read_chunk_count, read_key, run_stages, stage_keys
+)
+
+# Fichiers Excel : (chemin, options de lecture, valeur de 'is_surete')
+FICHIER_DOCUMENTAIRE = "VERIFICATION DE CONCORDANCE DE CHARGEMENT\xa0VERIFICATION DOCUMENTAIRE - ETAT DES VEHICULES.xlsx"
+FICHIER_CHARGEMENT = "VERIFICATION DE CONCORDANCE DE CHARGEMENT.xlsx"
+CLASSEURS = [
+    (FICHIER_DOCUMENTAIRE, {}, False),
+    (FICHIER_CHARGEMENT, {"skiprows": [1]}, True),
+]
+OUTPUT_FILE = "verif_concordance2.csv"
+PARQUET_DIR = "verif_concordance2.parquet"
+TABLE = "db_verifications_chargement"
 
-# Étape 1 : Renommer les colonnes du premier DataFrame pour correspondre au second
+# Renommer les colonnes du premier classeur pour correspondre au second
 rename_dict = {
     'Date du contrôle': 'Date',
     'Personne en charge de la vérification': 'Nom de la personne en charge de la vérification',
     'Tournée / PDA / Nom de la société si besoin': 'Tournée / PDA / Nom de la société si DSP',
     'Type de véhicule / Immatriculation': 'Type de véhicule / immatriculation'
 }
-df1 = df1.rename(columns=rename_dict)
 
-# Étape 2 : Ajouter la colonne 'is_surete'
-df1['is_surete'] = False
-df2['is_surete'] = True
+def classeur_options(path):
+    """
+    Options de lecture et valeur de 'is_surete' d'un classeur, d'après son nom de fichier.
 
-# Étape 3 : Supprimer la colonne 'id' ou 'Id' des deux DataFrames pour éviter les doublons
-for df in [df1, df2]:
-    if 'Id' in df.columns:
-        df.drop(columns=['Id'], inplace=True)
-    if 'id' in df.columns:
-        df.drop(columns=['id'], inplace=True)
+    Les classeurs de vérification documentaire n'ont pas de ligne à ignorer et ne relèvent
+    pas de la sûreté ; les classeurs de concordance de chargement ont une ligne de consignes
+    sous l'en-tête.
+    """
+    if "DOCUMENTAIRE" in os.path.basename(path).upper():
+        return {}, False
+    return {"skiprows": [1]}, True
 
-# Étape 4 : Concaténer les deux DataFrames
-df_combined = pd.concat([df1, df2], ignore_index=True)
 
-# Étape 5 : Générer une nouvelle colonne 'id' avec des valeurs uniques
-df_combined['id'] = range(1, len(df_combined) + 1)
+def list_classeurs(patterns):
+    """
+    Liste les classeurs désignés par des répertoires ou des motifs glob.
 
-def extract_vehicle_info(value):
-    if pd.isna(value):
-        return pd.NA, pd.NA
-    
-    # Convertir en majuscule pour homogénéité
-    value = str(value).upper().strip()
-    
-    # Expression régulière pour détecter les immatriculations (format XX-123-YY ou similaire)
-    immat_pattern = r'[A-Z]{1,2}-?\d{2,3}-?[A-Z]{1,2}|[A-Z]{1,2}\d{2,3}[A-Z]{1,2}'
-    
-    # Chercher l'immatriculation dans la valeur
-    immat_match = re.search(immat_pattern, value.replace(" ", ""))
-    
-    if immat_match:
-        immat = immat_match.group(0)
-        # Standardiser le format de l'immatriculation (ajouter des tirets si nécessaire)
-        immat = immat.replace("-", "")  # Supprimer les tirets existants
-        if len(immat) >= 5:  # Vérifier que l'immatriculation a assez de caractères
-            immat_standard = f"{immat[:2]}-{immat[2:-2]}-{immat[-2:]}"
-        else:
-            immat_standard = immat
-        
-        # Extraire le type de véhicule (tout ce qui est avant l'immatriculation)
-        type_vehicule = value.replace(immat_match.group(0), "").strip().replace("/", "").strip()
-        if not type_vehicule:  # Si vide, assigner "INCONNU"
-            type_vehicule = "INCONNU"
-    else:
-        # Si aucune immatriculation n'est trouvée, toute la valeur est le type de véhicule
-        type_vehicule = value
-        immat_standard = pd.NA
-    
-    return type_vehicule, immat_standard
+    Un répertoire désigne tous les .xlsx qu'il contient. Les fichiers sont triés par
+    chemin (l'ordre de numérotation des id), sans doublons ni fichiers verrous "~$".
 
-# Fonction pour extraire tournée, PDA et nom de la société
-def extract_tournee_pda_societe(value):
-    if pd.isna(value):
-        return pd.NA, pd.NA, pd.NA
-    
-    # Convertir en majuscule et nettoyer les espaces inutiles
-    value = str(value).upper().strip()
-    
-    # Expression régulière pour capturer :
-    # - Tournée : séquence de chiffres
-    # - PDA : une seule lettre juste après la tournée (éventuellement séparée par un espace ou "/")
-    # - Société : tout ce qui suit après la tournée et le PDA
-    pattern = r'^(\d+)(?:[\s/]*([A-Z]))?(?:[\s/]*(.*))?$'
-    match = re.match(pattern, value.replace("/", " ").strip())
-    
-    tournee = pd.NA
-    pda = pd.NA
-    societe = pd.NA
-    
-    if match:
-        tournee = match.group(1)  # Numéro de tournée
-        pda = match.group(2) if match.group(2) else pd.NA  # PDA (une seule lettre)
-        societe = match.group(3) if match.group(3) else pd.NA  # Nom de la société
+    Returns:
+        list: Tuples (chemin, options de lecture, valeur de 'is_surete'), comme CLASSEURS.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.xlsx")
+        paths.update(path for path in glob.glob(pattern) if not os.path.basename(path).startswith("~$"))
+    return [(path, *classeur_options(path)) for path in sorted(paths)]
+
+
+def common_columns(classeurs):
+    """Colonnes communes, après renommage et sans les colonnes 'id' / 'Id' d'origine."""
+    columns = []
+    for path, options, _ in classeurs:
+        for col in read_excel_header(path, **options):
+            col = rename_dict.get(col, col)
+            if col not in columns and col not in ('Id', 'id'):
+                columns.append(col)
+    return columns + ['is_surete', 'id']
+
+
+def align_chunk(chunk, is_surete, columns, ids):
+    """Renomme, ajoute 'is_surete' et aligne un bloc brut sur les colonnes communes (supprime 'id' / 'Id')."""
+    chunk = chunk.rename(columns=rename_dict)
+    chunk['is_surete'] = is_surete
+    chunk = chunk.reindex(columns=columns).astype(object)
+    chunk['id'] = ids
+    return chunk
+
+
+def iter_classeur_chunks(path, options, is_surete, columns, watermark, chunksize=CHUNKSIZE, cache_dir=None):
+    """
+    Lit un classeur en flux et produit ses blocs prétraités, sans attribuer les id.
+
+    Seules les lignes nouvelles ou modifiées depuis le filigrane sont prétraitées. La
+    colonne 'id' vaut l'id déjà attribué à une ligne modifiée, -1 pour une ligne nouvelle.
+
+    Avec `cache_dir`, la lecture et chaque étape de STAGES passent par le cache des étapes
+    (à réserver aux exécutions complètes : les blocs doivent être des blocs bruts entiers).
+
+    Yields:
+        tuple: (bloc prétraité, mises à jour du filigrane pour les lignes du bloc).
+    """
+    source = source_id(path)
+    if cache_dir:
+        key = read_key(path, chunksize, options)
+        chunks = cached_read(key, lambda: iter_excel_chunks(path, chunksize, **options), cache_dir)
     else:
-        # Si pas de match, considérer la valeur entière comme société ou tournée
-        if re.match(r'^\d+$', value):
-            tournee = value
+        chunks = iter_excel_chunks(path, chunksize, **options)
+    # Ids rencontrés dans tout le classeur : un id répété prend une clé de position
+    seen_ids = set()
+    for i, chunk in enumerate(timed_chunks("read", chunks)):
+        # Ne garder que les lignes nouvelles ou modifiées depuis le filigrane
+        with step("delta", len(chunk)):
+            chunk, update = split_delta(chunk, watermark, source, seen_ids)
+        if chunk.empty:
+            yield chunk, update
+            continue
+
+        ids = update['id'].to_numpy()
+        if cache_dir:
+            base = chunk_key(key, i, is_surete, columns, rename_dict, align_chunk)
+            processed, _ = run_stages(base, lambda: align_chunk(chunk, is_surete, columns, ids), STAGES, cache_dir)
         else:
-            societe = value
-    
-    # Nettoyer la société (supprimer espaces multiples et barres obliques)
-    if pd.notna(societe):
-        societe = re.sub(r'\s+', ' ', societe.strip())
-        if not societe:  # Si vide après nettoyage
-            societe = pd.NA
-    
-    return tournee, pda, societe
-
-def arrondir_demi_heure(dt):
-    minute = dt.minute
-    if minute < 15:
-        minute = 0
-    elif minute < 45:
-        minute = 30
+            processed = preprocessing(align_chunk(chunk, is_surete, columns, ids))
+        yield processed, update
+
+
+def _preprocess_classeur(path, options, is_surete, columns, watermark, chunksize, cache_dir, workdir, profile):
+    """
+    Tâche d'un processus de travail : prétraite un classeur et écrit ses blocs sur disque.
+
+    Returns:
+        tuple: (liste des tuples (fichier du bloc prétraité, mises à jour du filigrane) dans
+            l'ordre du classeur, étapes mesurées si `profile`).
+    """
+    if profile:
+        start_run(path)
+    parts = []
+    prefix = os.path.join(workdir, f"{source_id(path):07x}")
+    for i, (chunk, update) in enumerate(iter_classeur_chunks(path, options, is_surete, columns, watermark, chunksize, cache_dir)):
+        part = f"{prefix}-{i:05d}.pkl"
+        chunk.to_pickle(part)
+        parts.append((part, update))
+    flush_parse_caches()
+    return parts, stop_run()
+
+
+def _iter_parallel_chunks(classeurs, columns, watermark, chunksize, cache_dir, workers):
+    """Prétraite les classeurs dans un pool de processus et relit leurs blocs dans l'ordre des classeurs."""
+    with tempfile.TemporaryDirectory(prefix="preprocessing2-") as workdir:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_preprocess_classeur, path, options, is_surete, columns, watermark, chunksize, cache_dir,
+                            workdir, enabled())
+                for path, options, is_surete in classeurs
+            ]
+            for future in futures:
+                # Attente des processus de travail (leurs propres étapes sont ajoutées ensuite)
+                with step("workers"):
+                    parts, steps = future.result()
+                merge_steps(steps)
+                for part, update in parts:
+                    with step("transfer", len(update)):
+                        chunk = pd.read_pickle(part)
+                        os.remove(part)
+                    yield chunk, update
+
+
+def iter_processed_chunks(classeurs=CLASSEURS, chunksize=CHUNKSIZE, watermark=None, updates=None, workers=1,
+                          cache_dir=None):
+    """
+    Lit et prétraite les classeurs, et produit des blocs au schéma de la table SQL.
+
+    Les blocs contiennent l'union des colonnes des classeurs (comme pd.concat), la colonne
+    'is_surete' et un 'id' unique numéroté à la suite, dans l'ordre de `classeurs`.
+
+    Avec `workers` > 1, chaque classeur est lu et prétraité dans un pool de processus ;
+    les id sont attribués ensuite, dans l'ordre des classeurs : le résultat ne dépend ni
+    du nombre de processus ni de l'ordre dans lequel ils terminent.
+
+    Avec un filigrane, seules les lignes nouvelles ou modifiées sont produites : une ligne
+    modifiée garde son 'id', une ligne nouvelle reçoit le suivant. Les mises à jour du
+    filigrane sont ajoutées à la liste `updates`. `cache_dir` active le cache des étapes
+    (voir iter_classeur_chunks).
+    """
+    if watermark is None:
+        watermark = empty_watermark()
+    columns = common_columns(classeurs)
+
+    if workers > 1 and len(classeurs) > 1:
+        chunks = _iter_parallel_chunks(classeurs, columns, watermark, chunksize, cache_dir, workers)
     else:
-        dt += pd.Timedelta(hours=1)
-        minute = 0
-    return dt.replace(minute=minute, second=0, microsecond=0)
+        chunks = (
+            item
+            for path, options, is_surete in classeurs
+            for item in iter_classeur_chunks(path, options, is_surete, columns, watermark, chunksize, cache_dir)
+        )
+
+    next_id = int(watermark['id'].max()) + 1 if len(watermark) else 1
+    for chunk, update in chunks:
+        # Attribuer un id aux lignes nouvelles (unique sur l'ensemble des classeurs)
+        new = update['id'].to_numpy() < 0
+        update.loc[new, 'id'] = np.arange(next_id, next_id + new.sum())
+        next_id += int(new.sum())
+        if updates is not None:
+            updates.append(update)
+        if chunk.empty:
+            continue
+
+        ids = update['id'].to_numpy()
+        chunk.index = pd.Index(ids - 1)
+        chunk['id'] = ids
+        yield chunk
 
 import pandas as pd
 import re
@@ -194,29 +305,20 @@ def rename_columns(df):
 
     return df
 
-def preprocessing(df):
-    df["AGENCES/ANTENNES"] = ""
-    for index, row in df.iterrows():
-        if row["REGION"] == "REGION EST":
-            df.at[index, "AGENCES/ANTENNES"] = row["AGENCES/ ANTENNES REGION EST"]
-        elif row["REGION"] == "REGION NORD":
-            df.at[index, "AGENCES/ANTENNES"] = row["AGENCES/ANTENNES REGION NORD"]
-        elif row["REGION"] == "REGION OUEST":
-            df.at[index, "AGENCES/ANTENNES"] = row["AGENCES/ANTENNES REGION OUEST"]
-        elif row["REGION"] == "REGION SUD":
-            df.at[index, "AGENCES/ANTENNES"] = row["AGENCES/ANTENNES REGION SUD"]
-    
-    # Supprimer les colonnes inutiles
-    df = df.drop(columns=["AGENCES/ ANTENNES REGION EST", "AGENCES/ANTENNES REGION NORD", 
-                          "AGENCES/ANTENNES REGION OUEST", "AGENCES/ANTENNES REGION SUD"])
+def stage_coalesce(df):
+    """Étape "coalesce" : renseigne AGENCES/ANTENNES et normalise le nom du contrôleur."""
+    # Renseigner AGENCES/ANTENNES à partir de la colonne propre à chaque région
+    df = coalesce_agences(df, target="AGENCES/ANTENNES")
 
     df["Nom"] = df["Nom"].str.upper()
     df["Nom"] = df["Nom"].str.replace("-", " ", regex=False)
+    return df
 
+
+def stage_parse(df):
+    """Étape "parse" : découpe les colonnes de texte libre (véhicule, tournée / PDA / société)."""
     # Appliquer la fonction pour créer deux nouvelles colonnes
-    df[["Type de véhicule", "Immatriculation"]] = df["Type de véhicule / immatriculation"].apply(
-        lambda x: pd.Series(extract_vehicle_info(x))
-    )
+    df[["Type de véhicule", "Immatriculation"]] = parse_vehicle_info_cached(df["Type de véhicule / immatriculation"])
     
     # Supprimer la colonne originale
     df = df.drop(columns=["Type de véhicule / immatriculation"])
@@ -227,27 +329,34 @@ def preprocessing(df):
 
     
     # Appliquer la fonction pour créer trois nouvelles colonnes
-    df[["Tournée", "PDA", "Nom de la société"]] = df["Tournée / PDA / Nom de la société si DSP"].apply(
-        lambda x: pd.Series(extract_tournee_pda_societe(x))
-    )
+    df[["Tournée", "PDA", "Nom de la société"]] = split_tournee_pda_societe_cached(df["Tournée / PDA / Nom de la société si DSP"])
     
     # Standardiser : tout en majuscule
     df["PDA"] = df["PDA"].str.upper()
     df["Nom de la société"] = df["Nom de la société"].str.upper()
-    
-    df.drop(columns=["Matière dangereuse"],inplace=True)
-    df.rename(columns={"ANOMALIE DE CHARGEMENT\xa0":"ANOMALIE DE CHARGEMENT"},inplace = True)
-    df.rename(columns={"Commentaires divers\xa0":"Commentaires divers"},inplace = True)
+    return df
 
-    df.drop(columns =["Adresse de messagerie", "Nom", "Nom de la personne en charge de la vérification", "Commentaires ( N° de colis...)", "Commentaires", "Commentaires divers", "Type de véhicule", "Immatriculation" ],inplace=True)
 
+def stage_derive(df):
+    """Étape "derive" : convertit les dates et calcule le jour et le créneau d'une demi-heure."""
     df["Heure de début"] = pd.to_datetime(df["Heure de début"])
     df["Heure de fin"] = pd.to_datetime(df["Heure de fin"])
     df["Date"] = pd.to_datetime(df["Date"])
 
-    df["jour"] = df["Heure de début"].dt.day_name(locale='fr_FR')
+    # Jour de la semaine et créneau d'une demi-heure (HH:MM:SS), sans dépendre de la locale
+    temporal = derive_temporal_features(df["Heure de début"])
+    df["jour"] = temporal["jour"]
+    df["heure_arrondie"] = temporal["heure_arrondie"]
+    return df
 
-    df["heure_arrondie"] = df["Heure de début"].apply(arrondir_demi_heure).dt.time
+
+def stage_rename(df):
+    """Étape "rename" : supprime les colonnes inutiles et renomme vers le schéma de la table SQL."""
+    df.drop(columns=["Matière dangereuse"],inplace=True)
+    df.rename(columns={"ANOMALIE DE CHARGEMENT\xa0":"ANOMALIE DE CHARGEMENT"},inplace = True)
+    df.rename(columns={"Commentaires divers\xa0":"Commentaires divers"},inplace = True)
+
+    df.drop(columns =["Adresse de messagerie", "Nom", "Nom de la personne en charge de la vérification", "Commentaires ( N° de colis...)", "Commentaires", "Commentaires divers", "Type de véhicule", "Immatriculation" ],inplace=True)
 
     df = rename_columns(df)
 
@@ -256,9 +365,117 @@ def preprocessing(df):
     return df
 
 
-# Appliquer le preprocessing
-df = preprocessing(df_combined)
+# Étapes nommées du preprocessing : (nom, fonction, fonctions et paramètres dont elle dépend).
+# Le cache des étapes indexe la sortie de chaque étape sur son code et ces dépendances.
+STAGES = [
+    ("coalesce", stage_coalesce, [coalesce_agences, region_agence_columns, REGION_AGENCE_COLUMNS]),
+    ("parse", stage_parse, [parse_vehicle_info, split_tournee_pda_societe, parse_vehicle_info_cached,
+                            split_tournee_pda_societe_cached, cached_parse,
+                            IMMAT_PATTERN.pattern, TOURNEE_PATTERN.pattern, DIGITS_PATTERN.pattern]),
+    ("derive", stage_derive, [derive_temporal_features, JOURS_FR, CRENEAUX_DEMI_HEURE, MINUTES_PAR_JOUR]),
+    ("rename", stage_rename, [rename_columns]),
+]
+
+
+def preprocessing(df):
+    for name, stage, _ in STAGES:
+        with step(name, len(df)):
+            df = stage(df)
+    return df
+
+
+def export_key(classeurs=CLASSEURS, load=False, chunksize=CHUNKSIZE, cache_dir=CACHE_DIR):
+    """
+    Clé de l'étape "export", ou None tant qu'un des classeurs n'a pas été lu dans le cache.
+
+    Elle couvre la clé de la dernière étape de chaque bloc, dans l'ordre des classeurs,
+    et les paramètres de sortie.
+    """
+    columns = common_columns(classeurs)
+    final_keys = []
+    for path, options, is_surete in classeurs:
+        key = read_key(path, chunksize, options)
+        if not is_read_cached(key, cache_dir):
+            return None
+        for i in range(read_chunk_count(key, cache_dir)):
+            base = chunk_key(key, i, is_surete, columns, rename_dict, align_chunk)
+            final_keys.append(stage_keys(base, STAGES)[-1])
+    return digest(*final_keys, OUTPUT_FILE, PARQUET_DIR, TABLE if load else None)
+
+
+def run(incremental=False, load=False, classeurs=CLASSEURS, workers=1, use_cache=True, profile=False):
+    """
+    Exécute le preprocessing complet, ou seulement sur les lignes ajoutées ou modifiées.
+
+    Chaque exécution enregistre un filigrane à côté du CSV ; en mode incrémental, les lignes
+    inchangées sont ignorées et les autres ajoutées ou remplacées dans le CSV et le jeu Parquet.
+    Avec `workers` > 1, les classeurs sont prétraités en parallèle (un classeur par processus).
+
+    Les exécutions complètes passent par le cache des étapes : une nouvelle exécution reprend
+    à la première étape modifiée, et n'écrit rien si aucune entrée ni étape n'a changé.
+
+    Avec `profile`, le temps mural, le temps CPU, le nombre de lignes et la variation de RSS
+    de chaque étape sont affichés et enregistrés dans un rapport JSON à côté du CSV (en
+    parallèle, les temps des processus de travail s'additionnent).
+    """
+    if profile:
+        start_run("preprocessing2")
+    watermark_file = watermark_path(OUTPUT_FILE)
+    with step("watermark"):
+        watermark = load_watermark(watermark_file) if incremental else empty_watermark()
+    # Sans filigrane, toutes les lignes sont nouvelles : autant tout régénérer
+    incremental = incremental and len(watermark) > 0
+    # Le mode incrémental ignore déjà les lignes inchangées : le cache sert aux exécutions complètes
+    cache_dir = CACHE_DIR if use_cache and not incremental else None
+    updates = []
+
+    if cache_dir and is_exported(export_key(classeurs, load), [OUTPUT_FILE, PARQUET_DIR, watermark_file]):
+        print(f"Fichier '{OUTPUT_FILE}' déjà à jour.")
+        finish_run(report_path(OUTPUT_FILE), output=OUTPUT_FILE, rows_written=0)
+        return
+
+    # Appliquer le preprocessing bloc par bloc et sauvegarder au fur et à mesure dans le CSV
+    chunks = iter_processed_chunks(classeurs, watermark=watermark, updates=updates, workers=workers,
+                                   cache_dir=cache_dir)
+    # Copie Parquet typée et partitionnée, écrite en même temps que le CSV
+    chunks = timed_chunks("parquet", tee_parquet(chunks, PARQUET_DIR, incremental=incremental))
+    if load:
+        # Chargement dans PostgreSQL (COPY vers une table de staging puis upsert sur 'id')
+        chunks = timed_chunks("postgres", tee_postgres(chunks, TABLE))
+    with step("csv"):
+        if incremental:
+            total = upsert_csv_chunks(chunks, OUTPUT_FILE, key="id", index=False, date_format="%Y-%m-%d %H:%M:%S")
+        else:
+            total = write_csv_chunks(chunks, OUTPUT_FILE, index=False, date_format="%Y-%m-%d %H:%M:%S")
+    add_rows("csv", total)
+    with step("watermark"):
+        save_watermark(watermark_file, watermark, updates)
+    flush_parse_caches()
+    if cache_dir:
+        mark_exported(export_key(classeurs, load))
+        # Les anciennes versions des classeurs et des étapes ne sont plus relues : cache borné à CACHE_MAX_BYTES
+        prune_cache(cache_dir)
+    print(f"Fichier '{OUTPUT_FILE}' généré avec succès ({total} lignes écrites).")
+    finish_run(report_path(OUTPUT_FILE), output=OUTPUT_FILE, rows_written=total)
+
 
-# Sauvegarder le DataFrame dans un CSV
-df.to_csv("verif_concordance2.csv", index=False, date_format="%Y-%m-%d %H:%M:%S")
-print("Fichier 'verif_concordance2.csv' généré avec succès.")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true",
+                        help="ne traiter que les lignes ajoutées ou modifiées depuis la dernière exécution")
+    parser.add_argument("--load", action="store_true",
+                        help=f"charger les lignes traitées dans la table {TABLE}")
+    parser.add_argument("--inputs", nargs="+", metavar="CHEMIN",
+                        help="répertoires ou motifs glob de classeurs à traiter (par défaut les deux classeurs de référence)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="nombre de processus pour prétraiter les classeurs en parallèle")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recalculer toutes les étapes sans utiliser le cache des étapes")
+    parser.add_argument("--profile", action="store_true",
+                        help="mesurer chaque étape et écrire un rapport JSON à côté du CSV")
+    args = parser.parse_args()
+    classeurs = list_classeurs(args.inputs) if args.inputs else CLASSEURS
+    if not classeurs:
+        parser.error(f"aucun classeur trouvé pour {' '.join(args.inputs)}")
+    run(incremental=args.incremental, load=args.load, classeurs=classeurs, workers=args.workers,
+        use_cache=not args.no_cache, profile=args.profile)
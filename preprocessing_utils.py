@@ -0,0 +1,297 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Colonnes sources des agences/antennes pour chaque région.
+# Les régions absentes de ce dictionnaire sont détectées automatiquement
+# à partir des en-têtes "AGENCES/ANTENNES REGION <NOM>" du fichier Excel.
+REGION_AGENCE_COLUMNS = {
+    "REGION EST": "AGENCES/ ANTENNES REGION EST",
+    "REGION NORD": "AGENCES/ANTENNES REGION NORD",
+    "REGION OUEST": "AGENCES/ANTENNES REGION OUEST",
+    "REGION SUD": "AGENCES/ANTENNES REGION SUD",
+}
+
+AGENCE_COLUMN_PATTERN = re.compile(r'^AGENCES\s*/\s*ANTENNES\s+(REGION\s+.+?)\s*$')
+
+
+def region_agence_columns(columns, region_columns=None):
+    """
+    Construit le dictionnaire région -> colonne source des agences/antennes.
+
+    Args:
+        columns (Iterable[str]): Colonnes disponibles dans le DataFrame.
+        region_columns (dict, optional): Correspondances explicites, prioritaires
+            sur la détection automatique. Par défaut REGION_AGENCE_COLUMNS.
+
+    Returns:
+        dict: Correspondances région -> colonne, limitées aux colonnes présentes.
+    """
+    if region_columns is None:
+        region_columns = REGION_AGENCE_COLUMNS
+    columns = list(columns)
+
+    mapping = {}
+    for col in columns:
+        match = AGENCE_COLUMN_PATTERN.match(str(col))
+        if match:
+            region = re.sub(r'\s+', ' ', match.group(1))
+            mapping[region] = col
+
+    # Les correspondances explicites l'emportent sur la détection
+    for region, col in region_columns.items():
+        if col in columns:
+            mapping[region] = col
+
+    return mapping
+
+
+def coalesce_agences(df, target="agences_antennes", region_col="REGION", region_columns=None, drop_sources=True):
+    """
+    Remplit la colonne des agences/antennes à partir de la colonne propre à la région de chaque ligne.
+
+    Le calcul est entièrement colonne par colonne (np.select) : une ligne dont la région
+    n'a pas de colonne source reçoit une chaîne vide.
+
+    Args:
+        df (pd.DataFrame): DataFrame brut issu du fichier Excel.
+        target (str): Nom de la colonne à créer.
+        region_col (str): Colonne contenant la région.
+        region_columns (dict, optional): Correspondances région -> colonne source.
+        drop_sources (bool): Supprimer les colonnes sources après fusion.
+
+    Returns:
+        pd.DataFrame: DataFrame avec la colonne `target` renseignée.
+    """
+    mapping = region_agence_columns(df.columns, region_columns)
+    regions = df[region_col].to_numpy()
+
+    conditions = [regions == region for region in mapping]
+    choices = [df[col].to_numpy(dtype=object) for col in mapping.values()]
+    df[target] = np.select(conditions, choices, default="") if conditions else ""
+
+    if drop_sources:
+        df = df.drop(columns=list(mapping.values()))
+    return df
+
+
+# Expression régulière pour détecter les immatriculations (format XX-123-YY ou similaire)
+IMMAT_PATTERN = re.compile(r'[A-Z]{1,2}-?\d{2,3}-?[A-Z]{1,2}|[A-Z]{1,2}\d{2,3}[A-Z]{1,2}')
+
+
+def extract_vehicle_info(value):
+    """
+    Version ligne à ligne de parse_vehicle_info, conservée comme référence.
+
+    Returns:
+        tuple: (type de véhicule, immatriculation au format XX-123-YY).
+    """
+    if pd.isna(value):
+        return pd.NA, pd.NA
+
+    value = str(value).upper().strip()
+    immat_match = IMMAT_PATTERN.search(value.replace(" ", ""))
+
+    if immat_match:
+        immat = immat_match.group(0)
+        immat = immat.replace("-", "")
+        if len(immat) >= 5:
+            immat_standard = f"{immat[:2]}-{immat[2:-2]}-{immat[-2:]}"
+        else:
+            immat_standard = immat
+        type_vehicule = value.replace(immat_match.group(0), "").strip().replace("/", "").strip()
+        if not type_vehicule:
+            type_vehicule = "INCONNU"
+    else:
+        type_vehicule = value
+        immat_standard = pd.NA
+
+    return type_vehicule, immat_standard
+
+
+def parse_vehicle_info(values):
+    """
+    Sépare toute une colonne "Type de véhicule / immatriculation" en une seule passe.
+
+    Produit exactement les mêmes valeurs que extract_vehicle_info appliquée ligne à ligne,
+    sans construire de pd.Series par ligne.
+
+    Args:
+        values (pd.Series): Colonne brute.
+
+    Returns:
+        pd.DataFrame: Colonnes "Type de véhicule" et "Immatriculation" (dtype string).
+    """
+    result = pd.DataFrame(
+        {"Type de véhicule": pd.NA, "Immatriculation": pd.NA},
+        index=values.index, dtype="string"
+    )
+    present = values.notna()
+    if not present.any():
+        return result
+
+    text = values[present].astype(str).str.upper().str.strip().astype("string")
+    found = text.str.replace(" ", "", regex=False).str.extract(f"({IMMAT_PATTERN.pattern})", expand=False)
+    matched = found.notna()
+
+    # Immatriculation standardisée : XX-<chiffres>-YY dès 5 caractères
+    immat = found.str.replace("-", "", regex=False)
+    standard = immat.str[:2] + "-" + immat.str[2:-2] + "-" + immat.str[-2:]
+    immat = immat.mask(immat.str.len().ge(5).fillna(False), standard)
+
+    # Type de véhicule : la valeur sans l'immatriculation trouvée, sinon la valeur entière
+    stripped = pd.Series(
+        [v.replace(m, "") for v, m in zip(text[matched].tolist(), found[matched].tolist())],
+        index=text.index[matched], dtype="string"
+    )
+    cleaned = stripped.str.strip().str.replace("/", "", regex=False).str.strip()
+    cleaned = cleaned.mask(cleaned == "", "INCONNU")
+    type_vehicule = text.mask(matched, cleaned)
+
+    result.loc[present, "Type de véhicule"] = type_vehicule
+    result.loc[present, "Immatriculation"] = immat
+    return result
+
+
+# Tournée : séquence de chiffres ; PDA : une seule lettre juste après la tournée
+# (éventuellement séparée par un espace ou "/") ; société : tout ce qui suit
+TOURNEE_PATTERN = re.compile(r'^(\d+)(?:[\s/]*([A-Z]))?(?:[\s/]*(.*))?$')
+DIGITS_PATTERN = re.compile(r'^\d+$')
+
+
+def extract_tournee_pda_societe(value):
+    """
+    Version ligne à ligne de split_tournee_pda_societe, conservée comme référence.
+
+    Returns:
+        tuple: (tournée, PDA, nom de la société).
+    """
+    if pd.isna(value):
+        return pd.NA, pd.NA, pd.NA
+
+    value = str(value).upper().strip()
+    match = TOURNEE_PATTERN.match(value.replace("/", " ").strip())
+
+    tournee = pd.NA
+    pda = pd.NA
+    societe = pd.NA
+
+    if match:
+        tournee = match.group(1)
+        pda = match.group(2) if match.group(2) else pd.NA
+        societe = match.group(3) if match.group(3) else pd.NA
+    else:
+        if DIGITS_PATTERN.match(value):
+            tournee = value
+        else:
+            societe = value
+
+    if pd.notna(societe):
+        societe = re.sub(r'\s+', ' ', societe.strip())
+        if not societe:
+            societe = pd.NA
+
+    return tournee, pda, societe
+
+
+def split_tournee_pda_societe(values):
+    """
+    Sépare toute une colonne "Tournée / PDA / Nom de la société" en une seule passe.
+
+    Mêmes règles que extract_tournee_pda_societe : une valeur qui ne commence pas par
+    un numéro de tournée est une tournée si elle n'est faite que de chiffres, une société sinon.
+
+    Args:
+        values (pd.Series): Colonne brute.
+
+    Returns:
+        pd.DataFrame: Colonnes "tournee", "pda" et "nom_de_la_societe" (dtype string).
+    """
+    result = pd.DataFrame(
+        {"tournee": pd.NA, "pda": pd.NA, "nom_de_la_societe": pd.NA},
+        index=values.index, dtype="string"
+    )
+    present = values.notna()
+    if not present.any():
+        return result
+
+    text = values[present].astype(str).str.upper().str.strip().astype("string")
+    parts = text.str.replace("/", " ", regex=False).str.strip().str.extract(TOURNEE_PATTERN)
+    matched = parts[0].notna()
+
+    # Sans numéro de tournée en tête : tout chiffres -> tournée, sinon -> société
+    digits = text.str.match(DIGITS_PATTERN).fillna(False)
+    tournee = parts[0].mask(~matched & digits, text)
+    societe = parts[2].mask(~matched & ~digits, text)
+
+    societe = societe.str.strip().str.replace(r'\s+', ' ', regex=True)
+    societe = societe.mask(societe == "")
+
+    result.loc[present, "tournee"] = tournee
+    result.loc[present, "pda"] = parts[1]
+    result.loc[present, "nom_de_la_societe"] = societe
+    return result
+
+
+# Noms des jours en français (lundi = 0), identiques à dt.day_name(locale='fr_FR')
+JOURS_FR = ("Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche")
+
+# Libellés HH:MM:SS des 48 créneaux d'une demi-heure (créneau 0 = 00:00:00)
+CRENEAUX_DEMI_HEURE = tuple(f"{h:02d}:{m:02d}:00" for h in range(24) for m in (0, 30))
+
+MINUTES_PAR_JOUR = 24 * 60
+
+
+def arrondir_demi_heure(dt):
+    """
+    Version ligne à ligne de derive_temporal_features, conservée comme référence.
+    """
+    minute = dt.minute
+    if minute < 15:
+        minute = 0
+    elif minute < 45:
+        minute = 30
+    else:
+        dt += pd.Timedelta(hours=1)
+        minute = 0
+    return dt.replace(minute=minute, second=0, microsecond=0)
+
+
+def derive_temporal_features(timestamps):
+    """
+    Calcule le créneau d'une demi-heure et le jour de la semaine de chaque horodatage.
+
+    Arrondi identique à arrondir_demi_heure (< 15 -> :00, < 45 -> :30, sinon heure suivante),
+    calculé par arithmétique sur les minutes depuis l'epoch : aucune dépendance à la locale fr_FR.
+
+    Args:
+        timestamps (pd.Series): Horodatages (datetime64), NaT autorisés.
+
+    Returns:
+        pd.DataFrame: Colonnes "heure_arrondie" (HH:MM:SS), "jour" (nom français),
+            "creneau" (0-47) et "jour_code" (0 = lundi, 6 = dimanche).
+    """
+    timestamps = pd.to_datetime(timestamps, errors="coerce")
+    missing = timestamps.isna().to_numpy()
+
+    minutes = timestamps.to_numpy(dtype="datetime64[ns]").astype("datetime64[m]").astype(np.int64)
+    minutes[missing] = 0
+    minute = minutes % 60
+    arrondi = minutes - minute + np.select([minute < 15, minute < 45], [0, 30], default=60)
+
+    creneau = (arrondi % MINUTES_PAR_JOUR) // 30
+    # Le 1er janvier 1970 était un jeudi
+    jour_code = (minutes // MINUTES_PAR_JOUR + 3) % 7
+
+    heure_arrondie = np.array(CRENEAUX_DEMI_HEURE, dtype=object)[creneau]
+    jour = np.array(JOURS_FR, dtype=object)[jour_code]
+    heure_arrondie[missing] = np.nan
+    jour[missing] = np.nan
+
+    return pd.DataFrame({
+        "heure_arrondie": heure_arrondie,
+        "jour": jour,
+        "creneau": pd.arrays.IntegerArray(creneau.astype(np.int8), missing),
+        "jour_code": pd.arrays.IntegerArray(jour_code.astype(np.int8), missing),
+    }, index=timestamps.index)
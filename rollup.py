@@ -0,0 +1,154 @@
+import argparse
+
+from psycopg2 import sql
+
+from dashboard_data import ANOMALIE_SQL, DERIVED_DIMENSIONS, METRICS, ROLLUP_KEYS, rollup_table
+
+# Table temporaire des dates touchées par un chargement, à recalculer dans le rollup
+ROLLUP_DATES = "rollup_dates"
+# Clés du rollup propres à certaines tables de contrôles (sûreté : table du chargement seulement)
+OPTIONAL_KEYS = {"is_surete"}
+# Colonne source de chaque dimension calculée de ROLLUP_KEYS
+DERIVED_SOURCES = {"heure": "heure_de_debut"}
+
+
+def has_rollup(cur, table):
+    """Indique si la table pré-agrégée de `table` existe (migration 002 ou create_rollup)."""
+    cur.execute("SELECT to_regclass(%s)", (rollup_table(table),))
+    return cur.fetchone()[0] is not None
+
+
+def rollup_keys(cur, table):
+    """Colonnes clés du rollup de `table`, dans l'ordre de la table."""
+    cur.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(rollup_table(table))))
+    return [column.name for column in cur.description if column.name not in METRICS]
+
+
+def create_rollup(cur, table, columns):
+    """
+    Crée et remplit la table pré-agrégée de `table` si elle n'existe pas encore, comme la
+    migration 002 : clés ROLLUP_KEYS, comptes METRICS, index sur la date du rollup et de la table.
+
+    Une table sans toutes les colonnes sources des clés (hors OPTIONAL_KEYS) n'a pas de rollup.
+
+    Args:
+        cur: Curseur psycopg2.
+        table (str): Table des contrôles.
+        columns (Sequence[str]): Colonnes de `table`.
+
+    Returns:
+        bool: True si le rollup a été créé.
+    """
+    keys = [key for key in ROLLUP_KEYS if DERIVED_SOURCES.get(key, key) in columns]
+    if has_rollup(cur, table) or set(ROLLUP_KEYS) - OPTIONAL_KEYS - set(keys) or "anomalie" not in columns:
+        return False
+    expressions = [
+        sql.SQL("{} AS {}").format(sql.SQL(DERIVED_DIMENSIONS[key]), sql.Identifier(key))
+        if key in DERIVED_DIMENSIONS else sql.Identifier(key)
+        for key in keys
+    ]
+    rollup = rollup_table(table)
+    # Mêmes noms d'index que la migration 002 (idx_concordance_..., idx_chargement_...)
+    prefix = f"idx_{table.rsplit('_', 1)[-1]}"
+    cur.execute(
+        sql.SQL(
+            "CREATE TABLE {rollup} AS SELECT {expressions}, count(*) AS nb_controles, "
+            "count(*) FILTER (WHERE {anomalie}) AS nb_anomalies FROM {table} GROUP BY {groups} WITH NO DATA"
+        ).format(
+            rollup=sql.Identifier(rollup),
+            expressions=sql.SQL(", ").join(expressions),
+            anomalie=sql.SQL(ANOMALIE_SQL),
+            table=sql.Identifier(table),
+            groups=sql.SQL(", ").join(sql.Literal(i + 1) for i in range(len(keys))),
+        )
+    )
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (date)").format(
+        sql.Identifier(f"{prefix}_rollup_date"), sql.Identifier(rollup)
+    ))
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (date)").format(
+        sql.Identifier(f"{prefix}_date"), sql.Identifier(table)
+    ))
+    refresh_rollup(cur, table)
+    return True
+
+
+def mark_rollup_dates(cur, staging, table, key="id"):
+    """
+    Relève, avant la fusion de la table de staging, les dates dont les comptes vont changer :
+    dates des lignes chargées et anciennes dates des lignes qu'elles remplacent.
+    """
+    cur.execute(
+        sql.SQL(
+            "CREATE TEMP TABLE {dates} ON COMMIT DROP AS "
+            "SELECT date FROM {staging} UNION SELECT t.date FROM {table} t JOIN {staging} s USING ({key})"
+        ).format(
+            dates=sql.Identifier(ROLLUP_DATES), staging=sql.Identifier(staging),
+            table=sql.Identifier(table), key=sql.Identifier(key),
+        )
+    )
+
+
+def refresh_rollup(cur, table, dates=None):
+    """
+    Recalcule les comptes du rollup de `table` depuis les lignes de contrôle.
+
+    Args:
+        cur: Curseur psycopg2, dans la transaction du chargement.
+        table (str): Table des contrôles.
+        dates (str, optional): Table des dates à recalculer (mark_rollup_dates) ; None
+            reconstruit tout le rollup.
+
+    Returns:
+        int: Nombre de lignes écrites dans le rollup.
+    """
+    keys = rollup_keys(cur, table)
+    expressions = [
+        sql.SQL(DERIVED_DIMENSIONS[key]) if key in DERIVED_DIMENSIONS else sql.Identifier(key) for key in keys
+    ]
+    if dates is None:
+        condition = sql.SQL("true")
+    else:
+        # Les NULL ne sont pas égaux entre eux : la date manquante est traitée à part
+        condition = sql.SQL(
+            "(date IN (SELECT date FROM {dates}) "
+            "OR (date IS NULL AND EXISTS (SELECT 1 FROM {dates} WHERE date IS NULL)))"
+        ).format(dates=sql.Identifier(dates))
+
+    rollup = sql.Identifier(rollup_table(table))
+    cur.execute(sql.SQL("DELETE FROM {} WHERE {}").format(rollup, condition))
+    cur.execute(
+        sql.SQL(
+            "INSERT INTO {rollup} ({keys}, nb_controles, nb_anomalies) "
+            "SELECT {expressions}, count(*), count(*) FILTER (WHERE {anomalie}) "
+            "FROM {table} WHERE {condition} GROUP BY {groups}"
+        ).format(
+            rollup=rollup,
+            keys=sql.SQL(", ").join(map(sql.Identifier, keys)),
+            expressions=sql.SQL(", ").join(expressions),
+            anomalie=sql.SQL(ANOMALIE_SQL),
+            table=sql.Identifier(table),
+            condition=condition,
+            groups=sql.SQL(", ").join(sql.Literal(i + 1) for i in range(len(keys))),
+        )
+    )
+    return cur.rowcount
+
+
+if __name__ == "__main__":
+    from pg_loader import bump_version, connect
+
+    # À lancer après toute écriture dans la table des contrôles hors de pg_loader (SQL à la main, autre outil) :
+    # les dashboards lisent le rollup sans pouvoir détecter qu'il est en retard sur la table
+    parser = argparse.ArgumentParser(description="Reconstruit entièrement la table pré-agrégée d'une table de contrôles.")
+    parser.add_argument("table", help="table des contrôles, par exemple db_verification_concordance")
+    parser.add_argument("--dsn", help="chaîne de connexion (par défaut DATABASE_URL ou .streamlit/secrets.toml)")
+    args = parser.parse_args()
+    conn = connect(args.dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            rows = refresh_rollup(cur, args.table)
+            # Les dashboards recalculent leurs sections sur le rollup reconstruit
+            bump_version(cur, args.table)
+        print(f"{rows} lignes écrites dans {rollup_table(args.table)}")
+    finally:
+        conn.close()
@@ -0,0 +1,87 @@
+import collections
+import sys
+import threading
+
+import pandas as pd
+from plotly.basedatatypes import BaseFigure
+
+from charts import payload
+
+# Mémoire maximale occupée par les sections en cache, au-delà de laquelle les moins récemment vues sont retirées
+SECTIONS_CACHE_BYTES = 64 * 2**20
+
+
+def new_cache(max_bytes=SECTIONS_CACHE_BYTES):
+    """Cache LRU vide, borné à `max_bytes` octets, avec ses compteurs de succès et d'échecs."""
+    return {
+        "entries": collections.OrderedDict(),
+        "bytes": 0,
+        "max_bytes": max_bytes,
+        "hits": 0,
+        "misses": 0,
+        "lock": threading.Lock(),
+    }
+
+
+def size_of(value):
+    """Taille estimée d'une valeur en cache : DataFrame, figure Plotly (JSON envoyé au navigateur) ou conteneur."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, BaseFigure):
+        return payload(value)[0]
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def cached(cache, key, build):
+    """
+    Valeur de `key` dans le cache, calculée par `build()` en cas d'absence.
+
+    La valeur calculée est ajoutée en tête du cache ; les entrées les moins récemment lues
+    sont retirées tant que le total dépasse la borne. Une valeur plus grande que la borne
+    n'est pas gardée. Les valeurs en cache sont partagées : elles ne doivent pas être modifiées.
+
+    Args:
+        cache (dict): Résultat de new_cache.
+        key (Hashable): Clé normalisée (section, filtres, version des données...).
+        build (Callable): Calcul de la valeur.
+
+    Returns:
+        La valeur en cache ou calculée.
+    """
+    with cache["lock"]:
+        if key in cache["entries"]:
+            cache["entries"].move_to_end(key)
+            cache["hits"] += 1
+            return cache["entries"][key][0]
+        cache["misses"] += 1
+
+    value = build()
+    size = size_of(value)
+    if size > cache["max_bytes"]:
+        return value
+    with cache["lock"]:
+        if key not in cache["entries"]:
+            cache["entries"][key] = (value, size)
+            cache["bytes"] += size
+        while cache["bytes"] > cache["max_bytes"]:
+            _, (_, evicted) = cache["entries"].popitem(last=False)
+            cache["bytes"] -= evicted
+    return value
+
+
+def cache_stats(cache):
+    """Compteurs du cache : succès, échecs, taux de succès, entrées et octets occupés."""
+    lookups = cache["hits"] + cache["misses"]
+    return {
+        "hits": cache["hits"],
+        "misses": cache["misses"],
+        "hit_rate": cache["hits"] / lookups if lookups else 0.0,
+        "entries": len(cache["entries"]),
+        "bytes": cache["bytes"],
+    }
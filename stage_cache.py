@@ -0,0 +1,251 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import ingestion
+from instrumentation import step
+
+# Répertoire du cache des étapes du preprocessing (une entrée par clé de contenu)
+CACHE_DIR = ".stage_cache"
+# Taille maximale du cache : au-delà, prune_cache retire les entrées les moins récemment utilisées
+CACHE_MAX_BYTES = 4 * 2**30
+# Versions des bibliothèques qui produisent et relisent les entrées (pickles, règles de conversion) :
+# une mise à jour de pandas ou numpy change toutes les clés
+LIBRARY_VERSIONS = (pd.__version__, np.__version__)
+
+
+def digest(*parts):
+    """
+    Empreinte SHA-256 d'une suite d'éléments : texte, octets, fonctions ou valeurs de configuration.
+
+    Une fonction est représentée par son code source : modifier une règle change l'empreinte
+    des étapes qui en dépendent. Les autres valeurs (dictionnaires, listes...) par leur repr.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if callable(part):
+            part = inspect.getsource(part)
+        if not isinstance(part, bytes):
+            part = repr(part).encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(path, size, mtime_ns, blocksize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """Empreinte SHA-256 du contenu d'un fichier, calculée une fois par version du fichier."""
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def read_key(path, chunksize=ingestion.CHUNKSIZE, options=None):
+    """Clé de l'étape "read" : contenu du classeur, options de lecture et code du lecteur."""
+    return digest(
+        "read", file_digest(path), chunksize, options or {}, LIBRARY_VERSIONS,
+        ingestion.iter_excel_chunks, ingestion._iter_rows, ingestion._header_names
+    )
+
+
+def chunk_key(read_key, index, *config):
+    """Clé d'entrée des étapes d'un bloc : bloc brut n° `index` et configuration éventuelle."""
+    return digest(read_key, index, *config)
+
+
+def _entry(cache_dir, name, key):
+    return os.path.join(cache_dir, name, f"{key}.pkl")
+
+
+def _store(path, df):
+    """Écrit une entrée du cache via un fichier temporaire : une entrée n'est jamais à moitié écrite."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    df.to_pickle(tmp)
+    os.replace(tmp, path)
+
+
+def cached_read(key, read_chunks, cache_dir=CACHE_DIR):
+    """
+    Étape "read" : blocs bruts d'un classeur, relus depuis le cache si la clé est connue.
+
+    Au premier passage, les blocs produits par `read_chunks()` sont écrits un à un dans le
+    cache (la mémoire reste bornée par la taille d'un bloc) ; le manifeste qui les liste est
+    écrit en dernier, si bien qu'une lecture interrompue n'est jamais réutilisée.
+
+    Args:
+        key (str): Empreinte du classeur et des options de lecture.
+        read_chunks (Callable): Fonction sans argument qui produit les blocs du classeur.
+        cache_dir (str): Répertoire du cache.
+
+    Yields:
+        pd.DataFrame: Blocs successifs du classeur.
+    """
+    manifest = os.path.join(cache_dir, "read", f"{key}.json")
+    if os.path.exists(manifest):
+        os.utime(manifest)
+        with open(manifest) as f:
+            for path in json.load(f):
+                yield pd.read_pickle(os.path.join(cache_dir, "read", path))
+        return
+
+    paths = []
+    for i, chunk in enumerate(read_chunks()):
+        path = f"{key}-{i:05d}.pkl"
+        _store(os.path.join(cache_dir, "read", path), chunk)
+        paths.append(path)
+        yield chunk
+
+    tmp = f"{manifest}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(paths, f)
+    os.replace(tmp, manifest)
+
+
+def is_read_cached(key, cache_dir=CACHE_DIR):
+    """Indique si les blocs bruts correspondant à `key` sont déjà dans le cache."""
+    return os.path.exists(os.path.join(cache_dir, "read", f"{key}.json"))
+
+
+def read_chunk_count(key, cache_dir=CACHE_DIR):
+    """Nombre de blocs bruts enregistrés pour `key` (le manifeste doit exister)."""
+    with open(os.path.join(cache_dir, "read", f"{key}.json")) as f:
+        return len(json.load(f))
+
+
+def stage_keys(base_key, stages):
+    """
+    Clés successives des étapes d'un bloc.
+
+    La clé d'une étape dépend de celle de l'étape précédente, de son nom, de son code, de
+    sa configuration et des versions de pandas et numpy : modifier une étape change sa clé et
+    celles de toutes les suivantes.
+
+    Args:
+        base_key (str): Empreinte de l'entrée de la première étape.
+        stages (list): Étapes (nom, fonction DataFrame -> DataFrame, dépendances).
+
+    Returns:
+        list: Une clé par étape.
+    """
+    keys = []
+    key = base_key
+    for name, func, deps in stages:
+        key = digest(key, name, func, LIBRARY_VERSIONS, *deps)
+        keys.append(key)
+    return keys
+
+
+def run_stages(base_key, load, stages, cache_dir=CACHE_DIR):
+    """
+    Exécute les étapes d'un bloc en reprenant à la première étape modifiée.
+
+    La dernière étape dont la sortie est en cache est relue, les suivantes sont recalculées
+    et enregistrées ; `load()` n'est appelée que si aucune étape n'est en cache.
+
+    Args:
+        base_key (str): Empreinte de l'entrée de la première étape.
+        load (Callable): Fonction sans argument qui renvoie l'entrée de la première étape.
+        stages (list): Étapes (nom, fonction DataFrame -> DataFrame, dépendances).
+        cache_dir (str): Répertoire du cache.
+
+    Returns:
+        tuple: (sortie de la dernière étape, clé de la dernière étape).
+    """
+    keys = stage_keys(base_key, stages)
+    start = 0
+    for i in reversed(range(len(stages))):
+        if os.path.exists(_entry(cache_dir, stages[i][0], keys[i])):
+            start = i + 1
+            break
+
+    if start:
+        with step("stage_cache"):
+            path = _entry(cache_dir, stages[start - 1][0], keys[start - 1])
+            df = pd.read_pickle(path)
+            os.utime(path)
+    else:
+        df = load()
+    for (name, func, _), key in zip(stages[start:], keys[start:]):
+        with step(name, len(df)):
+            df = func(df)
+        with step("stage_cache"):
+            _store(_entry(cache_dir, name, key), df)
+    return df, keys[-1]
+
+
+def is_exported(key, outputs, cache_dir=CACHE_DIR):
+    """
+    Étape "export" : indique si les sorties ont déjà été écrites pour `key` et existent encore.
+
+    Une clé None (entrées pas encore en cache) n'est jamais à jour.
+    """
+    if key is None:
+        return False
+    marker = os.path.join(cache_dir, "export", key)
+    return os.path.exists(marker) and all(os.path.exists(output) for output in outputs)
+
+
+def mark_exported(key, cache_dir=CACHE_DIR):
+    """Enregistre que les sorties correspondant à `key` ont été écrites."""
+    os.makedirs(os.path.join(cache_dir, "export"), exist_ok=True)
+    with open(os.path.join(cache_dir, "export", key), "w"):
+        pass
+
+
+def prune_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Borne la taille du cache : retire les entrées les moins récemment écrites ou relues
+    jusqu'à ce que le total tienne dans `max_bytes`.
+
+    Une entrée est une sortie d'étape, ou la lecture d'un classeur (manifeste et ses blocs,
+    retirés ensemble, manifeste en premier). Les anciennes versions d'un classeur ou d'une
+    étape, qui ne sont plus relues, partent donc en premier.
+
+    Returns:
+        int: Nombre d'octets libérés.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = []
+    read_dir = os.path.join(cache_dir, "read")
+    for name in os.listdir(cache_dir):
+        directory = os.path.join(cache_dir, name)
+        if name == "export" or not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if directory == read_dir:
+                if not filename.endswith(".json"):
+                    continue
+                with open(path) as f:
+                    paths = [path] + [os.path.join(read_dir, chunk) for chunk in json.load(f)]
+            elif filename.endswith(".pkl"):
+                paths = [path]
+            else:
+                continue
+            size = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+            entries.append((os.path.getmtime(path), size, paths))
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, paths in sorted(entries, key=lambda entry: entry[0]):
+        if total - freed <= max_bytes:
+            break
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        freed += size
+    return freed
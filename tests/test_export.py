@@ -0,0 +1,42 @@
+import pandas as pd
+import pyarrow.dataset as ds
+
+from export import upsert_parquet
+
+
+def _rows(ids, dates, regions):
+    return pd.DataFrame({
+        "id": [str(i) for i in ids],
+        "date": dates,
+        "region": regions,
+        "agences_antennes": ["EST-A"] * len(ids),
+    })
+
+
+def _read(root):
+    table = ds.dataset(root, format="parquet", partitioning="hive").to_table()
+    return table.to_pandas().astype({"annee_mois": object, "region": object})
+
+
+def test_upsert_moves_row_to_its_new_partition(tmp_path):
+    root = str(tmp_path / "parquet")
+    upsert_parquet(_rows([1, 2, 3], ["2024-01-05", "2024-01-20", "2024-02-03"], ["IDF", "IDF", "NORD"]), root)
+
+    # La ligne 1 change de mois et de région, la ligne 3 (seule de sa partition) change de mois
+    upsert_parquet(_rows([1, 3, 4], ["2024-03-01", "2024-03-02", "2024-03-03"], ["NORD", "NORD", "IDF"]), root)
+
+    df = _read(root).sort_values("id").reset_index(drop=True)
+    assert df["id"].tolist() == [1, 2, 3, 4]
+    assert df["annee_mois"].tolist() == ["2024-03", "2024-01", "2024-03", "2024-03"]
+    assert df["region"].tolist() == ["NORD", "IDF", "NORD", "IDF"]
+    # L'ancienne partition de la ligne 3, vidée, ne garde aucun fichier
+    assert not list((tmp_path / "parquet").glob("annee_mois=2024-02/*/*.parquet"))
+
+
+def test_upsert_keeps_untouched_partitions(tmp_path):
+    root = str(tmp_path / "parquet")
+    upsert_parquet(_rows([1, 2], ["2024-01-05", "2024-02-05"], ["IDF", "IDF"]), root)
+    upsert_parquet(_rows([3], ["2024-01-06"], ["IDF"]), root)
+
+    df = _read(root).sort_values("id")
+    assert df["id"].tolist() == [1, 2, 3]
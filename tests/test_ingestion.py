@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from ingestion import empty_watermark, load_watermark, save_watermark, split_delta, upsert_csv_chunks
+
+
+def _chunks(ids, values, chunksize=2):
+    """Blocs bruts comme iter_excel_chunks : index = position de la ligne dans le classeur."""
+    sheet = pd.DataFrame({"Id": ids, "valeur": values}, dtype=object)
+    return [sheet.iloc[start:start + chunksize] for start in range(0, len(sheet), chunksize)]
+
+
+def _ingest(path, chunks, source=0):
+    """Une exécution incrémentale : lignes produites, id attribués aux nouvelles, filigrane enregistré."""
+    watermark = load_watermark(path)
+    next_id = int(watermark["id"].max()) + 1 if len(watermark) else 1
+    seen_ids, updates, deltas = set(), [], []
+    for chunk in chunks:
+        delta, update = split_delta(chunk, watermark, source, seen_ids)
+        new = update["id"].to_numpy() < 0
+        update.loc[new, "id"] = range(next_id, next_id + new.sum())
+        next_id += int(new.sum())
+        updates.append(update)
+        deltas.append(delta.assign(id=update["id"].to_numpy()))
+    save_watermark(path, watermark, updates)
+    return pd.concat(deltas)
+
+
+def test_unchanged_rows_are_skipped(tmp_path):
+    path = str(tmp_path / "sortie.csv.watermark.npz")
+    first = _ingest(path, _chunks([10, 11, 12], ["a", "b", "c"]))
+    assert first["id"].tolist() == [1, 2, 3]
+    assert _ingest(path, _chunks([10, 11, 12], ["a", "b", "c"])).empty
+
+    # Ligne insérée en tête et ligne 11 modifiée : les autres lignes gardent leur clé d'id
+    delta = _ingest(path, _chunks([9, 10, 11, 12], ["z", "a", "B", "c"]))
+    assert delta["Id"].tolist() == [9, 11]
+    assert delta["id"].tolist() == [4, 2]
+
+
+def test_id_repeated_across_chunks_keeps_distinct_keys(tmp_path):
+    path = str(tmp_path / "sortie.csv.watermark.npz")
+    # Id 1 répété dans deux blocs différents
+    first = _ingest(path, _chunks([1, 2, 1], ["a", "b", "c"]))
+    assert first["id"].tolist() == [1, 2, 3]
+    assert len(load_watermark(path)) == 3
+    # Aucune des deux lignes n'est reproduite ni ne prend l'id de l'autre aux exécutions suivantes
+    assert _ingest(path, _chunks([1, 2, 1], ["a", "b", "c"])).empty
+    delta = _ingest(path, _chunks([1, 2, 1], ["a", "b", "C"]))
+    assert delta["id"].tolist() == [3]
+
+
+def test_watermark_of_another_format_is_ignored(tmp_path):
+    path = str(tmp_path / "sortie.csv.watermark.npz")
+    # Filigrane sans version (clés classeur/position) : la prochaine exécution est complète
+    np.savez(path, key=np.array([0, 1]), fingerprint=np.array([1, 2], dtype=np.uint64), id=np.array([1, 2]))
+    assert load_watermark(path).equals(empty_watermark())
+
+
+def test_upsert_csv_chunks_replaces_and_appends(tmp_path):
+    path = str(tmp_path / "sortie.csv")
+    upsert_csv_chunks([pd.DataFrame({"id": [1, 2, 3], "valeur": ["a", "b", "c"]})], path, index=False)
+    total = upsert_csv_chunks(
+        [pd.DataFrame({"id": [2], "valeur": ["B"]}), pd.DataFrame({"id": [4], "valeur": ["d"]})], path, index=False
+    )
+    df = pd.read_csv(path).sort_values("id")
+    assert total == 2
+    assert df["id"].tolist() == [1, 2, 3, 4]
+    assert df["valeur"].tolist() == ["a", "B", "c", "d"]
@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+import pytest
+
+from dashboard_data import version_query
+from pg_loader import connect, tee_postgres
+
+# Base de test jetable : les tests y créent et suppriment leur table, et tee_postgres y applique les migrations
+DSN = os.environ.get("TEST_DATABASE_URL")
+TABLE = "test_pg_loader"
+
+pytestmark = pytest.mark.skipif(not DSN, reason="TEST_DATABASE_URL non défini")
+
+
+@pytest.fixture
+def conn():
+    conn = connect(DSN)
+    with conn, conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cur.execute(f"CREATE TABLE {TABLE} (id bigint PRIMARY KEY, date date, anomalie text)")
+    yield conn
+    with conn, conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cur.execute("DELETE FROM data_versions WHERE table_name = %s", (TABLE,))
+    conn.close()
+
+
+def _chunk(ids, anomalies):
+    return pd.DataFrame({"id": ids, "date": "2024-01-05", "anomalie": anomalies}, dtype=str)
+
+
+def _load(chunks):
+    return list(tee_postgres(iter(chunks), TABLE, DSN))
+
+
+def _rows(conn):
+    with conn, conn.cursor() as cur:
+        cur.execute(f"SELECT id, anomalie FROM {TABLE} ORDER BY id")
+        return cur.fetchall()
+
+
+def _version(conn):
+    with conn, conn.cursor() as cur:
+        cur.execute(version_query(TABLE))
+        return cur.fetchone()[0]
+
+
+def test_upsert_on_id(conn):
+    _load([_chunk(["1", "2"], ["NON", "NON"])])
+    _load([_chunk(["2", "3"], ["OUI", "NON"])])
+    assert _rows(conn) == [(1, "NON"), (2, "OUI"), (3, "NON")]
+    assert _version(conn) == 2
+
+
+def test_duplicate_id_keeps_last_occurrence(conn):
+    # Id 1 répété dans un même bloc puis dans le bloc suivant : la dernière occurrence l'emporte
+    _load([_chunk(["1", "2", "1"], ["A", "B", "C"]), _chunk(["1"], ["D"])])
+    assert _rows(conn) == [(1, "D"), (2, "B")]
+
+
+def test_interrupted_stream_is_rolled_back(conn):
+    _load([_chunk(["1"], ["NON"])])
+
+    def chunks():
+        yield _chunk(["1", "2"], ["OUI", "OUI"])
+        raise RuntimeError("lecture interrompue")
+
+    with pytest.raises(RuntimeError):
+        _load(chunks())
+    assert _rows(conn) == [(1, "NON")]
+    assert _version(conn) == 1
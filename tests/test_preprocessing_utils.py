@@ -0,0 +1,96 @@
+import locale
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing_utils import (
+    arrondir_demi_heure, derive_temporal_features, extract_tournee_pda_societe, extract_vehicle_info,
+    parse_vehicle_info, split_tournee_pda_societe
+)
+
+
+def _sample(fixed, alphabet, size=5000, max_length=12, seed=0):
+    """Échantillon de référence : cas choisis, puis chaînes aléatoires (graine fixe) sur `alphabet`."""
+    rng = random.Random(seed)
+    randoms = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length))) for _ in range(size)]
+    return pd.Series(fixed + randoms, dtype=object)
+
+
+def _rows(df):
+    """Lignes d'un DataFrame en listes, valeurs manquantes ramenées à None."""
+    return [[None if pd.isna(value) else value for value in row] for row in df.itertuples(index=False)]
+
+
+def _reference(function, values, columns):
+    return pd.DataFrame([function(value) for value in values], columns=columns, index=values.index)
+
+
+VEHICULES = [
+    None, np.nan, "", " ", "fourgon AB-123-CD", "ab123cd", "VL / AB 123 CD", "camion", "AB-12-C", "A1B",
+    "porteur ab-123-cd / xy-456-zz", "12AB34", 123, 12.5, "AB-123-CD", "  ab - 123 - cd  ", "PL/AB123CD/",
+    "x AB 12 CD y", "ÉTÉ", "A-12-B", "AB12345CD", "ab 12 c d",
+]
+
+
+def test_parse_vehicle_info_matches_reference():
+    values = _sample(VEHICULES, "AB 12-/Cé3x")
+    columns = ["Type de véhicule", "Immatriculation"]
+    assert _rows(parse_vehicle_info(values)) == _rows(_reference(extract_vehicle_info, values, columns))
+
+
+def test_parse_vehicle_info_every_row_has_a_plate():
+    # Toutes les lignes du bloc portent une immatriculation
+    values = pd.Series(["VL / AB-123-CD", "PL AB123CD", "XY-456-ZZ"], index=[10, 11, 12], dtype=object)
+    columns = ["Type de véhicule", "Immatriculation"]
+    result = parse_vehicle_info(values)
+    assert _rows(result) == _rows(_reference(extract_vehicle_info, values, columns))
+    assert result["Type de véhicule"].tolist() == ["VL", "PL", "INCONNU"]
+
+
+TOURNEES = [
+    None, np.nan, "", " ", "123", "123 A", "123/A/SOCIETE X", "SOCIETE", "12 b  foo   bar", "12/", "A12",
+    45, 45.0, "12 AB", "12  ", "12\n\tA", "0042 / b / Transports  Dupont ",
+]
+
+
+def test_split_tournee_pda_societe_matches_reference():
+    values = _sample(TOURNEES, "12 /ABé\t", max_length=10)
+    columns = ["tournee", "pda", "nom_de_la_societe"]
+    assert _rows(split_tournee_pda_societe(values)) == _rows(_reference(extract_tournee_pda_societe, values, columns))
+
+
+def _horodatages(size=5000, seed=0):
+    """Horodatages de référence : bornes des arrondis, passage à minuit et au Nouvel An, NaT, puis tirages aléatoires."""
+    fixed = pd.to_datetime([
+        "2024-01-01 08:14:59", "2024-01-01 08:15:00", "2024-01-01 08:44:59", "2024-01-01 08:45:00",
+        "2024-02-29 23:45:00", "2023-12-31 23:59:59", "1969-12-31 23:50:00", "2024-03-31 02:30:00", None,
+    ])
+    rng = np.random.default_rng(seed)
+    randoms = pd.to_datetime(rng.integers(0, 2_000_000_000, size), unit="s")
+    return pd.Series(fixed.append(randoms))
+
+
+def test_derive_temporal_features_matches_reference():
+    timestamps = _horodatages()
+    result = derive_temporal_features(timestamps)
+    present = timestamps.notna()
+
+    arrondis = timestamps[present].apply(arrondir_demi_heure).dt.strftime("%H:%M:%S")
+    assert result.loc[present, "heure_arrondie"].tolist() == arrondis.tolist()
+    # Jour de l'horodatage d'origine (pas de l'arrondi), comme day_name() dans le preprocessing d'origine
+    anglais = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    francais = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+    jours = timestamps[present].dt.day_name().map(dict(zip(anglais, francais)))
+    assert result.loc[present, "jour"].tolist() == jours.tolist()
+    assert result.loc[~present, ["heure_arrondie", "jour"]].isna().all(axis=None)
+
+
+def test_derive_temporal_features_matches_locale_weekday():
+    timestamps = _horodatages(size=500).dropna()
+    try:
+        jours = timestamps.dt.day_name(locale="fr_FR")
+    except locale.Error:
+        pytest.skip("locale fr_FR absente")
+    assert derive_temporal_features(timestamps)["jour"].tolist() == jours.tolist()